@@ -60,7 +60,8 @@ for project_name, project_config in projects.items():
     for cmake_gen in cmake_gens:
         conf = {
             "project": project_name,
-            "cmake_gen": cmake_gen
+            "cmake_gen": cmake_gen,
+            "shards": project_config.get("shards", 1)
         }
 
         gen_conf = GENERATOR_TO_CONFIG.get(cmake_gen)
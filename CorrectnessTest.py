@@ -1,3 +1,4 @@
+import dataclasses
 import datetime
 import json
 import shutil
@@ -5,14 +6,25 @@ import subprocess
 import sys
 import time
 import traceback
-import xml.etree.ElementTree as ET
 import git
+import math
 import os
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from subprocess import Popen, PIPE
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Iterator, Dict
 
 import common
 import util.error_parser
+import util.file_traffic
+import util.issue_digest
+import util.log_profile
+import util.report_merge
+import util.report_parser
+import util.trace_inspector
+from util.memory_ceiling import MemoryLimiter, find_memory_ceiling
+from util.process_output import InspectionProgress, OutputCapture
+from util.resource_sampler import ResourceSampler, is_sampling_supported
+from util.scheduler import Resources, ResourceScheduler, ScheduledTask, total_physical_memory_gb
 
 
 def print_errors(title, errors):
@@ -33,22 +45,17 @@ def is_flaky(error: dict) -> bool:
     return error.get("flaky", False)
 
 
-def check_report(report_file, known_errors, known_file_errors) -> Tuple[str, dict]:
+def check_report(report_file, known_errors, known_file_errors, digest_path: Optional[str] = None) -> Tuple[str, dict]:
     def get_error_id(error):
         return error["file"], int(error["line"]), error["message"]
 
     results: List[str] = []
     error_mismatch = False
 
-    xml_doc = ET.parse(report_file)
-    issue_severities = {issue_type.get("Id"): issue_type.get("Severity")
-                        for issue_type in xml_doc.getroot().findall("IssueTypes")[0]}
-
-    def get_severity(issue) -> str:
-        return issue.get("Severity") or issue_severities[issue.get("TypeId")]
-
-    issue_nodes = xml_doc.getroot().findall("Issues")[0]
-    if len(issue_nodes) == 0:
+    # Reports with INFO issues are huge, so only errors are kept in memory, the digest of all issues is spilled to disk
+    digest_builder = util.issue_digest.DigestBuilder() if digest_path else None
+    parsed_report = util.report_parser.parse_report(report_file, tally=True, on_issue=digest_builder.add_issue if digest_builder else None)
+    if parsed_report.projects_count == 0:
         print("No compilation errors found")
 
         known_stable_errors = [get_error_id(error) for error in known_errors if not is_flaky(error)]
@@ -63,9 +70,7 @@ def check_report(report_file, known_errors, known_file_errors) -> Tuple[str, dic
             results.append(f"no compilation errors found, but {len(known_stable_errors)} file errors were expected")
             error_mismatch = True
     else:
-        actual_errors = set((issue.get("File"), int(issue.get("Line", "0")), issue.get("Message"))
-                            for issue in issue_nodes.iter("Issue")
-                            if get_severity(issue) == 'ERROR')
+        actual_errors = set(parsed_report.errors)
         if known_file_errors:
             known_error_files = set(error["file"] for error in known_file_errors)
             actual_error_files = set(error[0] for error in actual_errors)
@@ -105,27 +110,72 @@ def check_report(report_file, known_errors, known_file_errors) -> Tuple[str, dic
             results.append(f"unexpected {len(actual_errors)} errors found")
             error_mismatch = True
 
-    return "\n".join(results), {
-        'tool_version': xml_doc.getroot().attrib['ToolsVersion'],
+    report = {
+        'tool_version': parsed_report.tool_version,
+        'severity_counts': dict(parsed_report.severity_counts),
         'error_mismatch': error_mismatch
     }
 
+    if digest_builder:
+        new_digest_path = digest_path + ".new"
+        digest_builder.write(new_digest_path, parsed_report.tool_version)
+        if os.path.exists(digest_path) and util.issue_digest.read_digest_version(digest_path) == util.issue_digest.DIGEST_VERSION:
+            # Churn of all severities since the previous run in the same directory, both digests are streamed
+            issue_churn = util.issue_digest.churn_summary(util.issue_digest.iter_digest(digest_path), util.issue_digest.iter_digest(new_digest_path))
+            for severity, counts in issue_churn.items():
+                print(f"[check_report] {severity} issues since the previous run: +{counts['added']} -{counts['removed']}", flush=True)
+            report['issue_churn'] = issue_churn
+        os.replace(new_digest_path, digest_path)
 
-def run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64: bool, snapshot_path: str = None):
-    args, report_file, err_file = common.inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_props)
-    args.insert(0, env.inspect_code_path_x64 if use_x64 else env.inspect_code_path_x86)
+    return "\n".join(results), report
 
-    if snapshot_path:
+
+def print_output_tail(title: str, capture: OutputCapture, log_path: str):
+    print(f'::group::{title}')
+    if capture.truncated:
+        print(f"[run_inspect_code] {title} (last lines of {capture.line_count}, full output in {log_path}):\n...\n{capture.tail}")
+    else:
+        print(f"[run_inspect_code] {title}:\n{capture.tail}")
+    print('::endgroup::', flush=True)
+
+
+def run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64: bool, snapshot_path: str = None, caches_home: str = None,
+                     expected_files_count: Optional[int] = None, preexec_fn=None, extra_env: Optional[dict] = None, suffix: str = "",
+                     cpu_profile_path: Optional[str] = None):
+    inspect_code_args, report_file, err_file = common.inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_props, caches_home, suffix)
+    inspect_code_args.insert(0, env.inspect_code_path_x64 if use_x64 else env.inspect_code_path_x86)
+
+    # Sampler suspensions would distort GC pauses of the memory snapshot
+    assert not (snapshot_path and cpu_profile_path), "CPU profile must be collected in a separate run"
+    if snapshot_path or cpu_profile_path:
         # TODO: support for x86 somehow?
         assert use_x64, "dotnet-trace doesn't work with x86 inspect code tool"
 
         dotnet_args = ["dotnet", "exec", "--runtimeconfig", env.inspect_code_runtime_config_path]
-        args = dotnet_args + args
+        inspect_code_args = dotnet_args + inspect_code_args
 
-    print('[run_inspect_code]', subprocess.list2cmdline(args), flush=True)
-    process = Popen(args, stdout=PIPE, stderr=PIPE, text=True, encoding='cp1251')
+    print('[run_inspect_code]', subprocess.list2cmdline(inspect_code_args), flush=True)
+    process_env = os.environ | extra_env if extra_env else None
+    process = Popen(inspect_code_args, stdout=PIPE, stderr=PIPE, text=True, encoding='cp1251', preexec_fn=preexec_fn, env=process_env)
     start = time.time()
 
+    # Output of big projects is huge, so it's streamed to disk instead of being kept in memory
+    progress = InspectionProgress(expected_files_count)
+    stdout_path = os.path.join(project_dir, f"resharper-stdout{suffix}.log")
+    stderr_path = os.path.join(project_dir, f"resharper-stderr{suffix}.log")
+    stdout_capture = OutputCapture(process.stdout, stdout_path, on_line=progress.on_line)
+    stderr_capture = OutputCapture(process.stderr, stderr_path)
+
+    sampler = None
+    if args.sample_interval > 0:
+        if is_sampling_supported():
+            sampler = ResourceSampler(args.sample_interval)
+        else:
+            print("[run_inspect_code] Resource usage isn't sampled: psutil is required on this platform", flush=True)
+    if sampler:
+        sampler.attach("inspectcode", process.pid)
+        sampler.start()
+
     if snapshot_path:
         time.sleep(1)
         inspect_code_pid = process.pid
@@ -138,77 +188,305 @@ def run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use
 
         profiler_process = Popen(profiler_args)
         print(f"[run_inspect_code] Running profiler for pid={inspect_code_pid}..", flush=True)
+        if sampler:
+            sampler.attach("dotnet-trace", profiler_process.pid)
+
+    if cpu_profile_path:
+        time.sleep(1)
+        cpu_profiler_args = ["dotnet-trace",
+                             "collect",
+                             "--profile", "cpu-sampling",
+                             "--output", cpu_profile_path,
+                             "--process-id", str(process.pid),
+                             ]
+
+        cpu_profiler_process = Popen(cpu_profiler_args)
+        print(f"[run_inspect_code] Running CPU profiler for pid={process.pid}..", flush=True)
+        if sampler:
+            sampler.attach("dotnet-trace (cpu)", cpu_profiler_process.pid)
 
     while True:
         try:
-            out, err = process.communicate(timeout=60)
+            exit_code = process.wait(timeout=60)
             break
         except subprocess.TimeoutExpired:
-            print(f"[run_inspect_code] Still running.. elapsed time: {common.duration(start, time.time())}", flush=True)
+            print(f"[run_inspect_code] Still running.. elapsed time: {common.duration(start, time.time())}, {progress.describe()}", flush=True)
             pass
 
-    exit_code = process.wait()
+    stdout_capture.join()
+    stderr_capture.join()
     end = time.time()
     if exit_code != 0:
         print(f"[run_inspect_code] Error: exit code = {exit_code}", flush=True)
 
-    if err:
-        max_displayed_len = 1_000_000
-        print('::group::stderr')
-        if len(err) > max_displayed_len:
-            print(f"[run_inspect_code] stderr:\n{err[:max_displayed_len]}...\n...\n...(too big: {len(err)} bytes)")
-        else:
-            print(f"[run_inspect_code] stderr:\n{err}")
-        print('::endgroup::', flush=True)
+    if stderr_capture.line_count:
+        print_output_tail("stderr", stderr_capture, stderr_path)
 
-    print('::group::stdout')
-    print(f"[run_inspect_code] stdout:\n{out}")
-    print('::endgroup::', flush=True)
+    print_output_tail("stdout", stdout_capture, stdout_path)
 
     if snapshot_path:
         profiler_process.wait()
 
+    if cpu_profile_path:
+        cpu_profiler_process.wait()
+
+    resources = {}
+    if sampler:
+        resources = sampler.stop()
+        sampler.write_timeline(os.path.join(project_dir, f"resharper-resources{suffix}.jsonl"))
+        for name, stats in resources.items():
+            print(f"[run_inspect_code] {name}: peak RSS = {stats['peak_rss_mb']:.1f} MB, "
+                  f"cpu time = {stats['cpu_user_time'] + stats['cpu_system_time']:.1f}s, "
+                  f"max threads = {stats['max_threads']}", flush=True)
+
     if os.path.exists(err_file):
         print(f"[run_inspect_code] Non-empty errors log", flush=True)
     else:
         print(f"[run_inspect_code] No runtime errors", flush=True)
 
+    # Time of every `Inspecting` line, to attribute time and memory to files
+    with open(os.path.join(project_dir, f"resharper-timeline{suffix}.json"), 'w') as f_timeline:
+        json.dump(progress.timeline, f_timeline)
+
+    log_file = os.path.join(project_dir, f"resharper-logs{suffix}.log")
+    profile = util.log_profile.profile_log_file(log_file, progress.timeline, end, args.profile_top)
+
+    if profile:
+        print('::group::profile')
+        print(util.log_profile.format_profile(profile))
+        print('::endgroup::', flush=True)
+
     print("[run_inspect_code] Elapsed time: " + common.duration(start, end), flush=True)
-    return report_file, err_file, out
+    return report_file, err_file, progress.inspected_count, resources, profile
+
+
+# Files written by `run_inspect_code` into the project directory
+RUN_OUTPUT_FILES = ["resharper-report{suffix}.xml", "resharper-logs{suffix}.log", "resharper-logs{suffix}.err.log",
+                    "resharper-stdout{suffix}.log", "resharper-stderr{suffix}.log", "resharper-timeline{suffix}.json",
+                    "resharper-resources{suffix}.jsonl"]
+
+
+def remove_run_outputs(project_dir, suffix: str):
+    for file_name in RUN_OUTPUT_FILES:
+        file_path = os.path.join(project_dir, file_name.format(suffix=suffix))
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def run_inspect_code_sharded(project_dir, sln_file, project_to_check, msbuild_props, use_x64: bool, caches_home: Optional[str], shard_count: int,
+                             expected_files_count: Optional[int] = None):
+    shards = util.report_merge.split_into_shards(
+        util.report_merge.select_projects(util.report_merge.parse_solution_projects(sln_file), project_to_check), shard_count)
+    if len(shards) <= 1:
+        return run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64, None, caches_home, expected_files_count)
+
+    print(f"[run_inspect_code] Running {len(shards)} shards: {[len(shard) for shard in shards]} projects", flush=True)
+    caches_home = caches_home or env.caches_home
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        # Every shard has its own caches, inspectcode doesn't support concurrent access to them
+        futures = [executor.submit(run_inspect_code, project_dir, sln_file, shard, msbuild_props, use_x64, None,
+                                   os.path.join(caches_home, f"shard-{index}"), None, None, None, f"-shard-{index}")
+                   for index, shard in enumerate(shards)]
+        outcomes = [future.result() for future in futures]
+
+    _, report_file, err_file = common.inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_props)
+    util.report_merge.merge_reports([outcome[0] for outcome in outcomes], report_file)
+
+    # Runtime errors of all shards are checked together, as if they were reported by a single run
+    shard_err_files = [outcome[1] for outcome in outcomes if os.path.exists(outcome[1])]
+    if shard_err_files:
+        with open(err_file, 'wb') as f_err:
+            for shard_err_file in shard_err_files:
+                with open(shard_err_file, 'rb') as f_shard:
+                    shutil.copyfileobj(f_shard, f_err)
+
+    # Shards have disjoint sets of projects, so every file is inspected by one of them
+    files_count = sum(outcome[2] for outcome in outcomes)
+    resources = {f"{name} (shard {index})": stats for index, outcome in enumerate(outcomes) for name, stats in outcome[3].items()}
+    profile = {'shards': [outcome[4] for outcome in outcomes]}
+    return report_file, err_file, files_count, resources, profile
+
+
+def search_memory_ceiling(project_dir, sln_file, project_to_check, msbuild_props, use_x64: bool, caches_home: Optional[str],
+                          expected_files_count: int, peak_rss_mb: Optional[float]) -> Optional[int]:
+    limiter = MemoryLimiter(args.memory_cgroup)
+    max_mb = args.memory_ceiling_max or (math.ceil(peak_rss_mb * 2) if peak_rss_mb else 32 * 1024)
+
+    def probe(limit_mb: int) -> bool:
+        print(f"[memory_ceiling] Running with memory limit {limit_mb} MB ({limiter.method})..", flush=True)
+        # Probes have their own output files, so that they don't overwrite the results of the checked run
+        suffix = f"-limit-{limit_mb}"
+        try:
+            with limiter.limit(limit_mb) as (preexec_fn, limit_env):
+                _, _, files_count, _, _ = run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64, None, caches_home,
+                                                           expected_files_count, preexec_fn, limit_env, suffix)
+        finally:
+            remove_run_outputs(project_dir, suffix)
+        succeeded = files_count == expected_files_count
+        print(f"[memory_ceiling] {limit_mb} MB: {'passed' if succeeded else f'failed, {files_count} of {expected_files_count} files inspected'}", flush=True)
+        return succeeded
+
+    ceiling, probes = find_memory_ceiling(probe, args.memory_ceiling_min, max_mb, args.memory_ceiling_precision)
+    if ceiling is None:
+        print(f"[memory_ceiling] Inspection fails even with {max_mb} MB", flush=True)
+    else:
+        print(f"[memory_ceiling] Peak memory requirement is {ceiling} MB (found in {len(probes)} runs)", flush=True)
+    return ceiling
+
+
+def get_memory_breakdown(memory_stats: dict) -> dict:
+    mb = 1 << 20
+    return {
+        'soh': memory_stats["SmallObjectHeapAmount"] / mb,
+        'loh': memory_stats["LargeObjectHeapAmount"] / mb,
+        'poh': memory_stats["PinnedObjectHeapAmount"] / mb,
+        'top_types': [{'type': t["TypeName"], 'traffic': t["Amount"] / mb} for t in memory_stats["TopTypes"]],
+        'top_stacks': [{'frames': s["Frames"], 'traffic': s["Amount"] / mb} for s in memory_stats["TopStacks"]],
+    }
 
 
-def check_project(project, project_dir, sln_file, branch: Optional[str]) -> Tuple[str, dict]:
+def get_gc_stats(memory_stats: dict) -> dict:
+    return {
+        'gen0': memory_stats["Gen0Collections"],
+        'gen1': memory_stats["Gen1Collections"],
+        'gen2': memory_stats["Gen2Collections"],
+        'induced': memory_stats["InducedCollections"],
+        'total_pause': memory_stats["TotalPauseMSec"],
+        'max_pause': memory_stats["MaxPauseMSec"],
+        'peak_heap': memory_stats["PeakHeapSize"] / (1 << 20),
+    }
+
+
+def print_gc_stats(gc_stats: dict):
+    print(f"[check_project] GC: {gc_stats['gen0']} gen0, {gc_stats['gen1']} gen1, {gc_stats['gen2']} gen2 collections "
+          f"({gc_stats['induced']} induced), total pause {gc_stats['total_pause']:0.1f} ms, max pause {gc_stats['max_pause']:0.1f} ms, "
+          f"peak heap {gc_stats['peak_heap']:0.1f} MB", flush=True)
+
+
+def compare_with_baseline(title: str, actual: float, expected: float, tolerance: float, unit: str) -> bool:
+    relative_delta = (actual - expected) / expected * 100
+    print(f"[check_project] expected {title} is {expected:0.1f} {unit}, "
+          f"actual {title} is {actual:0.1f} {unit}; "
+          f"delta = {relative_delta:.2f}%", flush=True)
+    return abs(relative_delta) < tolerance
+
+
+# Config key, key of GC stats, unit and default tolerance in percents. GC timings are noisy, so tolerances are wide.
+GC_BASELINES = [
+    ("gc pause", 'total_pause', "ms", 20.0),
+    ("peak heap", 'peak_heap', "MB", 10.0),
+]
+
+
+def check_gc_stats(gc_stats: dict, local_config: dict) -> bool:
+    """
+    Compares GC stats with optional baselines of the config, e.g. "gc pause": 1500 and "gc pause tolerance": 25
+    """
+    within_tolerance = True
+    for key, stats_key, unit, default_tolerance in GC_BASELINES:
+        expected = local_config.get(key)
+        if expected:
+            tolerance = local_config.get(f"{key} tolerance", default_tolerance)
+            within_tolerance &= compare_with_baseline(key, gc_stats[stats_key], expected, tolerance, unit)
+    return within_tolerance
+
+
+def print_memory_contributors(memory_breakdown: dict, count: int = 10):
+    print(f"[check_project] traffic by heap: SOH {memory_breakdown['soh']:0.1f} MB, "
+          f"LOH {memory_breakdown['loh']:0.1f} MB, POH {memory_breakdown['poh']:0.1f} MB", flush=True)
+    print('::group::Top allocated types')
+    for t in memory_breakdown['top_types'][:count]:
+        print(f"  {t['traffic']:10.1f} MB  {t['type']}")
+    print('::endgroup::')
+    print('::group::Top allocating stacks')
+    for s in memory_breakdown['top_stacks'][:count]:
+        print(f"  {s['traffic']:10.1f} MB")
+        for frame in s['frames'][:8]:
+            print(f"      {frame}")
+    print('::endgroup::', flush=True)
+
+
+def print_file_traffic_increases(by_absolute: List[util.file_traffic.FileTrafficChange], by_relative: List[util.file_traffic.FileTrafficChange]):
+    for title, changes in (("Largest traffic increase by file", by_absolute), ("Largest relative traffic increase by file", by_relative)):
+        print(f'::group::{title}')
+        for change in changes:
+            print(f"  {change.delta:+10.1f} MB  {change.relative_delta:+8.1f}%  ({change.old:0.1f} -> {change.new:0.1f} MB)  {change.file}")
+        print('::endgroup::', flush=True)
+
+
+def check_project(project, project_dir, sln_file, branch: Optional[str], run_name: str, caches_home: Optional[str] = None) -> Tuple[str, dict]:
     project_to_check = project.get("project to check")
     msbuild_props = project.get("msbuild properties")
     use_x86 = env.is_x86 and project.get("only x64", False) is False
     use_x64 = not use_x86
-    trace_memory = use_x64
     local_config = project["latest"][branch] if branch else project["stable"]
+    shard_count = args.shards or project.get("shards", 1)
+    # Memory traffic of several processes isn't comparable with the baseline of a single one
+    trace_memory = use_x64 and shard_count <= 1
 
+    # Every run has its own snapshot directory, so that concurrently checked projects don't clash
+    snapshot_dir = os.path.join(env.snapshots_home, run_name)
     if trace_memory:
-        os.makedirs(env.snapshots_home, exist_ok=True)
-        snapshot_path = os.path.join(env.snapshots_home, 'snapshot.dtt')
+        os.makedirs(snapshot_dir, exist_ok=True)
+        snapshot_path = os.path.join(snapshot_dir, 'snapshot.dtt')
     else:
         snapshot_path = None
 
+    if args.cpu_profile and trace_memory:
+        cpu_profile_path = os.path.join(snapshot_dir, 'cpu-profile.nettrace')
+    else:
+        if args.cpu_profile:
+            print(f"[check_project] CPU profile is skipped: it's supported for x64 runs without shards only "
+                  f"(x64: {use_x64}, shards: {shard_count})", flush=True)
+        cpu_profile_path = None
+
+    expected_files_count = local_config.get("inspected files count")
+
     start_date = datetime.datetime.utcnow()
     start_time = time.time()
-    report_file, err_file, output = run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64, snapshot_path)
+    if shard_count > 1:
+        report_file, err_file, actual_files_count, resources, profile = run_inspect_code_sharded(project_dir, sln_file, project_to_check, msbuild_props, use_x64, caches_home,
+                                                                                                 shard_count, expected_files_count)
+    else:
+        report_file, err_file, actual_files_count, resources, profile = run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64, snapshot_path, caches_home,
+                                                                                         expected_files_count)
     end_time = time.time()
 
-    if trace_memory:
-        with common.cwd(env.trace_inspector_dir):
-            inspector_args = ["dotnet", "run", snapshot_path]
-            print("[check_project] Running trace inspector:", subprocess.list2cmdline(inspector_args), flush=True)
-            memory_stats_json = subprocess.check_output(inspector_args)
-            memory_stats = json.loads(memory_stats_json)
+    if cpu_profile_path:
+        # Sampling slows inspection down and suspends threads, so it has its own run,
+        # which doesn't affect elapsed time and GC stats of the checked run
+        print("[check_project] Running inspectcode again to collect CPU profile..", flush=True)
+        suffix = "-cpu-profile"
+        try:
+            run_inspect_code(project_dir, sln_file, project_to_check, msbuild_props, use_x64, None, caches_home, expected_files_count,
+                             suffix=suffix, cpu_profile_path=cpu_profile_path)
+        finally:
+            remove_run_outputs(project_dir, suffix)
 
-            actual_traffic = memory_stats["AllocationAmount"] / (1 << 20)
+    if trace_memory:
+        timeline_path = os.path.join(project_dir, "resharper-timeline.json")
+        memory_stats = util.trace_inspector.inspect_snapshots(env.trace_inspector_dir, env.trace_inspector_cache_dir, [snapshot_path],
+                                                              args.memory_top, timelines={snapshot_path: timeline_path})[snapshot_path]
+        actual_traffic = memory_stats["AllocationAmount"] / (1 << 20)
+        memory_breakdown = get_memory_breakdown(memory_stats)
+        gc_stats = get_gc_stats(memory_stats)
+        file_traffic = util.file_traffic.get_file_traffic(memory_stats)
     else:
         actual_traffic = None
+        memory_breakdown = None
+        gc_stats = None
+        file_traffic = None
+
+    if cpu_profile_path:
+        cpu_stats = util.trace_inspector.profile_cpu(env.trace_inspector_dir, env.trace_inspector_cache_dir, [cpu_profile_path],
+                                                     args.profile_top)[cpu_profile_path]
+        cpu_profile = util.trace_inspector.get_cpu_profile(cpu_stats)
+        print('::group::CPU profile')
+        print(util.trace_inspector.format_cpu_profile(cpu_profile))
+        print('::endgroup::', flush=True)
+    else:
+        cpu_profile = None
 
-    expected_files_count = local_config.get("inspected files count")
-    actual_files_count = common.inspected_files_count(output)
     if expected_files_count:
         if expected_files_count != actual_files_count:
             print(f"[check_project] expected count of inspected files is {expected_files_count}, but actual is {actual_files_count}", flush=True)
@@ -217,18 +495,45 @@ def check_project(project, project_dir, sln_file, branch: Optional[str]) -> Tupl
 
     if actual_traffic is not None:
         expected_traffic = local_config.get("mem traffic")
+        within_tolerance = True
         if expected_traffic:
-            relative_delta = (actual_traffic - expected_traffic) / expected_traffic * 100
-            if abs(relative_delta) < (3.0 if expected_traffic < 1000 else 0.5):
-                shutil.rmtree(env.snapshots_home)
-
-            print(f"[check_project] expected traffic is {expected_traffic:0.1f} MB, "
-                  f"actual traffic is {actual_traffic:0.1f} MB; "
-                  f"delta = {relative_delta:.2f}%", flush=True)
+            within_tolerance = compare_with_baseline("traffic", actual_traffic, expected_traffic, 3.0 if expected_traffic < 1000 else 0.5, "MB")
+            if not within_tolerance:
+                # Allocation stacks are expensive to collect, so they are needed only to investigate the regression
+                memory_stats = util.trace_inspector.inspect_snapshots(env.trace_inspector_dir, env.trace_inspector_cache_dir, [snapshot_path],
+                                                                      args.memory_top, stacks=True)[snapshot_path]
+                memory_breakdown = get_memory_breakdown(memory_stats)
+                print_memory_contributors(memory_breakdown)
         else:
             print(f"[check_project] traffic is {actual_traffic:0.1f} MB", flush=True)
 
-    result, report = check_report(report_file, local_config.get("known errors", []), local_config.get("known file errors", []))
+        print_gc_stats(gc_stats)
+        # GC baselines don't depend on the traffic baseline, a project may have only some of them
+        if check_gc_stats(gc_stats, local_config) and within_tolerance:
+            # The last snapshot within baselines is what a regressed one is compared with
+            good_snapshot_dir = util.trace_inspector.keep_good_snapshot(snapshot_dir, env.snapshots_home)
+            print(f"[check_project] snapshot is kept as the good one in {good_snapshot_dir}", flush=True)
+        elif os.path.isdir(util.trace_inspector.get_good_snapshot_dir(env.snapshots_home, run_name)):
+            print(f"[check_project] snapshot is kept, compare it with the last good one: "
+                  f"python -m util.trace_inspector diff {snapshot_path}", flush=True)
+        else:
+            print(f"[check_project] snapshot is kept in {snapshot_path}, there is no good one of {run_name} to compare it with yet", flush=True)
+
+    file_traffic_increases = None
+    if file_traffic:
+        file_traffic_path = os.path.join(os.path.dirname(report_file), util.file_traffic.FILE_TRAFFIC_FILE_NAME)
+        previous_file_traffic = util.file_traffic.load_file_traffic(file_traffic_path)
+        if previous_file_traffic:
+            by_absolute, by_relative = util.file_traffic.largest_increases(previous_file_traffic, file_traffic, args.memory_top)
+            print_file_traffic_increases(by_absolute, by_relative)
+            file_traffic_increases = {
+                'absolute': [change.to_json() for change in by_absolute],
+                'relative': [change.to_json() for change in by_relative],
+            }
+        util.file_traffic.write_file_traffic(file_traffic_path, file_traffic)
+
+    digest_path = os.path.join(os.path.dirname(report_file), util.issue_digest.DIGEST_FILE_NAME)
+    result, report = check_report(report_file, local_config.get("known errors", []), local_config.get("known file errors", []), digest_path)
     report |= {
         'project': project_to_check,
         'timestamp': start_date.timestamp(),
@@ -238,36 +543,124 @@ def check_project(project, project_dir, sln_file, branch: Optional[str]) -> Tupl
         'expected_files_count': expected_files_count,
     }
 
+    if shard_count > 1:
+        report['shards'] = shard_count
+
     if actual_traffic:
         report['memory_traffic'] = actual_traffic
+        report['memory_breakdown'] = memory_breakdown
+        report['gc_stats'] = gc_stats
+
+    if file_traffic_increases:
+        report['file_traffic_increases'] = file_traffic_increases
+
+    if resources:
+        report['resources'] = resources
+
+    if cpu_profile:
+        report['cpu_profile'] = cpu_profile
+
+    if profile:
+        report['profile'] = profile
+
+    if args.memory_ceiling_search:
+        if not sys.platform.startswith('linux'):
+            print("[check_project] memory ceiling search is supported on Linux only", flush=True)
+        else:
+            peak_rss_mb = resources.get("inspectcode", {}).get("peak_rss_mb")
+            report['peak_memory_requirement'] = search_memory_ceiling(project_dir, sln_file, project_to_check, msbuild_props, use_x64, caches_home,
+                                                                      expected_files_count or actual_files_count, peak_rss_mb)
 
     if os.path.exists(err_file):
-        with open(err_file, encoding='cp1251') as f:
-            runtime_errors = util.error_parser.parse_logs(f.read())
+        error_groups = util.error_parser.group_errors(util.error_parser.parse_log_file(err_file))
+        runtime_errors_count = sum(group.count for group in error_groups)
 
-        print(f"[check_project] found {len(runtime_errors)} runtime error(s):", flush=True)
-        if runtime_errors:
-            for error in runtime_errors:
-                analyzer_short_name = error.analyzer.split(".")[-1]
-                print(f"[check_project]   \"{error.file_path}\" {analyzer_short_name} => {error.message}", flush=True)
+        print(f"[check_project] found {runtime_errors_count} runtime error(s) in {len(error_groups)} group(s):", flush=True)
+        if error_groups:
+            for group in error_groups:
+                analyzer_short_names = ", ".join(analyzer.split(".")[-1] for analyzer in group.analyzers)
+                print(f"[check_project]   \"{group.file_path}\" {group.message} ({group.count}x: {analyzer_short_names})", flush=True)
 
-            result = f'({len(runtime_errors)} errors in logs) {result}'.rstrip()
+            report['runtime_errors'] = [dataclasses.asdict(group) for group in error_groups]
+            result = f'({runtime_errors_count} errors in logs) {result}'.rstrip()
 
     return result, report
 
 
-def process_project_with_cmake_generator(project, project_name, cmake_generator: str, branch: Optional[str]) -> Tuple[str, dict]:
-    project_dir, sln_file = common.prepare_project(project_name, project, cmake_generator, branch)
+def get_report_key(project_name: str, branch: Optional[str]) -> str:
+    return f"{project_name}:{branch}" if branch else project_name
+
+
+def get_run_name(project_name: str, branch: Optional[str], cmake_generator: Optional[str]) -> str:
+    run_name = f"{project_name}-{branch or 'stable'}-{cmake_generator or 'default'}"
+    return run_name.replace('/', '_').replace('\\', '_')
+
+
+# Solution directory and .sln path prepared for every toolchain (`None` for projects with custom build tool)
+PreparedToolchains = Dict[Optional[str], Tuple[str, str]]
+
+
+def prepare_toolchain(project, project_name, cmake_generator: Optional[str], branch: Optional[str], prepared: Optional[PreparedToolchains],
+                      sources_ready: bool = False) -> Tuple[str, str]:
+    if prepared is not None:
+        return prepared[cmake_generator]
+    return common.prepare_project(project_name, project, cmake_generator, branch, sources_ready)
+
+
+def process_project_with_cmake_generator(project, project_name, cmake_generator: str, branch: Optional[str], prepared: Optional[PreparedToolchains] = None,
+                                         sources_ready: bool = False, caches_home: Optional[str] = None) -> Tuple[str, dict]:
+    project_dir, sln_file = prepare_toolchain(project, project_name, cmake_generator, branch, prepared, sources_ready)
     if env.is_dry_run:
         return f'({project_name}-{cmake_generator}) dry run: {sln_file}', dict()
 
-    result, report = check_project(project, project_dir, sln_file, branch)
+    result, report = check_project(project, project_dir, sln_file, branch, get_run_name(project_name, branch, cmake_generator), caches_home)
     if result:
         result = f"({cmake_generator}) {result}"
     return result, report
 
 
-def process_project(project_name, project, branch: Optional[str]) -> Tuple[str, dict]:
+def process_toolchains_concurrently(project, project_name, toolchains: List[str], branch: Optional[str], prepared: Optional[PreparedToolchains]) -> Tuple[str, dict]:
+    jobs = min(args.parallel_toolchains, len(toolchains))
+    print(f"[process_project] Processing up to {jobs} toolchains of {project_name} concurrently: {toolchains}", flush=True)
+
+    # Sources are shared by all toolchains, so they are fetched and fixed up once before the build directories are prepared concurrently
+    if prepared is None and not all(common.is_project_prepared(project_name, project, toolchain, branch) for toolchain in toolchains):
+        common.prepare_project_sources(project_name, project, toolchains, branch)
+
+    failures = {}
+    toolchain_reports = {}
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        # Every toolchain has its own caches, inspectcode doesn't support concurrent access to them
+        futures = {executor.submit(process_project_with_cmake_generator, project, project_name, toolchain, branch, prepared,
+                                   True, os.path.join(env.caches_home, toolchain)): toolchain
+                   for toolchain in toolchains}
+        for future in as_completed(futures):
+            toolchain = futures[future]
+            try:
+                local_result, toolchain_reports[toolchain] = future.result()
+            except Exception as e:
+                local_result = f"({toolchain}) exception: {e}"
+                toolchain_reports[toolchain] = {
+                    'error': {
+                        'exception': str(e),
+                        'error_info': traceback.format_exc()
+                    }
+                }
+
+            print(f"[process_project] Finished {project_name} with toolchain {toolchain}", flush=True)
+            if local_result:
+                failures[toolchain] = local_result
+                if args.toolchain_fail_fast:
+                    for other_future in futures:
+                        other_future.cancel()
+
+    # Keep order of toolchains independent of their completion order
+    toolchain_reports = {toolchain: toolchain_reports[toolchain] for toolchain in toolchains if toolchain in toolchain_reports}
+    result = "; ".join(failures[toolchain] for toolchain in toolchains if toolchain in failures)
+    return result, toolchain_reports
+
+
+def process_project(project_name, project, branch: Optional[str], prepared: Optional[PreparedToolchains] = None) -> Tuple[str, dict]:
     project = common.read_conf_if_needed(project)
 
     available_toolchains = common.get_compatible_toolchains(project)
@@ -275,19 +668,21 @@ def process_project(project_name, project, branch: Optional[str]) -> Tuple[str,
         return f'({project_name}) no available toolchains found', {}
 
     if "custom build tool" in project:
-        project_dir, sln_file = common.prepare_project(project_name, project, None, branch)
+        project_dir, sln_file = prepare_toolchain(project, project_name, None, branch, prepared)
         if env.is_dry_run:
             return f'({project_name}) dry run: {sln_file}', dict()
 
-        result, default_report = check_project(project, project_dir, sln_file, branch)
+        result, default_report = check_project(project, project_dir, sln_file, branch, get_run_name(project_name, branch, None))
         toolchain_reports = {
             'default': default_report
         }
+    elif args.parallel_toolchains > 1 and len(available_toolchains) > 1:
+        result, toolchain_reports = process_toolchains_concurrently(project, project_name, available_toolchains, branch, prepared)
     else:
         result = ''
         toolchain_reports = {}
         for generator in available_toolchains:
-            local_result, local_report = process_project_with_cmake_generator(project, project_name, generator, branch)
+            local_result, local_report = process_project_with_cmake_generator(project, project_name, generator, branch, prepared)
             toolchain_reports[generator] = local_report
             if local_result:
                 result = local_result
@@ -296,7 +691,7 @@ def process_project(project_name, project, branch: Optional[str]) -> Tuple[str,
     report = {'toolchains': toolchain_reports}
 
     try:
-        with git.Repo(env.get_project_dir(project_name)) as repo:
+        with git.Repo(env.get_project_dir(project_name, branch)) as repo:
             last_commit = repo.commit()
             report['repo'] = {
                 'url': repo.remote().url,
@@ -310,7 +705,137 @@ def process_project(project_name, project, branch: Optional[str]) -> Tuple[str,
     return result, report
 
 
+DEFAULT_PROJECT_RESOURCES = {
+    "cpu": 1,
+    "memory": 2
+}
+
+
+def get_project_resources(project_name: str) -> Resources:
+    project = common.read_conf_if_needed(common.projects[project_name])
+    resources = DEFAULT_PROJECT_RESOURCES | project.get("resources", {})
+    return Resources(resources["cpu"], resources["memory"])
+
+
+def prefetch_project(project_name: str, project_branch: Optional[str]) -> PreparedToolchains:
+    project = common.read_conf_if_needed(common.projects[project_name])
+
+    available_toolchains = common.get_compatible_toolchains(project)
+    if not available_toolchains:
+        return {}
+
+    toolchains = [None] if "custom build tool" in project else available_toolchains
+    prepared = {}
+    for toolchain in toolchains:
+        print(f"[prefetch] Preparing project {project_name} (branch: {project_branch}, toolchain: {toolchain})...", flush=True)
+        prepared[toolchain] = common.prepare_project(project_name, project, toolchain, project_branch)
+    return prepared
+
+
+def run_project(project_name: str, project_branch: Optional[str], prefetched: Optional[Future] = None) -> Tuple[str, dict]:
+    print(f"processing project {project_name} (branch: {project_branch})...", flush=True)
+
+    try:
+        prepared = prefetched.result() if prefetched is not None else None
+        return process_project(project_name, common.projects[project_name], project_branch, prepared)
+    except Exception as e:
+        error_info = traceback.format_exc()
+        print(error_info, flush=True)
+
+        return f"exception: {e}", {
+            'error': {
+                'exception': str(e),
+                'error_info': error_info
+            }
+        }
+
+
+def run_projects_sequentially(projects_to_run: List[Tuple[str, Optional[str]]]) -> Iterator[Tuple[str, dict]]:
+    for project_name, project_branch in projects_to_run:
+        yield run_project(project_name, project_branch)
+        print('-------------------------------------------------------', flush=True)
+
+
+def run_projects_with_prefetch(projects_to_run: List[Tuple[str, Optional[str]]]) -> Iterator[Tuple[str, dict]]:
+    prefetch_depth = args.prefetch
+    print(f"[main] Preparing up to {prefetch_depth} projects ahead of the inspected one", flush=True)
+
+    project_dirs = [env.get_project_dir(project_name, project_branch) for project_name, project_branch in projects_to_run]
+    prefetched: Dict[int, Future] = {}
+
+    with ProcessPoolExecutor(max_workers=prefetch_depth) as executor:
+        next_to_prefetch = 0
+        for index, (project_name, project_branch) in enumerate(projects_to_run):
+            while next_to_prefetch < len(projects_to_run) and next_to_prefetch <= index + prefetch_depth:
+                # Don't touch sources which are still about to be inspected, i.e. stable and latest versions of one project
+                if project_dirs[next_to_prefetch] in project_dirs[index:next_to_prefetch]:
+                    break
+
+                prefetched[next_to_prefetch] = executor.submit(prefetch_project, *projects_to_run[next_to_prefetch])
+                next_to_prefetch += 1
+
+            yield run_project(project_name, project_branch, prefetched.pop(index))
+            print('-------------------------------------------------------', flush=True)
+
+
+def run_projects_concurrently(projects_to_run: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, dict]]:
+    capacity = Resources(os.cpu_count() or 1, env.memory_budget or total_physical_memory_gb() or math.inf)
+    print(f"[main] Running up to {args.jobs} projects concurrently "
+          f"(cpu budget: {capacity.cpu}, memory budget: {capacity.memory:.1f} GB)", flush=True)
+
+    tasks = [ScheduledTask(key=get_report_key(project_name, project_branch),
+                           args=(project_name, project_branch),
+                           resources=get_project_resources(project_name),
+                           lock=env.get_project_dir(project_name, project_branch))
+             for project_name, project_branch in projects_to_run]
+
+    outcomes: List[Optional[Tuple[str, dict]]] = [None] * len(tasks)
+    scheduler = ResourceScheduler(capacity, args.jobs)
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        for finished_count, (task, future) in enumerate(scheduler.run(executor, run_project, tasks), start=1):
+            try:
+                outcomes[task.index] = future.result()
+            except Exception as e:
+                # Worker process died, e.g. because it has been killed by OOM
+                outcomes[task.index] = f"exception: {e}", {
+                    'error': {
+                        'exception': str(e),
+                        'error_info': traceback.format_exc()
+                    }
+                }
+            print(f"[main] Finished {task.key} ({finished_count}/{len(tasks)})", flush=True)
+            print('-------------------------------------------------------', flush=True)
+
+    return outcomes
+
+
 common.argparser.add_argument("--report-path", dest="report_path")
+common.argparser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1,
+                              help="Count of projects processed concurrently, limited by per-project \"resources\" budgets")
+common.argparser.add_argument("--prefetch", dest="prefetch", type=int, default=0,
+                              help="Count of projects prepared in background while the current one is inspected (only with -j 1)")
+common.argparser.add_argument("--sample-interval", dest="sample_interval", type=float, default=1.0,
+                              help="Interval (in seconds) of sampling memory and CPU usage of inspectcode, 0 to disable")
+common.argparser.add_argument("--memory-ceiling-search", action="store_true", dest="memory_ceiling_search",
+                              help="Find minimal memory limit (in MB) at which inspection still completes, Linux only")
+common.argparser.add_argument("--memory-ceiling-min", dest="memory_ceiling_min", type=int, default=512)
+common.argparser.add_argument("--memory-ceiling-max", dest="memory_ceiling_max", type=int,
+                              help="Upper bound of memory ceiling search, twice the sampled peak RSS by default")
+common.argparser.add_argument("--memory-ceiling-precision", dest="memory_ceiling_precision", type=int, default=256)
+common.argparser.add_argument("--memory-cgroup", dest="memory_cgroup",
+                              help="Delegated cgroup v2 directory to enforce memory limits with 'memory.max', RLIMIT_AS is used otherwise")
+common.argparser.add_argument("--memory-top", dest="memory_top", type=int, default=20,
+                              help="Count of the most allocated types and stacks stored in the report")
+common.argparser.add_argument("--profile-top", dest="profile_top", type=int, default=20,
+                              help="Count of the slowest phases and files stored in the profile of a run")
+common.argparser.add_argument("--cpu-profile", action="store_true", dest="cpu_profile",
+                               help="Collect a cpu-sampling trace of x64 inspectcode in an extra run and report the hottest managed methods")
+common.argparser.add_argument("--shards", dest="shards", type=int,
+                              help="Count of inspectcode processes checking disjoint sets of projects, \"shards\" of project config by default")
+common.argparser.add_argument("--parallel-toolchains", dest="parallel_toolchains", type=int, default=1,
+                              help="Count of toolchains of one project prepared and inspected concurrently")
+common.argparser.add_argument("--toolchain-fail-fast", action="store_true", dest="toolchain_fail_fast",
+                              help="With --parallel-toolchains, don't start remaining toolchains after the first failed one")
 args = common.argparser.parse_args()
 env = common.load_env(args)
 
@@ -319,31 +844,23 @@ def main():
     summary = []
     start_time = time.time()
 
-    full_report = {}
-    for project_name, project_branch in common.parse_projects(args.project):
-        print(f"processing project {project_name} (branch: {project_branch})...", flush=True)
-
-        try:
-            result, report = process_project(project_name, common.projects[project_name], project_branch)
-        except Exception as e:
-            error_info = traceback.format_exc()
-            print(error_info, flush=True)
-
-            result = f"exception: {e}"
-            report = {
-                'error': {
-                    'exception': str(e),
-                    'error_info': error_info
-                }
-            }
+    projects_to_run = list(common.parse_projects(args.project))
+    vcpkg_prepass = common.start_vcpkg_prepass(projects_to_run)
+    if args.jobs > 1:
+        outcomes = run_projects_concurrently(projects_to_run)
+    elif args.prefetch > 0:
+        outcomes = run_projects_with_prefetch(projects_to_run)
+    else:
+        outcomes = run_projects_sequentially(projects_to_run)
 
-        report_key = f"{project_name}:{project_branch}" if project_branch else project_name
-        full_report[report_key] = report
+    full_report = {}
+    for (project_name, project_branch), (result, report) in zip(projects_to_run, outcomes):
+        full_report[get_report_key(project_name, project_branch)] = report
 
         if result:
             summary.append(project_name + ": " + result)
 
-        print('-------------------------------------------------------', flush=True)
+    common.finish_vcpkg_prepass(vcpkg_prepass)
 
     # Dump report if needed
     report_path = args.report_path
@@ -1,17 +1,23 @@
 import os
+import shutil
+import stat
 import sys
+import tempfile
+import threading
+import time
 from os import path, makedirs
 from subprocess import PIPE
 import subprocess
 import xml.etree.ElementTree as ET
 import json
-import requests
-import io
+import hashlib
 from argparse import ArgumentParser
-from zipfile import ZipFile
-from typing import Optional, List
+from typing import Optional, List, Tuple, Dict
 from contextlib import contextmanager
 
+from util.download_cache import DownloadCache, EXTRACTION_STAMP, extract_zip_incrementally
+from util.locks import file_lock, is_file_locked
+
 
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -85,6 +91,14 @@ class Environment:
         self._is_ci = args.is_ci
         self._is_x86 = args.is_x86
         self._is_dry_run = args.is_dry_run
+        self._shallow_clone = args.shallow_clone or args.is_ci
+        self._clone_filter = args.clone_filter or self._get_env("clone filter")
+        self._use_worktrees = args.use_worktrees or self._get_env("use worktrees") or False
+        self._force_prepare = args.force_prepare
+        self._reconfigure = args.reconfigure
+        self._vcpkg_binary_cache_directory = args.vcpkg_binary_cache_directory or self._get_env("vcpkg binary cache")
+        self._download_cache_directory = args.download_cache_directory or self._get_env("download cache dir")
+        self._memory_budget = args.memory_budget or self._get_env("memory budget")
 
         assert self._build_directory, 'Missing build directory'
 
@@ -115,6 +129,10 @@ class Environment:
     def vcpkg_dir(self) -> Optional[str]:
         return self._vcpkg_directory
 
+    @property
+    def vcpkg_binary_cache_dir(self) -> str:
+        return self._vcpkg_binary_cache_directory or path.join(self.cli_test_dir, "vcpkg-binary-cache")
+
     @property
     def profiler_dir(self) -> str:
         profiler_dir = self._get_env("profiler directory")
@@ -128,6 +146,10 @@ class Environment:
     def trace_inspector_dir(self) -> str:
         return os.path.join(self.cli_test_dir, "trace-inspector")
 
+    @property
+    def trace_inspector_cache_dir(self) -> str:
+        return self._get_env("trace inspector cache") or path.join(self.cli_test_dir, "trace-inspector-cache")
+
     @property
     def resharper_version(self) -> Optional[str]:
         return self._get_env("resharper version")
@@ -140,13 +162,26 @@ class Environment:
     def caches_home(self) -> str:
         return self._get_env("caches home") or path.join(self.cli_test_dir, "caches-home")
 
+    @property
+    def download_cache_dir(self) -> str:
+        return self._download_cache_directory or path.join(self.cli_test_dir, "download-cache")
+
     @property
     def snapshots_home(self) -> str:
         return self._get_env("snapshots home") or path.join(self.cli_test_dir, "snapshots-home")
 
-    def get_project_dir(self, project_name) -> str:
-        projects_dir = self._projects_cache_directory or path.join(self.cli_test_dir, "projects")
-        return path.join(projects_dir, project_name)
+    @property
+    def projects_dir(self) -> str:
+        return self._projects_cache_directory or path.join(self.cli_test_dir, "projects")
+
+    def get_project_dir(self, project_name, branch: Optional[str] = None) -> str:
+        if self.use_worktrees and branch:
+            # Every latest branch has its own worktree, stable version stays in the project dir
+            return path.join(self.projects_dir, f"{project_name}@{branch.replace('/', '_')}")
+        return path.join(self.projects_dir, project_name)
+
+    def get_git_store_dir(self, project_name) -> str:
+        return path.join(self.projects_dir, ".git-stores", project_name + ".git")
 
     @property
     def inspect_code_path_x86(self) -> str:
@@ -180,6 +215,30 @@ class Environment:
     def is_dry_run(self) -> bool:
         return self._is_dry_run
 
+    @property
+    def shallow_clone(self) -> bool:
+        return self._shallow_clone
+
+    @property
+    def clone_filter(self) -> Optional[str]:
+        return self._clone_filter
+
+    @property
+    def use_worktrees(self) -> bool:
+        return self._use_worktrees
+
+    @property
+    def force_prepare(self) -> bool:
+        return self._force_prepare
+
+    @property
+    def reconfigure(self) -> bool:
+        return self._reconfigure
+
+    @property
+    def memory_budget(self) -> Optional[float]:
+        return self._memory_budget
+
 # TODO: remove global vars completely
 _env: Environment = None
 
@@ -194,15 +253,109 @@ with open("projects.json") as f:
     projects = json.load(f)
 
 
-def git_clone_and_force_checkout_if_needed(target_dir, url, ref_name):
-    if _env.is_ci:
-        # We can do shallow clone when using CI
-        if len(ref_name) != 40:
-            subprocess.run(["git", "clone", "--depth", "1", "--branch", ref_name, url, target_dir], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+def is_commit_sha(ref_name: str) -> bool:
+    return len(ref_name) == 40 and all(c in "0123456789abcdefABCDEF" for c in ref_name)
+
+
+def git_has_commit(target_dir, commit) -> bool:
+    if not path.exists(path.join(target_dir, ".git")):
+        return False
+    proc = subprocess.run(["git", "cat-file", "-e", commit + "^{commit}"], cwd=target_dir, stdout=PIPE, stderr=PIPE)
+    return proc.returncode == 0
+
+
+def git_partial_clone_args(git_cmd: List[str]) -> List[str]:
+    clone_filter = _env.clone_filter
+    if not clone_filter:
+        return []
+
+    # Make origin a promisor remote, so that missing objects are fetched on demand
+    subprocess.run(git_cmd + ["config", "remote.origin.promisor", "true"], check=True)
+    subprocess.run(git_cmd + ["config", "remote.origin.partialclonefilter", clone_filter], check=True)
+    return ["--filter=" + clone_filter]
+
+
+def git_shallow_fetch_commit(target_dir, url, commit) -> bool:
+    """
+    Fetches only the given commit (without history) into `target_dir`, initializing the repository if needed.
+    Returns False if the server refuses to serve a single commit.
+    """
+    is_new_repo = not path.exists(path.join(target_dir, ".git"))
+    if is_new_repo:
+        makedirs(target_dir, exist_ok=True)
+        subprocess.run(["git", "init", "--quiet"], cwd=target_dir, check=True)
+        subprocess.run(["git", "remote", "add", "origin", url], cwd=target_dir, check=True)
+
+    fetch_args = ["git", "fetch", "--depth", "1"] + git_partial_clone_args(["git", "-C", target_dir]) + ["origin", commit]
+
+    print(f'[git] Fetching single commit {commit} from {url}', flush=True)
+    proc = subprocess.run(fetch_args, cwd=target_dir, stdout=PIPE, stderr=PIPE, text=True)
+    if proc.returncode == 0:
+        return True
+
+    print(f'[git] Shallow fetch of {commit} failed, falling back to full clone:\n{proc.stderr}', flush=True)
+    if is_new_repo:
+        shutil.rmtree(target_dir, onerror=remove_readonly)
+    else:
+        unshallow_args = ["--unshallow"] if path.exists(path.join(target_dir, ".git", "shallow")) else []
+        subprocess.run(["git", "fetch"] + unshallow_args + ["origin"], cwd=target_dir, check=True, stdout=PIPE, stderr=_env.verbose_handle)
+    return False
+
+
+def git_update_store(store_dir, url, ref_name) -> str:
+    """
+    Fetches `ref_name` into the bare repository shared by all worktrees of the project.
+    Returns revision to check out.
+    """
+    git_cmd = ["git", "--git-dir", store_dir]
+    if not path.exists(store_dir):
+        makedirs(store_dir)
+        subprocess.run(git_cmd + ["init", "--bare", "--quiet"], check=True)
+        subprocess.run(git_cmd + ["remote", "add", "origin", url], check=True)
+
+    depth_args = ["--depth", "1"] + git_partial_clone_args(git_cmd) if _env.shallow_clone else []
+    if is_commit_sha(ref_name):
+        has_commit = subprocess.run(git_cmd + ["cat-file", "-e", ref_name + "^{commit}"], stdout=PIPE, stderr=PIPE).returncode == 0
+        if not has_commit:
+            print(f'[git] Fetching commit {ref_name} from {url} into {store_dir}', flush=True)
+            proc = subprocess.run(git_cmd + ["fetch"] + depth_args + ["origin", ref_name], stdout=PIPE, stderr=PIPE, text=True)
+            if proc.returncode != 0:
+                print(f'[git] Fetch of single commit {ref_name} failed, fetching all branches:\n{proc.stderr}', flush=True)
+                unshallow_args = ["--unshallow"] if path.exists(path.join(store_dir, "shallow")) else []
+                subprocess.run(git_cmd + ["fetch"] + unshallow_args + ["origin", "+refs/heads/*:refs/remotes/origin/*"], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+        return ref_name
+
+    print(f'[git] Fetching branch {ref_name} from {url} into {store_dir}', flush=True)
+    subprocess.run(git_cmd + ["fetch"] + depth_args + ["origin", f"+refs/heads/{ref_name}:refs/remotes/origin/{ref_name}"], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+    return f"refs/remotes/origin/{ref_name}"
+
+
+def git_worktree_checkout(target_dir, store_dir, url, ref_name):
+    makedirs(path.dirname(store_dir), exist_ok=True)
+    with file_lock(store_dir + ".lock"):
+        revision = git_update_store(store_dir, url, ref_name)
+        if not path.exists(path.join(target_dir, ".git")):
+            subprocess.run(["git", "--git-dir", store_dir, "worktree", "prune"], check=True)
+            subprocess.run(["git", "--git-dir", store_dir, "worktree", "add", "--force", "--detach", target_dir, revision], check=True, stdout=PIPE, stderr=_env.verbose_handle)
             return
 
-        # TODO: implement shallow clone of a single commit..
-        pass
+    with cwd(target_dir):
+        subprocess.run(["git", "checkout", "--detach", revision], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+        subprocess.run(["git", "reset", "--hard"], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+
+
+def git_clone_and_force_checkout_if_needed(target_dir, url, ref_name, store_dir: Optional[str] = None):
+    if store_dir:
+        git_worktree_checkout(target_dir, store_dir, url, ref_name)
+        return
+
+    if _env.is_ci and not is_commit_sha(ref_name):
+        # We can do shallow clone of branch when using CI
+        subprocess.run(["git", "clone", "--depth", "1", "--branch", ref_name, url, target_dir], check=True, stdout=PIPE, stderr=_env.verbose_handle)
+        return
+
+    if _env.shallow_clone and is_commit_sha(ref_name) and not git_has_commit(target_dir, ref_name):
+        git_shallow_fetch_commit(target_dir, url, ref_name)
 
     if not path.exists(path.join(target_dir, ".git")):
         subprocess.run(["git", "clone", url, target_dir], check=True)
@@ -212,8 +365,22 @@ def git_clone_and_force_checkout_if_needed(target_dir, url, ref_name):
         subprocess.run(["git", "reset", "--hard"], check=True, stdout=PIPE, stderr=_env.verbose_handle)
 
 
-def get_sources_from_git(project_input, target_dir, branch: Optional[str]):
-    git_clone_and_force_checkout_if_needed(target_dir, project_input["repo"], branch or project_input["commit"])
+def git_update_submodules(recursive: bool):
+    update_submodules_args = ["git", "submodule", "update", "--init"]
+    if recursive:
+        update_submodules_args.append("--recursive")
+
+    if _env.shallow_clone:
+        proc = subprocess.run(update_submodules_args + ["--depth", "1"], stdout=PIPE, stderr=PIPE, text=True)
+        if proc.returncode == 0:
+            return
+        print(f'[git] Shallow update of submodules failed, falling back to full fetch:\n{proc.stderr}', flush=True)
+
+    subprocess.run(update_submodules_args, check=True, stdout=PIPE)
+
+
+def get_sources_from_git(project_input, target_dir, branch: Optional[str], store_dir: Optional[str]):
+    git_clone_and_force_checkout_if_needed(target_dir, project_input["repo"], branch or project_input["commit"], store_dir)
 
     with cwd(target_dir):
         subrepo = project_input.get("subrepo")
@@ -225,31 +392,33 @@ def get_sources_from_git(project_input, target_dir, branch: Optional[str]):
         if custom_update_source_script:
             subprocess.run(custom_update_source_script, check=True, stdout=_env.verbose_handle)
 
-        update_submodules_args = ["git", "submodule", "update", "--init"]
-        if project_input.get("recursive", False):
-            update_submodules_args.append("--recursive")
-        subprocess.run(update_submodules_args, check=True, stdout=PIPE)
+        git_update_submodules(project_input.get("recursive", False))
 
-        root_dir = project_input.get("root")
-        if root_dir:
-            return path.join(target_dir, root_dir)
-        else:
-            return target_dir
+    return get_sources_root(project_input, target_dir)
 
 
 def get_sources_from_zip(project_input, target_dir):
     root_dir = path.join(target_dir, project_input["root"])
-    if not path.exists(root_dir):
-        response = requests.get(project_input["url"])
-        with ZipFile(io.BytesIO(response.content)) as zipfile:
-            zipfile.extractall(path=target_dir)
+    if path.exists(root_dir) and not path.exists(path.join(target_dir, EXTRACTION_STAMP)):
+        # Extracted before the download cache was introduced
+        return root_dir
+
+    archive_path = DownloadCache(_env.download_cache_dir).fetch(project_input["url"], project_input.get("sha256"))
+    extracted_count = extract_zip_incrementally(archive_path, target_dir)
+    if extracted_count:
+        print(f'[get_sources_from_zip] Extracted {extracted_count} file(s) into {target_dir}', flush=True)
     return root_dir
 
 
-def get_sources(project_input, target_dir, branch: Optional[str]):
+def get_sources_root(project_input, target_dir) -> str:
+    root_dir = project_input.get("root")
+    return path.join(target_dir, root_dir) if root_dir else target_dir
+
+
+def get_sources(project_input, target_dir, branch: Optional[str], store_dir: Optional[str] = None):
     kind = project_input.get("kind")
     if not kind:
-        return get_sources_from_git(project_input, target_dir, branch)
+        return get_sources_from_git(project_input, target_dir, branch, store_dir)
     elif kind == "zip":
         assert branch is None, "specifying branch is not supported for ZIP projects"
         return get_sources_from_zip(project_input, target_dir)
@@ -257,33 +426,211 @@ def get_sources(project_input, target_dir, branch: Optional[str]):
         raise ValueError("Unknown source kind: {0}".format(kind))
 
 
-def invoke_cmake(build_dir, cmake_generator, cmake_options, cmake_new_env, cmake_dir, required_dependencies):
+# Directory with status files of the vcpkg pre-pass, inherited by worker processes
+VCPKG_PREPASS_DIR_ENV = "RSCPP_VCPKG_PREPASS_DIR"
+# Locked while the pre-pass is running, so that waiters notice if it has died
+VCPKG_PREPASS_LOCK = "prepass.lock"
+
+
+def run_vcpkg_install(dependencies: List[str], triplet: str):
+    vcpkg_env = os.environ.copy()
+    binary_sources = f"files,{path.abspath(_env.vcpkg_binary_cache_dir)},readwrite"
+    existing_binary_sources = vcpkg_env.get("VCPKG_BINARY_SOURCES")
+    vcpkg_env["VCPKG_BINARY_SOURCES"] = f"{existing_binary_sources};{binary_sources}" if existing_binary_sources else binary_sources
+    makedirs(_env.vcpkg_binary_cache_dir, exist_ok=True)
+
+    # No `cwd` context manager here: pre-pass runs in a background thread. So vcpkg is referred by its full path,
+    # it isn't looked up in the current directory by `subprocess.run`
+    subprocess.run([path.join(_env.vcpkg_dir, "vcpkg"), "install"] + dependencies + ["--triplet", triplet], cwd=_env.vcpkg_dir, env=vcpkg_env, check=True, stdout=_env.verbose_handle)
+
+
+def collect_vcpkg_dependencies(projects_to_run) -> Dict[str, List[str]]:
+    dependencies: Dict[str, set] = {}
+    for project_name, _ in projects_to_run:
+        if project_name not in projects:
+            continue
+
+        project = read_conf_if_needed(projects[project_name])
+        required_dependencies = project.get("required dependencies")
+        if not required_dependencies or "custom build tool" in project:
+            continue
+
+        for toolchain in get_compatible_toolchains(project):
+            triplet = VS_CMAKE_GENERATORS[toolchain]["vcpkg_triplet"]
+            dependencies.setdefault(triplet, set()).update(required_dependencies)
+
+    return {triplet: sorted(deps) for triplet, deps in dependencies.items()}
+
+
+def start_vcpkg_prepass(projects_to_run) -> Optional[threading.Thread]:
+    """
+    Installs the union of dependencies of all projects once per triplet in a background thread.
+    `invoke_cmake` waits for it instead of running vcpkg for every project.
+    """
+    dependencies = collect_vcpkg_dependencies(projects_to_run)
+    if not dependencies or not _env.vcpkg_dir:
+        return None
+
+    prepass_dir = tempfile.mkdtemp(prefix="rscpp-vcpkg-prepass-")
+    os.environ[VCPKG_PREPASS_DIR_ENV] = prepass_dir
+    for triplet, triplet_dependencies in dependencies.items():
+        with open(path.join(prepass_dir, triplet + ".json"), 'w') as f:
+            json.dump(triplet_dependencies, f)
+        open(path.join(prepass_dir, triplet + ".pending"), 'w').close()
+
+    lock_acquired = threading.Event()
+
+    def install_all():
+        with file_lock(path.join(prepass_dir, VCPKG_PREPASS_LOCK)):
+            lock_acquired.set()
+            for triplet, triplet_dependencies in dependencies.items():
+                print(f'[vcpkg] Installing {len(triplet_dependencies)} package(s) for {triplet}: {triplet_dependencies}', flush=True)
+                status = "failed"
+                try:
+                    run_vcpkg_install(triplet_dependencies, triplet)
+                    status = "done"
+                except Exception as e:
+                    # Projects install their dependencies themselves then, and report the error if it persists
+                    print(f'[vcpkg] Installation for {triplet} failed: {e}', flush=True)
+                finally:
+                    open(path.join(prepass_dir, f"{triplet}.{status}"), 'w').close()
+                    os.remove(path.join(prepass_dir, triplet + ".pending"))
+
+    thread = threading.Thread(target=install_all, name="vcpkg-prepass", daemon=True)
+    thread.start()
+    lock_acquired.wait()
+    return thread
+
+
+def finish_vcpkg_prepass(thread: Optional[threading.Thread]):
+    if thread is None:
+        return
+
+    thread.join()
+    shutil.rmtree(os.environ.pop(VCPKG_PREPASS_DIR_ENV), ignore_errors=True)
+
+
+def wait_for_vcpkg_prepass(dependencies: List[str], triplet: str) -> bool:
+    """
+    Returns True if the dependencies have been installed by the pre-pass.
+    """
+    prepass_dir = os.environ.get(VCPKG_PREPASS_DIR_ENV)
+    if not prepass_dir:
+        return False
+
+    dependencies_path = path.join(prepass_dir, triplet + ".json")
+    if not path.exists(dependencies_path):
+        return False
+
+    with open(dependencies_path) as f:
+        if not set(dependencies) <= set(json.load(f)):
+            return False
+
+    pending_path = path.join(prepass_dir, triplet + ".pending")
+    done_path = path.join(prepass_dir, triplet + ".done")
+    if path.exists(pending_path):
+        print(f'[invoke_cmake] Waiting for vcpkg pre-pass ({triplet})..', flush=True)
+        while path.exists(pending_path):
+            # The lock is released by the OS even if the process running the pre-pass is killed
+            if not is_file_locked(path.join(prepass_dir, VCPKG_PREPASS_LOCK)):
+                print(f'[invoke_cmake] vcpkg pre-pass ({triplet}) is no longer running', flush=True)
+                break
+            time.sleep(1)
+
+    return path.exists(done_path)
+
+
+CMAKE_CONFIGURE_CACHE = "rscpp-configure-cache.json"
+
+
+def get_cmake_configure_key(source_revision: str, cmake_generator, cmake_options, substituted_env: dict, cmake_dir, toolchain_file: Optional[str], required_dependencies,
+                            source_tree_state: Optional[str] = None) -> str:
+    inputs = {
+        "source revision": source_revision,
+        # Fixups may change CMake files without changing the revision
+        "source tree state": source_tree_state,
+        "generator": cmake_generator,
+        "cmake options": cmake_options,
+        "cmake env": substituted_env,
+        "cmake dir": cmake_dir,
+        "toolchain file": toolchain_file,
+        "required dependencies": required_dependencies,
+    }
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def load_cmake_configure_cache(build_dir, configure_key: str) -> Optional[str]:
+    cache_path = path.join(build_dir, CMAKE_CONFIGURE_CACHE)
+    if _env.reconfigure or not path.exists(cache_path) or not path.exists(path.join(build_dir, "CMakeCache.txt")):
+        return None
+
+    with open(cache_path) as f:
+        cache = json.load(f)
+
+    sln_file = cache.get("sln_file")
+    if cache.get("key") != configure_key or not sln_file or not path.exists(sln_file):
+        return None
+    return sln_file
+
+
+def find_cmake_solution(build_dir) -> str:
+    with open(path.join(build_dir, "CMakeCache.txt")) as cmake_cache:
+        for line in cmake_cache:
+            if line.startswith("CMAKE_PROJECT_NAME"):
+                project_name = line[line.find('=') + 1:].rstrip()
+                sln_file = path.join(build_dir, project_name + ".sln")
+                if not path.exists(sln_file):
+                    raise Exception("solution file {0} does not exist".format(sln_file))
+                return sln_file
+
+    raise Exception("CMAKE_PROJECT_NAME is missing in {0}".format(path.join(build_dir, "CMakeCache.txt")))
+
+
+def invoke_cmake(build_dir, cmake_generator, cmake_options, cmake_new_env, cmake_dir, required_dependencies, source_revision: Optional[str] = None,
+                 source_tree_state: Optional[str] = None):
     def apply_substitutions(s: str) -> str:
         return s.replace('${BUILD_DIR}', path.realpath(build_dir))
 
     cmd_line_args = ["cmake", cmake_dir]
     cmd_line_args += cmake_generator["cmake options"]
 
+    toolchain_file = None
     if required_dependencies:
         vcpkg_dir = _env.vcpkg_dir
         if not vcpkg_dir:
             raise Exception(f"project has required dependencies {required_dependencies}, but environment doesn't contain path to vcpkg")
+        toolchain_file = "{0}/scripts/buildsystems/vcpkg.cmake".format(vcpkg_dir)
+
+    substituted_env = {env_key: apply_substitutions(env_value) for env_key, env_value in (cmake_new_env or {}).items()}
 
-        with cwd(vcpkg_dir):
+    configure_key = None
+    if source_revision:
+        configure_key = get_cmake_configure_key(source_revision, cmake_generator, cmake_options, substituted_env, cmake_dir, toolchain_file, required_dependencies,
+                                                source_tree_state)
+        sln_file = load_cmake_configure_cache(build_dir, configure_key)
+        if sln_file:
+            print(f'[invoke_cmake] Configuration is up to date, using {sln_file}', flush=True)
+            return sln_file
+
+    if required_dependencies:
+        if not wait_for_vcpkg_prepass(required_dependencies, cmake_generator["vcpkg_triplet"]):
             print('[invoke_cmake] Running vcpkg', flush=True)
-            subprocess.run(["vcpkg", "install"] + required_dependencies + ["--triplet", cmake_generator["vcpkg_triplet"]], check=True, stdout=_env.verbose_handle)
+            run_vcpkg_install(required_dependencies, cmake_generator["vcpkg_triplet"])
 
-        cmd_line_args.append("-DCMAKE_TOOLCHAIN_FILE={0}/scripts/buildsystems/vcpkg.cmake".format(vcpkg_dir))
+        cmd_line_args.append("-DCMAKE_TOOLCHAIN_FILE=" + toolchain_file)
 
     cmake_env = os.environ.copy()
-    if cmake_new_env:
-        for env_key, env_value in cmake_new_env.items():
-            cmake_env[env_key] = cmake_env.get(env_key, '') + apply_substitutions(env_value)
+    for env_key, env_value in substituted_env.items():
+        cmake_env[env_key] = cmake_env.get(env_key, '') + env_value
 
     if cmake_options:
         cmd_line_args.extend(cmake_options)
     makedirs(build_dir, exist_ok=True)
 
+    cache_path = path.join(build_dir, CMAKE_CONFIGURE_CACHE)
+    if path.exists(cache_path):
+        os.remove(cache_path)
+
     with cwd(build_dir):
         if _env.verbose and cmake_new_env:
             print(f'[invoke_cmake] Running cmake with modified env: {cmake_env}', flush=True)
@@ -294,15 +641,19 @@ def invoke_cmake(build_dir, cmake_generator, cmake_options, cmake_new_env, cmake
         print('[invoke_cmake] Running cmake:', subprocess.list2cmdline(cmd_line_args), flush=True)
         subprocess.run(cmd_line_args, check=True, stdout=_env.verbose_handle, env=cmake_env)
 
-    with open(path.join(build_dir, "CMakeCache.txt")) as cmake_cache:
-        for line in cmake_cache.readlines():
-            if line.startswith("CMAKE_PROJECT_NAME"):
-                project_name = line[line.find('=') + 1:].rstrip()
-                sln_file = path.join(build_dir, project_name + ".sln")
-                if not path.exists(sln_file):
-                    raise Exception("solution file {0} does not exist".format(sln_file))
-                return sln_file
-    
+    sln_file = find_cmake_solution(build_dir)
+    if configure_key:
+        with open(cache_path, 'w') as f:
+            json.dump({"key": configure_key, "sln_file": path.abspath(sln_file)}, f, indent=4)
+    return sln_file
+
+
+def get_source_revision(project_input, target_dir) -> str:
+    kind = project_input.get("kind")
+    if not kind:
+        return git_output(target_dir, "rev-parse", "HEAD").strip()
+    return "{0}@{1}".format(project_input["url"], project_input.get("sha256"))
+
 
 proj_config_dir = path.abspath("proj-config")
 
@@ -314,14 +665,14 @@ def read_conf_if_needed(project):
         return project
 
 
-def inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_props):
-    report_file = path.join(project_dir, "resharper-report.xml")
+def inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_props, caches_home: Optional[str] = None, suffix: str = ""):
+    report_file = path.join(project_dir, f"resharper-report{suffix}.xml")
     args = [
         "--severity=INFO",
         "-f=Xml",
         "-no-build",
         "-o=" + report_file,
-        "--caches-home=" + _env.caches_home,
+        "--caches-home=" + (caches_home or _env.caches_home),
         "--no-swea",
         "--daemon=VISIBLE_DOCUMENT"
     ]
@@ -336,8 +687,8 @@ def inspect_code_run_arguments(project_dir, sln_file, project_to_check, msbuild_
         props = ["{0}={1}".format(key, value) for key, value in msbuild_props.items()]
         args.append("--properties:" + ";".join(props))
 
-    log_file = path.join(project_dir, "resharper-logs.log")
-    err_file = path.join(project_dir, "resharper-logs.err.log")
+    log_file = path.join(project_dir, f"resharper-logs{suffix}.log")
+    err_file = path.join(project_dir, f"resharper-logs{suffix}.err.log")
     if os.path.exists(log_file): os.remove(log_file)
     if os.path.exists(err_file): os.remove(err_file)
     args.append("--LogLevel=INFO")
@@ -414,24 +765,244 @@ def get_compatible_toolchains(project: dict) -> List[str]:
     return sorted(set(project_generators) & set(supported_generators))
 
 
-def prepare_project(project_name, project, cmake_generator: Optional[str], branch: Optional[str] = None):
-    target_dir = _env.get_project_dir(project_name)
-    project_dir = get_sources(project["sources"], target_dir, branch)
-    build_dir = path.join(project_dir, f'build-{cmake_generator}')
-    abs_build_dir = path.realpath(build_dir)
+def get_git_store_dir_if_needed(project_name, target_dir) -> Optional[str]:
+    if not _env.use_worktrees:
+        return None
+
+    # Keep using checkouts cloned before worktrees were enabled
+    if path.isdir(path.join(target_dir, ".git")):
+        return None
+
+    return _env.get_git_store_dir(project_name)
+
+
+# Parts of project config affecting checked out sources and generated solution
+PREPARE_CONFIG_KEYS = (
+    "sources",
+    "fixup sources",
+    "custom build tool",
+    "cmake options",
+    "cmake env",
+    "cmake dir",
+    "required dependencies",
+    "build step",
+)
+
+
+def file_digest(file_path) -> str:
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_prepare_config_digest(project, cmake_generator: Optional[str]) -> str:
+    config = {key: project.get(key) for key in PREPARE_CONFIG_KEYS}
+    config["generator"] = cmake_generator
+    config["generator options"] = VS_CMAKE_GENERATORS.get(cmake_generator)
+    config["vcpkg dir"] = _env.vcpkg_dir
+
+    for key in ("fixup sources", "build step"):
+        script = project.get(key)
+        if isinstance(script, str) and script.endswith(".py"):
+            config[key + " digest"] = file_digest(script)
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def git_output(target_dir, *args) -> str:
+    # Read-only queries may run concurrently for several toolchains, so `git status` must not refresh the index
+    return subprocess.run(["git", "--no-optional-locks"] + list(args), cwd=target_dir, check=True, stdout=PIPE, text=True).stdout
+
+
+def get_checkout_state(target_dir, project_input) -> dict:
+    # Untracked files are ignored: build directories of other toolchains appear there
+    status = git_output(target_dir, "status", "--porcelain", "--untracked-files=no")
+    state = {
+        "commit": git_output(target_dir, "rev-parse", "HEAD").strip(),
+        "status": hashlib.sha256(status.encode('utf8')).hexdigest(),
+        "submodules": git_output(target_dir, "submodule", "status", "--recursive"),
+    }
+
+    subrepo = project_input.get("subrepo")
+    if subrepo:
+        state["subrepo commit"] = git_output(path.join(target_dir, subrepo["path"]), "rev-parse", "HEAD").strip()
+
+    return state
+
+
+def get_prepare_stamp_path(project, target_dir, cmake_generator: Optional[str], branch: Optional[str]) -> Optional[str]:
+    """
+    Returns path to the stamp describing prepared state of the checkout,
+    or None if the state can't be verified without network (i.e. for branches and ZIP sources).
+    """
+    project_input = project["sources"]
+    if project_input.get("kind") or not is_commit_sha(branch or project_input["commit"]):
+        return None
+
+    if not path.exists(path.join(target_dir, ".git")):
+        return None
+
+    # Stamp is stored inside of git dir to not affect `git status`
+    git_dir = git_output(target_dir, "rev-parse", "--absolute-git-dir").strip()
+    return path.join(git_dir, f"rscpp-prepare-{cmake_generator or 'default'}.json")
+
+
+def load_prepared_project(stamp_path, project, target_dir, cmake_generator: Optional[str]) -> Optional[Tuple[str, str]]:
+    if _env.force_prepare or not path.exists(stamp_path):
+        return None
+
+    with open(stamp_path) as f:
+        stamp = json.load(f)
+
+    if stamp.get("config") != get_prepare_config_digest(project, cmake_generator):
+        return None
+
+    try:
+        checkout_state = get_checkout_state(target_dir, project["sources"])
+    except subprocess.CalledProcessError:
+        return None
+
+    if stamp.get("checkout") != checkout_state or not path.exists(stamp["sln_file"]):
+        return None
+
+    return stamp["project_dir"], stamp["sln_file"]
+
+
+def is_project_prepared(project_name, project, cmake_generator: Optional[str], branch: Optional[str] = None) -> bool:
+    target_dir = _env.get_project_dir(project_name, branch)
+    stamp_path = get_prepare_stamp_path(project, target_dir, cmake_generator, branch)
+    return bool(stamp_path) and load_prepared_project(stamp_path, project, target_dir, cmake_generator) is not None
+
+
+def prepare_project_sources(project_name, project, cmake_generators: List[str], branch: Optional[str] = None) -> str:
+    """
+    Fetches sources and applies fixups for all given toolchains at once,
+    so that toolchains can be prepared concurrently with `prepare_project(..., sources_ready=True)`.
+    """
+    target_dir = _env.get_project_dir(project_name, branch)
+    project_dir = get_sources(project["sources"], target_dir, branch, get_git_store_dir_if_needed(project_name, target_dir))
+    for cmake_generator in cmake_generators:
+        abs_build_dir = path.realpath(path.join(project_dir, f'build-{cmake_generator}'))
+        apply_fixup_sources(target_dir, project.get("fixup sources"), abs_build_dir)
+    return project_dir
+
+
+def prepare_project(project_name, project, cmake_generator: Optional[str], branch: Optional[str] = None, sources_ready: bool = False):
+    target_dir = _env.get_project_dir(project_name, branch)
+
+    stamp_path = get_prepare_stamp_path(project, target_dir, cmake_generator, branch)
+    if stamp_path:
+        prepared = load_prepared_project(stamp_path, project, target_dir, cmake_generator)
+        if prepared:
+            print(f'[prepare_project] {project_name} is already prepared, skipping', flush=True)
+            project_dir, sln_file = prepared
+            generate_settings(project.get("to skip")).write(sln_file + ".DotSettings")
+            return project_dir, sln_file
+
+        if path.exists(stamp_path):
+            os.remove(stamp_path)
+
+    project_dir, sln_file = prepare_project_from_scratch(target_dir, project_name, project, cmake_generator, branch, sources_ready)
+
+    stamp_path = get_prepare_stamp_path(project, target_dir, cmake_generator, branch)
+    if stamp_path:
+        with open(stamp_path, 'w') as f:
+            json.dump({
+                "config": get_prepare_config_digest(project, cmake_generator),
+                "checkout": get_checkout_state(target_dir, project["sources"]),
+                "project_dir": os.path.abspath(project_dir),
+                "sln_file": sln_file,
+            }, f, indent=4)
+
+    return project_dir, sln_file
+
+
+def get_fixups_key(fixup_sources, abs_build_dir) -> Optional[str]:
+    if isinstance(fixup_sources, list):
+        fixups = "\n".join(fixup_sources)
+    elif isinstance(fixup_sources, str) and fixup_sources.endswith(".py"):
+        # Scripts get BUILD_DIR, so they are applied for every build directory
+        fixups = f"{fixup_sources}\n{file_digest(fixup_sources)}\n{abs_build_dir}"
+    else:
+        return None
+    return hashlib.sha256(fixups.encode('utf8')).hexdigest()
+
+
+def get_source_tree_state(target_dir) -> Optional[str]:
+    """
+    Returns digest of local changes of the sources, i.e. changes made by fixups
+    """
+    if path.exists(path.join(target_dir, ".git")):
+        diff = subprocess.run(["git", "diff", "HEAD", "--binary"], cwd=target_dir, check=True, stdout=PIPE).stdout
+        return hashlib.sha256(diff).hexdigest()
+
+    extraction_stamp = path.join(target_dir, EXTRACTION_STAMP)
+    if path.exists(extraction_stamp):
+        with open(extraction_stamp) as f:
+            return f.read().strip()
+
+    return None
+
+
+def get_fixups_stamp_path(target_dir, fixup_sources, abs_build_dir) -> str:
+    if isinstance(fixup_sources, str):
+        # Scripts may write to BUILD_DIR, e.g. fix-reactos, so they have to be applied again once it's wiped
+        return path.join(abs_build_dir, ".rscpp-fixups.json")
+    if path.exists(path.join(target_dir, ".git")):
+        return path.join(git_output(target_dir, "rev-parse", "--absolute-git-dir").strip(), "rscpp-fixups.json")
+    return path.join(target_dir, ".rscpp-fixups.json")
+
+
+def apply_fixup_sources(target_dir, fixup_sources, abs_build_dir):
+    """
+    Applies fixups unless they have been already applied to the current state of sources
+    """
+    fixups_key = get_fixups_key(fixup_sources, abs_build_dir)
+    if fixups_key is None:
+        assert fixup_sources is None, "unknown fixup sources format, should be list[str] or path to python script"
+        return
+
+    stamp_path = get_fixups_stamp_path(target_dir, fixup_sources, abs_build_dir)
+    applied = {}
+    if path.exists(stamp_path):
+        with open(stamp_path) as f:
+            applied = json.load(f)
+
+    tree_state = get_source_tree_state(target_dir)
+    if tree_state is not None and applied.get(fixups_key) == tree_state:
+        print('[prepare_project] Fixups are already applied, skipping', flush=True)
+        return
 
-    fixup_sources = project.get("fixup sources")
     if isinstance(fixup_sources, list):
         with cwd(target_dir):
             exec("\n".join(fixup_sources), {}, {})
-    elif isinstance(fixup_sources, str) and fixup_sources.endswith(".py"):
+    else:
         full_path = os.path.realpath(fixup_sources)
         with cwd(target_dir):
             env_copy = os.environ.copy()
             env_copy['BUILD_DIR'] = abs_build_dir
             subprocess.run(["python", full_path], check=True, stdout=_env.verbose_handle, env=env_copy)
+
+    tree_state = get_source_tree_state(target_dir)
+    if tree_state is None:
+        return
+
+    # Keep only fixups producing the same sources, e.g. the same script applied for other build dirs
+    applied = {key: state for key, state in applied.items() if state == tree_state}
+    applied[fixups_key] = tree_state
+    makedirs(path.dirname(stamp_path), exist_ok=True)
+    with open(stamp_path, 'w') as f:
+        json.dump(applied, f, indent=4)
+
+
+def prepare_project_from_scratch(target_dir, project_name, project, cmake_generator: Optional[str], branch: Optional[str], sources_ready: bool = False):
+    if sources_ready:
+        # Already done by `prepare_project_sources`
+        project_dir = get_sources_root(project["sources"], target_dir)
+        build_dir = path.join(project_dir, f'build-{cmake_generator}')
     else:
-        assert fixup_sources is None, "unknown fixup sources format, should be list[str] or path to python script"
+        project_dir = get_sources(project["sources"], target_dir, branch, get_git_store_dir_if_needed(project_name, target_dir))
+        build_dir = path.join(project_dir, f'build-{cmake_generator}')
+        apply_fixup_sources(target_dir, project.get("fixup sources"), path.realpath(build_dir))
 
     custom_build_tool = project.get("custom build tool")
     if custom_build_tool:
@@ -449,7 +1020,11 @@ def prepare_project(project_name, project, cmake_generator: Optional[str], branc
         assert cmake_generator in VS_CMAKE_GENERATORS, f"unknown cmake generator '{cmake_generator}'"
         gen_description = VS_CMAKE_GENERATORS[cmake_generator]
         project_dir = build_dir
-        sln_file = invoke_cmake(build_dir, gen_description, project.get("cmake options"), project.get("cmake env"), project.get("cmake dir", ".."), project.get("required dependencies"))
+        source_revision = get_source_revision(project["sources"], target_dir)
+        # Archives have no git diff, so the state of their sources is known only by the applied fixups
+        source_tree_state = f'{get_source_tree_state(target_dir)}\n{get_fixups_key(project.get("fixup sources"), path.realpath(build_dir))}'
+        sln_file = invoke_cmake(build_dir, gen_description, project.get("cmake options"), project.get("cmake env"), project.get("cmake dir", ".."), project.get("required dependencies"),
+                                source_revision, source_tree_state)
         build_step = project.get("build step")
         if build_step:
             if isinstance(build_step, list):
@@ -483,6 +1058,12 @@ def cwd(path):
         os.chdir(old_path)
 
 
+def remove_readonly(func, path, _):
+    # git marks its object files as read-only on Windows
+    os.chmod(path, stat.S_IWRITE)
+    func(path)
+
+
 def parse_projects(specified_projects: List[str]):
     if not specified_projects:
         for project_name in projects.keys():
@@ -505,9 +1086,17 @@ argparser.add_argument("-p", "--project", dest="project", nargs='+', type=str)
 argparser.add_argument("-e", "--env", dest='env_path')
 argparser.add_argument('--build-dir', dest='build_directory')
 argparser.add_argument('--vcpkg-dir', dest='vcpkg_directory')
+argparser.add_argument('--vcpkg-binary-cache', dest='vcpkg_binary_cache_directory')
 argparser.add_argument('--projects-cache', dest='projects_cache_directory')
+argparser.add_argument('--download-cache', dest='download_cache_directory', help="Directory with downloaded source archives, can be shared")
 argparser.add_argument('--supported-generators', dest='supported_generators', nargs='*', type=str)
 argparser.add_argument('--ci', action='store_true', dest='is_ci')
+argparser.add_argument('--shallow', action='store_true', dest='shallow_clone', help="Fetch only pinned commits without history (always enabled on CI)")
+argparser.add_argument('--clone-filter', dest='clone_filter', help="Partial clone filter for shallow fetches, e.g. 'blob:none'")
+argparser.add_argument('--worktrees', action='store_true', dest='use_worktrees', help="Share one object store between stable and latest checkouts of a project")
+argparser.add_argument('--force-prepare', action='store_true', dest='force_prepare', help="Prepare projects even if their checkouts are up to date")
+argparser.add_argument('--reconfigure', action='store_true', dest='reconfigure', help="Ignore cached cmake configuration results")
 argparser.add_argument('--verbose', action='store_true', dest='verbose')
 argparser.add_argument('--x86', action='store_true', dest='is_x86')
+argparser.add_argument('--memory-budget', dest='memory_budget', type=float, help="Memory (in GB) available for concurrently processed projects")
 argparser.add_argument('--dry', action='store_true', dest='is_dry_run', help="If passed, only prepare project without actual checking")
@@ -1,8 +1,11 @@
+import glob
 import itertools
+import os
 import pathlib
 import re
 import subprocess
 import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 build_targets = []
 
@@ -12,6 +15,85 @@ def find_targets(file_path, regex: re.Pattern):
         return (m.group(1) for m in regex.finditer(f.read()))
 
 
+def parse_solution_dependencies(sln_path):
+    """
+    Returns target name -> names of targets it depends on, as listed in `ProjectSection(ProjectDependencies)` of .sln
+    """
+    project_re = re.compile(r'^Project\("\{[^}]+\}"\) = "([^"]+)", "[^"]*", "(\{[^}]+\})"\s*$(.*?)^EndProject\s*$', re.MULTILINE | re.DOTALL)
+    dependency_re = re.compile(r'^\s*(\{[^}]+\}) = \{[^}]+\}\s*$', re.MULTILINE)
+
+    with open(sln_path, encoding='utf-8-sig') as f:
+        content = f.read()
+
+    guid_to_name = {}
+    guid_dependencies = {}
+    for m in project_re.finditer(content):
+        name, guid, body = m.groups()
+        guid_to_name[guid.upper()] = name
+        guid_dependencies[name] = [dep.upper() for dep in dependency_re.findall(body)]
+
+    return {name: set(guid_to_name[dep] for dep in deps if dep in guid_to_name) for name, deps in guid_dependencies.items()}
+
+
+def build(targets, extra_args=()):
+    start_time = time.time()
+    args = ["cmake", "--build", ".", "--target"] + list(targets)
+    if extra_args:
+        args += ["--"] + list(extra_args)
+    proc = subprocess.run(args, stdout=subprocess.PIPE, text=True, stderr=subprocess.STDOUT)
+    return proc, time.time() - start_time
+
+
+def report_build(title, proc, elapsed):
+    print(f'>>> Building {title}... built in {elapsed:.1f}s', flush=True, end='')
+    if proc.returncode != 0:
+        print(f' ; with error code {proc.returncode}')
+        print('::group::Output')
+        print(proc.stdout)
+        print('::endgroup::', flush=True)
+    else:
+        print(flush=True)
+
+
+def build_sequentially(targets):
+    for gen_target in targets:
+        report_build(f'target {gen_target}', *build([gen_target]))
+
+
+def build_in_parallel(targets, dependencies, max_jobs):
+    targets_set = set(targets)
+
+    # Targets outside the set (tablegen tools and their libraries, ZERO_CHECK) are shared by all of them,
+    # so they are built once upfront instead of concurrently from every target
+    shared_targets = sorted(set(itertools.chain.from_iterable(dependencies.get(t, ()) for t in targets)) - targets_set)
+    if shared_targets:
+        report_build(f'{len(shared_targets)} shared dependencies {shared_targets}', *build(shared_targets))
+
+    # Remaining dependencies between tablegen targets are respected by the scheduler,
+    # so that msbuild doesn't have to build project references
+    pending = {t: dependencies.get(t, set()) & targets_set for t in targets}
+    finished = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+        while pending or running:
+            for gen_target in [t for t, deps in pending.items() if deps <= finished]:
+                if len(running) >= max_jobs:
+                    break
+                del pending[gen_target]
+                running[executor.submit(build, [gen_target], ["/p:BuildProjectReferences=false"])] = gen_target
+
+            if not running:
+                raise Exception(f'dependency cycle between targets: {sorted(pending)}')
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                gen_target = running.pop(future)
+                report_build(f'target {gen_target}', *future.result())
+                # Failed target is marked as finished too: dependent targets report their own errors, as before
+                finished.add(gen_target)
+
+
 dirs_to_search = [
     pathlib.Path('../clang'),
     pathlib.Path('../llvm/lib/Target/AArch64')
@@ -27,18 +109,15 @@ for path in itertools.chain.from_iterable(dir_path.rglob('CMakeLists.txt') for d
 
 print(f'>>> Found {len(build_targets)} target(s) to build: {build_targets}', flush=True)
 
-for gen_target in build_targets:
-    print(f'>>> Building target {gen_target}...', flush=True, end='')
+solution_files = glob.glob('*.sln')
+max_jobs = int(os.environ.get('RSCPP_TABLEGEN_JOBS', min(8, os.cpu_count() or 1)))
+start_time = time.time()
 
-    start_time = time.time()
-    proc = subprocess.run(["cmake", "--build", ".", "--target", gen_target], stdout=subprocess.PIPE, text=True, stderr=subprocess.STDOUT)
-    elapsed = time.time() - start_time
+if len(solution_files) == 1 and max_jobs > 1:
+    solution_dependencies = parse_solution_dependencies(solution_files[0])
+    print(f'>>> Building targets with up to {max_jobs} parallel jobs', flush=True)
+    build_in_parallel(build_targets, solution_dependencies, max_jobs)
+else:
+    build_sequentially(build_targets)
 
-    print(f' built in {elapsed:.1f}s', flush=True, end='')
-    if proc.returncode != 0:
-        print(f' ; with error code {proc.returncode}')
-        print('::group::Output')
-        print(proc.stdout)
-        print('::endgroup::', flush=True)
-    else:
-        print(flush=True)
+print(f'>>> All targets built in {time.time() - start_time:.1f}s', flush=True)
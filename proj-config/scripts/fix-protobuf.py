@@ -6,9 +6,10 @@ utils.update_file('src/google/protobuf/arena.cc',
                                                   b'static constexpr ArenaBlock kSentryArenaBlock;'))
 
 # Workaround for non-conformant offsetof implementation
+FIELD_OFFSET_DEFINE = b'#define PROTOBUF_FIELD_OFFSET(TYPE, FIELD) 0\n'
 utils.update_file('src/google/protobuf/port_def.inc',
-                  lambda content: content.replace(b'#ifdef PROTOBUF_EXPORT',
-                                                  b'#define PROTOBUF_FIELD_OFFSET(TYPE, FIELD) 0\n#ifdef PROTOBUF_EXPORT'))
+                  lambda content: content if FIELD_OFFSET_DEFINE in content else
+                                  content.replace(b'#ifdef PROTOBUF_EXPORT', FIELD_OFFSET_DEFINE + b'#ifdef PROTOBUF_EXPORT'))
 
 utils.update_file('third_party/abseil-cpp/absl/base/config.h',
                   lambda content: content.replace(b'#elif defined(__clang__) && (__clang_major__ >= 15)', b'#else'))
@@ -1,14 +1,19 @@
 def update_file(path, callback):
     with open(path, 'rb') as f:
         content = f.read()
-    content = callback(content)
+    new_content = callback(content)
+    # Don't touch unchanged files to keep their timestamps, and so configure/build caches
+    if new_content == content:
+        return
     with open(path, 'wb') as f:
-        f.write(content)
+        f.write(new_content)
 
 
 def insert_before(path, needle: bytes, new_content: bytes):
     def callback(content: bytes):
         pos = content.index(needle)
+        if content[:pos].endswith(new_content):
+            return content
         return content[:pos] + new_content + content[pos:]
 
     update_file(path, callback)
@@ -17,6 +22,8 @@ def insert_before(path, needle: bytes, new_content: bytes):
 def insert_after(path, needle: bytes, new_content: bytes):
     def callback(content: bytes):
         pos = content.index(needle) + len(needle)
+        if content[pos:].startswith(new_content):
+            return content
         return content[:pos] + new_content + content[pos:]
 
     update_file(path, callback)
@@ -0,0 +1,76 @@
+"""
+Compares streaming and DOM-based parsing of a synthetic inspectcode report.
+
+Usage: python tests/benchmark_report_parser.py [size in MB, 1024 by default]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ISSUE_TYPES = [("CppCompileError", "ERROR"), ("CppUnusedIncludeDirective", "WARNING"),
+               ("CppClangTidyModernizeUseAuto", "SUGGESTION"), ("CppParameterMayBeConst", "HINT"),
+               ("CppInconsistentNaming", "INFO")]
+
+PARSERS = {
+    "streaming": "from util.report_parser import parse_report\n"
+                 "report = parse_report(sys.argv[1])\n"
+                 "print(len(report.errors))",
+    "dom": "import xml.etree.ElementTree as ET\n"
+           "root = ET.parse(sys.argv[1]).getroot()\n"
+           "severities = {t.get('Id'): t.get('Severity') for t in root.find('IssueTypes')}\n"
+           "print(len(set((i.get('File'), int(i.get('Line', '0')), i.get('Message')) for i in root.find('Issues').iter('Issue')\n"
+           "              if (i.get('Severity') or severities[i.get('TypeId')]) == 'ERROR')))",
+}
+
+
+def generate_report(report_file: str, size_mb: int):
+    target_size = size_mb << 20
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<Report ToolsVersion="243.0">\n<Information/>\n<IssueTypes>\n')
+        for type_id, severity in ISSUE_TYPES:
+            f.write(f'<IssueType Id="{type_id}" Category="Synthetic" Severity="{severity}"/>\n')
+        f.write('</IssueTypes>\n<Issues>\n')
+
+        issue_index = 0
+        project_index = 0
+        while f.tell() < target_size:
+            f.write(f'<Project Name="project{project_index}">\n')
+            for _ in range(10_000):
+                # One of 1000 issues is an error
+                type_id = ISSUE_TYPES[0][0] if issue_index % 1000 == 0 else ISSUE_TYPES[1 + issue_index % 4][0]
+                f.write(f'<Issue TypeId="{type_id}" File="..\\src\\module{issue_index % 997}\\file{issue_index % 7919}.cpp" '
+                        f'Offset="{issue_index}-{issue_index + 10}" Line="{issue_index % 5000}" Message="Synthetic issue #{issue_index % 1013}"/>\n')
+                issue_index += 1
+            f.write('</Project>\n')
+            project_index += 1
+
+        f.write('</Issues>\n</Report>\n')
+    print(f"Generated {os.path.getsize(report_file) >> 20} MB report with {issue_index} issues", flush=True)
+
+
+def measure(parser: str, report_file: str):
+    # Every parser is run in a separate process to measure its peak memory
+    script = "import resource, sys\n" + PARSERS[parser] + \
+             "\nprint(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    start = time.time()
+    output = subprocess.check_output([sys.executable, "-c", script, report_file], cwd=ROOT_DIR, text=True).split()
+    elapsed = time.time() - start
+    errors_count, max_rss_kb = int(output[0]), int(output[1])
+    print(f"{parser:>10}: {elapsed:.1f}s, peak RSS {max_rss_kb >> 10} MB, {errors_count} errors", flush=True)
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report_file = os.path.join(temp_dir, "resharper-report.xml")
+        generate_report(report_file, size_mb)
+        for parser in PARSERS:
+            measure(parser, report_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from util.download_cache import DownloadCache, extract_zip_incrementally, file_sha256
+
+
+def make_zip(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    content = b''
+    requested_ranges = []
+
+    def do_GET(self):
+        content = type(self).content
+        range_header = self.headers.get('Range')
+        type(self).requested_ranges.append(range_header)
+
+        if range_header:
+            offset = int(range_header.removeprefix('bytes=').rstrip('-'))
+            if offset >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(content)}')
+                self.end_headers()
+                return
+            self.send_response(206)
+            body = content[offset:]
+        else:
+            self.send_response(200)
+            body = content
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloadCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.archive = make_zip({'root/a.cpp': b'int a;' * 1000, 'root/b.h': b'#pragma once'})
+        RangeRequestHandler.content = self.archive
+        RangeRequestHandler.requested_ranges = []
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/sources.zip'
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DownloadCache(os.path.join(self.temp_dir.name, 'cache'), chunk_size=256)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def test_download_is_cached_by_content(self):
+        archive_path = self.cache.fetch(self.url)
+        with open(archive_path, 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+
+        self.assertEqual(self.cache.fetch(self.url), archive_path)
+        self.assertEqual(self.cache.fetch(self.url, file_sha256(archive_path)), archive_path)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [None])
+
+    def test_checksum_mismatch(self):
+        with self.assertRaises(ValueError):
+            self.cache.fetch(self.url, '0' * 64)
+
+    def test_interrupted_download_is_resumed(self):
+        self.cache.fetch(self.url)
+        partial_dir = os.path.join(self.temp_dir.name, 'cache', 'partial')
+        url_key = os.listdir(os.path.join(self.temp_dir.name, 'cache', 'urls'))[0]
+
+        # Simulate interrupted download of a new version of the archive
+        RangeRequestHandler.content = self.archive + b'new data'
+        os.remove(os.path.join(self.temp_dir.name, 'cache', 'urls', url_key))
+        with open(os.path.join(partial_dir, url_key), 'wb') as f:
+            f.write(RangeRequestHandler.content[:100])
+
+        archive_path = self.cache.fetch(self.url)
+        with open(archive_path, 'rb') as f:
+            self.assertEqual(f.read(), RangeRequestHandler.content)
+        self.assertEqual(RangeRequestHandler.requested_ranges[-1], 'bytes=100-')
+
+    def test_complete_partial_download_is_kept(self):
+        partial_dir = os.path.join(self.temp_dir.name, 'cache', 'partial')
+        os.makedirs(partial_dir)
+        with open(os.path.join(partial_dir, hashlib.sha256(self.url.encode('utf8')).hexdigest()), 'wb') as f:
+            f.write(self.archive)
+
+        archive_path = self.cache.fetch(self.url)
+        with open(archive_path, 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [f'bytes={len(self.archive)}-'])
+
+    def test_partial_download_of_larger_file_is_restarted(self):
+        partial_dir = os.path.join(self.temp_dir.name, 'cache', 'partial')
+        os.makedirs(partial_dir)
+        with open(os.path.join(partial_dir, hashlib.sha256(self.url.encode('utf8')).hexdigest()), 'wb') as f:
+            f.write(self.archive + b'old data')
+
+        archive_path = self.cache.fetch(self.url)
+        with open(archive_path, 'rb') as f:
+            self.assertEqual(f.read(), self.archive)
+        self.assertEqual(RangeRequestHandler.requested_ranges, [f'bytes={len(self.archive) + 8}-', None])
+
+    def test_incremental_extraction(self):
+        archive_path = self.cache.fetch(self.url)
+        target_dir = os.path.join(self.temp_dir.name, 'project')
+
+        self.assertEqual(extract_zip_incrementally(archive_path, target_dir), 2)
+        self.assertEqual(extract_zip_incrementally(archive_path, target_dir), 0)
+
+        with open(os.path.join(target_dir, 'root', 'b.h'), 'wb') as f:
+            f.write(b'broken')
+        os.remove(os.path.join(target_dir, '.rscpp-extracted'))
+
+        self.assertEqual(extract_zip_incrementally(archive_path, target_dir), 1)
+        with open(os.path.join(target_dir, 'root', 'b.h'), 'rb') as f:
+            self.assertEqual(f.read(), b'#pragma once')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,26 @@
+import os
+import tempfile
 import unittest
 
-from util.error_parser import parse_logs, AnalyzerError
+from util.error_parser import parse_logs, parse_log_file, group_errors, AnalyzerError, RUNTIME_ERROR_REGEX, strip_quotes
+
+
+def parse_whole_text(logs: str):
+    """
+    Reference matching of the whole log at once
+    """
+    return [AnalyzerError(analyzer, strip_quotes(message), strip_quotes(file_path))
+            for analyzer, message, file_path in (m.groups() for m in RUNTIME_ERROR_REGEX.finditer(logs))]
+
+
+def runtime_error(analyzer: str, file_path: str) -> str:
+    return (f"03:17:27.309 |E|     | JetPool(S) #3:25   | Analyzer '{analyzer}' threw the following exception: Unable to cast.\n"
+            "\n"
+            "--- EXCEPTION #1/2 [InvalidCastException]\n"
+            "Message = Unable to cast.\n"
+            "ExceptionPath = Root.InnerException\n"
+            "ClassName = System.InvalidCastException\n"
+            f"Data.File = {file_path}\n")
 
 
 class MyTestCase(unittest.TestCase):
@@ -33,6 +53,54 @@ class MyTestCase(unittest.TestCase):
             ),
         ])
 
+    def test_log_file_is_parsed_incrementally(self):
+        with open('samples/resharper-logs-1.err.log', encoding='cp1251') as f:
+            expected_errors = parse_whole_text(f.read())
+
+        self.assertEqual(len(expected_errors), 5)
+        self.assertEqual(list(parse_log_file('samples/resharper-logs-1.err.log')), expected_errors)
+
+    def test_errors_at_window_boundaries(self):
+        logs = (
+            # Error in the first lines, before the window is full
+            runtime_error("First", "a.cpp") +
+            # Adjacent error, starting right after the window is cleared
+            runtime_error("Second", "a.cpp") +
+            "Message = Analyzer 'Decoy' threw the following exception: not a runtime error.\n"
+            "ExceptionPath = Root\n" +
+            # Error starting inside the window of the decoy line
+            runtime_error("Third", "b.cpp") +
+            "\n" * 3 +
+            # Error in the last lines, without a trailing newline
+            runtime_error("Last", "c.cpp").rstrip("\n")
+        )
+        expected_errors = [AnalyzerError("First", "Unable to cast", "a.cpp"),
+                           AnalyzerError("Second", "Unable to cast", "a.cpp"),
+                           AnalyzerError("Third", "Unable to cast", "b.cpp"),
+                           AnalyzerError("Last", "Unable to cast", "c.cpp")]
+        self.assertEqual(parse_whole_text(logs), expected_errors)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, "resharper-stderr.log")
+            with open(log_path, 'w', encoding='cp1251', newline='') as f:
+                f.write(logs)
+            self.assertEqual(list(parse_log_file(log_path)), expected_errors)
+
+    def test_group_errors(self):
+        with open('samples/resharper-logs-1.err.log', encoding='cp1251') as f:
+            groups = group_errors(parse_logs(f.read()))
+
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(groups[0].count, 5)
+        self.assertEqual(groups[0].file_path, "<example>\\<range.v3.comprehension_conversion>\\comprehension_conversion.cpp")
+        self.assertEqual([analyzer.split(".")[-1] for analyzer in groups[0].analyzers], [
+            "CppConversionErrorsAnalyzer",
+            "CppDeprecatedAttributeAnalyzer",
+            "CppExpressionErrorsAnalyzer",
+            "CppBinaryExpressionAnalyzer",
+            "CppOverloadingErrorsAnalyzer",
+        ])
+
     def _test_one(self, file_path, expected_errors):
         with open(file_path, encoding='cp1251') as f:
             log = f.read()
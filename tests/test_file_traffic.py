@@ -0,0 +1,41 @@
+import os
+import tempfile
+import unittest
+
+from util.file_traffic import get_file_traffic, largest_increases, load_file_traffic, write_file_traffic
+
+
+class FileTrafficTestCase(unittest.TestCase):
+    def test_get_file_traffic(self):
+        self.assertEqual(get_file_traffic({"FileAmounts": {"a.cpp": 3 << 20}}), {"a.cpp": 3.0})
+        self.assertEqual(get_file_traffic({}), {})
+
+    def test_roundtrip(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_traffic_path = os.path.join(temp_dir, "traffic.json")
+            self.assertIsNone(load_file_traffic(file_traffic_path))
+
+            write_file_traffic(file_traffic_path, {"a.cpp": 1.5})
+            self.assertEqual(load_file_traffic(file_traffic_path), {"a.cpp": 1.5})
+
+    def test_largest_increases(self):
+        old = {"big.cpp": 1000.0, "small.cpp": 10.0, "tiny.cpp": 0.1, "faster.cpp": 50.0, "removed.cpp": 5.0}
+        new = {"big.cpp": 1020.0, "small.cpp": 15.0, "tiny.cpp": 1.0, "faster.cpp": 40.0, "added.cpp": 100.0}
+
+        by_absolute, by_relative = largest_increases(old, new)
+        self.assertEqual([change.file for change in by_absolute], ["big.cpp", "small.cpp", "tiny.cpp"])
+        self.assertEqual(by_absolute[0].delta, 20.0)
+        # Tiny files are too noisy for relative comparison
+        self.assertEqual([change.file for change in by_relative], ["small.cpp", "big.cpp"])
+        self.assertEqual(by_relative[0].relative_delta, 50.0)
+
+    def test_top(self):
+        old = {f"{i}.cpp": 10.0 for i in range(10)}
+        new = {f"{i}.cpp": 10.0 + i for i in range(10)}
+        by_absolute, by_relative = largest_increases(old, new, top=3)
+        self.assertEqual([change.file for change in by_absolute], ["9.cpp", "8.cpp", "7.cpp"])
+        self.assertEqual(len(by_relative), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Fixes a source file and writes a tool to BUILD_DIR like fix-reactos, counts its runs
+FIXUP_SCRIPT = '''
+import os
+with open("main.cpp", "w") as f:
+    f.write("int main() { return 0; }\\n")
+os.makedirs(os.path.join(os.environ["BUILD_DIR"], "bin"), exist_ok=True)
+open(os.path.join(os.environ["BUILD_DIR"], "bin", "tool.exe"), "w").close()
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "runs.txt"), "a") as f:
+    f.write("run\\n")
+'''
+
+APPLY_FIXUPS = '''
+import json, os, sys
+import common
+target_dir, fixup_script, build_dir = sys.argv[1:4]
+common.load_env(common.argparser.parse_args(["--build-dir", build_dir]))
+common.apply_fixup_sources(target_dir, fixup_script, build_dir)
+print(json.dumps({"tool": os.path.exists(os.path.join(build_dir, "bin", "tool.exe"))}))
+'''
+
+
+class FixupSourcesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.target_dir = os.path.join(self.temp_dir.name, "project")
+        os.makedirs(self.target_dir)
+        with open(os.path.join(self.target_dir, "main.cpp"), 'w') as f:
+            f.write("int main() { return 1 }\n")
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@localhost"]
+        subprocess.run(git + ["init", "-q"], cwd=self.target_dir, check=True)
+        subprocess.run(git + ["add", "main.cpp"], cwd=self.target_dir, check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "initial"], cwd=self.target_dir, check=True)
+
+        self.fixup_script = os.path.join(self.temp_dir.name, "fix-project.py")
+        with open(self.fixup_script, 'w') as f:
+            f.write(FIXUP_SCRIPT)
+        self.build_dir = os.path.join(self.target_dir, "build-2022-x64")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def apply_fixups(self) -> dict:
+        output = subprocess.check_output([sys.executable, "-c", APPLY_FIXUPS, self.target_dir, self.fixup_script, self.build_dir],
+                                         cwd=ROOT_DIR, text=True)
+        return json.loads(output.splitlines()[-1])
+
+    def runs_count(self) -> int:
+        with open(os.path.join(self.temp_dir.name, "runs.txt")) as f:
+            return len(f.readlines())
+
+    def test_script_is_applied_again_for_wiped_build_dir(self):
+        self.assertEqual(self.apply_fixups(), {"tool": True})
+        self.assertEqual(self.apply_fixups(), {"tool": True})
+        self.assertEqual(self.runs_count(), 1)
+
+        shutil.rmtree(self.build_dir)
+        self.assertEqual(self.apply_fixups(), {"tool": True})
+        self.assertEqual(self.runs_count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
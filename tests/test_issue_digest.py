@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from util.issue_digest import DIGEST_VERSION, DigestBuilder, DigestDiff, churn_summary, iter_churn, iter_digest, known_errors_issues, only_errors, read_digest_version
+
+
+class IssueDigestTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_round_trip(self):
+        # Small chunks to check merging of spilled chunks
+        builder = DigestBuilder(chunk_size=2)
+        builder.add("b.cpp", 10, "CppCompileError", "ERROR", "Expected expression")
+        builder.add("a.cpp", 3, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive")
+        builder.add("b.cpp", 4, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive")
+        builder.add("b.cpp", 4, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive")
+        builder.add("a.cpp", 3, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive")
+
+        digest_path = os.path.join(self.temp_dir.name, "digest.gz")
+        builder.write(digest_path, "243.0")
+
+        with gzip.open(digest_path, 'rt') as f:
+            header = json.loads(f.readline())
+        self.assertEqual(header["tool_version"], "243.0")
+        self.assertEqual(read_digest_version(digest_path), DIGEST_VERSION)
+
+        issues = list(iter_digest(digest_path))
+        self.assertEqual(issues, [("a.cpp", 3, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive"),
+                                  ("b.cpp", 4, "CppUnusedIncludeDirective", "WARNING", "Possibly unused #include directive"),
+                                  ("b.cpp", 10, "CppCompileError", "ERROR", "Expected expression")])
+        self.assertEqual(list(only_errors(iter_digest(digest_path))), [("b.cpp", 10, "", "ERROR", "Expected expression")])
+
+    def test_old_version(self):
+        digest_path = os.path.join(self.temp_dir.name, "digest.gz")
+        with gzip.open(digest_path, 'wt') as f:
+            json.dump({"version": 1, "tool_version": None, "files": [], "types": [], "messages": [], "issues": []}, f)
+
+        self.assertEqual(read_digest_version(digest_path), 1)
+        with self.assertRaises(ValueError):
+            list(iter_digest(digest_path))
+
+    def test_churn(self):
+        old = sorted([("a.cpp", 1, "CppCompileError", "ERROR", "first"),
+                      ("a.cpp", 2, "CppUnusedIncludeDirective", "WARNING", "unused")])
+        new = sorted([("a.cpp", 1, "CppCompileError", "ERROR", "first"),
+                      ("a.cpp", 5, "CppUnusedIncludeDirective", "WARNING", "unused"),
+                      ("b.cpp", 7, "CppUseAuto", "SUGGESTION", "auto")])
+
+        self.assertEqual(list(iter_churn(old, new)), [("removed", old[1]), ("added", new[1]), ("added", new[2])])
+        self.assertEqual(churn_summary(old, new), DigestDiff(old, new).summary())
+
+    def test_diff(self):
+        old = [("a.cpp", 1, "CppCompileError", "ERROR", "first"),
+               ("a.cpp", 2, "CppUnusedIncludeDirective", "WARNING", "unused")]
+        new = [("a.cpp", 1, "CppCompileError", "ERROR", "first"),
+               ("a.cpp", 5, "CppUnusedIncludeDirective", "WARNING", "unused"),
+               ("b.cpp", 7, "CppUseAuto", "SUGGESTION", "auto")]
+
+        diff = DigestDiff(old, new, max_issues=1)
+        self.assertEqual(diff.issues["removed"], [("a.cpp", 2, "CppUnusedIncludeDirective", "WARNING", "unused")])
+        self.assertEqual(diff.issues["added"], [("a.cpp", 5, "CppUnusedIncludeDirective", "WARNING", "unused")])
+        self.assertEqual((diff.added_count, diff.removed_count), (2, 1))
+        self.assertEqual(diff.summary(), {
+            "SUGGESTION": {"added": 1, "removed": 0},
+            "WARNING": {"added": 1, "removed": 1},
+        })
+
+    def test_only_errors_are_sorted_without_type(self):
+        # Sorted by TypeId, but not by message
+        issues = [("a.cpp", 1, "CppCompileError", "ERROR", "second"),
+                  ("a.cpp", 1, "CppUndeclaredIdentifier", "ERROR", "first"),
+                  ("a.cpp", 1, "CppUnusedIncludeDirective", "WARNING", "unused"),
+                  ("a.cpp", 2, "CppCompileError", "ERROR", "first"),
+                  ("a.cpp", 2, "CppUndeclaredIdentifier", "ERROR", "first")]
+
+        self.assertEqual(list(only_errors(issues)), [("a.cpp", 1, "", "ERROR", "first"),
+                                                     ("a.cpp", 1, "", "ERROR", "second"),
+                                                     ("a.cpp", 2, "", "ERROR", "first")])
+
+    def test_diff_with_known_errors(self):
+        known_errors = known_errors_issues([{"file": "a.cpp", "line": "1", "message": "first", "reason": "TODO"}])
+
+        digest_path = os.path.join(self.temp_dir.name, "digest.gz")
+        builder = DigestBuilder()
+        builder.add("a.cpp", 1, "CppCompileError", "ERROR", "first")
+        builder.add("a.cpp", 2, "CppUnusedIncludeDirective", "WARNING", "unused")
+        builder.write(digest_path)
+
+        diff = DigestDiff(known_errors, only_errors(iter_digest(digest_path)))
+        self.assertFalse(diff.added_count or diff.removed_count)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from util.locks import file_lock, is_file_locked
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOLD_LOCK = '''
+import sys, time
+from util.locks import file_lock
+with file_lock(sys.argv[1]):
+    print("locked", flush=True)
+    time.sleep(60)
+'''
+
+
+class FileLockTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.lock_path = os.path.join(self.temp_dir.name, "store.git.lock")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def start_holder(self) -> subprocess.Popen:
+        holder = subprocess.Popen([sys.executable, "-c", HOLD_LOCK, self.lock_path], cwd=ROOT_DIR, stdout=subprocess.PIPE, text=True)
+        self.assertEqual(holder.stdout.readline().strip(), "locked")
+        return holder
+
+    def test_reentry_after_release(self):
+        with file_lock(self.lock_path):
+            pass
+        with file_lock(self.lock_path, timeout=0):
+            pass
+
+    def test_timeout(self):
+        holder = self.start_holder()
+        try:
+            with self.assertRaises(TimeoutError):
+                with file_lock(self.lock_path, timeout=0):
+                    pass
+        finally:
+            holder.kill()
+            holder.wait()
+            holder.stdout.close()
+
+    def test_killed_owner(self):
+        holder = self.start_holder()
+        holder.kill()
+        holder.wait()
+        holder.stdout.close()
+
+        start = time.time()
+        with file_lock(self.lock_path, timeout=5):
+            pass
+        self.assertLess(time.time() - start, 5)
+
+    def test_is_file_locked(self):
+        self.assertFalse(is_file_locked(self.lock_path))
+        with file_lock(self.lock_path):
+            self.assertTrue(is_file_locked(self.lock_path))
+        self.assertFalse(is_file_locked(self.lock_path))
+
+        holder = self.start_holder()
+        self.assertTrue(is_file_locked(self.lock_path))
+        holder.kill()
+        holder.wait()
+        holder.stdout.close()
+        self.assertFalse(is_file_locked(self.lock_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
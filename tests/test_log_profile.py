@@ -0,0 +1,40 @@
+import unittest
+
+from util.log_profile import build_profile, inspection_spans, profile_log_file
+
+LOG = '''23:59:58.000 |I| SolutionLoader                | InspectCode.Main:4 | Loading solution LLVM.sln
+23:59:59.500 |I| SolutionLoader                | InspectCode.Main:4 | Solution loaded
+00:00:01.000 |I| CppIndexing                   | JetPool(S) #1:12   | Indexing ..\\clang\\lib\\Sema\\SemaExpr.cpp
+multiline continuation ..\\clang\\lib\\Basic\\ignored.cpp
+00:00:03.000 |I| CppIndexing                   | JetPool(S) #1:12   | Indexing ..\\clang\\lib\\AST\\Decl.cpp
+00:00:11.000 |I| CppDaemon                     | JetPool(S) #2:13   | Finished ..\\clang\\lib\\Sema\\SemaExpr.cpp
+00:00:12.000 |I| CppDaemon                     | JetPool(S) #2:13   | Finished ..\\clang\\lib\\AST\\Decl.cpp
+'''
+
+
+class LogProfileTestCase(unittest.TestCase):
+    def test_phases_and_files(self):
+        profile = build_profile(LOG.splitlines(keepends=True), [], top=2)
+
+        self.assertEqual(profile['log_time'], 14.0)
+        self.assertEqual([(p['name'], p['start'], p['duration'], p['count']) for p in profile['phases']], [
+            ('CppIndexing', 3.0, 2.0, 2),
+            ('SolutionLoader', 0.0, 1.5, 2),
+        ])
+        self.assertEqual([(f['name'], f['duration']) for f in profile['log_files']], [
+            ('..\\clang\\lib\\Sema\\SemaExpr.cpp', 10.0),
+            ('..\\clang\\lib\\AST\\Decl.cpp', 9.0),
+        ])
+        self.assertNotIn('inspected_files', profile)
+
+    def test_inspection_timeline(self):
+        timeline = [(100.0, 'a.cpp'), (101.0, 'b.cpp'), (111.0, 'c.cpp')]
+        self.assertEqual([(span.name, span.duration) for span in inspection_spans(timeline, 112.0)],
+                         [('a.cpp', 1.0), ('b.cpp', 10.0), ('c.cpp', 1.0)])
+
+        profile = profile_log_file('missing.log', timeline, 112.0, top=1)
+        self.assertEqual(profile, {'inspected_files': [{'name': 'b.cpp', 'start': 1.0, 'duration': 10.0, 'count': 1}]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import subprocess
+import sys
+import unittest
+
+from util.memory_ceiling import MemoryLimiter, find_memory_ceiling
+
+
+class MemoryCeilingTestCase(unittest.TestCase):
+    def test_binary_search(self):
+        ceiling, probes = find_memory_ceiling(lambda limit_mb: limit_mb >= 3000, min_mb=512, max_mb=16384, precision_mb=128)
+        self.assertGreaterEqual(ceiling, 3000)
+        self.assertLess(ceiling, 3000 + 128)
+        self.assertLessEqual(len(probes), 10)
+        self.assertEqual(probes[:2], [(16384, True), (512, False)])
+
+    def test_fails_at_max(self):
+        ceiling, probes = find_memory_ceiling(lambda limit_mb: False, min_mb=512, max_mb=4096, precision_mb=128)
+        self.assertIsNone(ceiling)
+        self.assertEqual(probes, [(4096, False)])
+
+    def test_passes_at_min(self):
+        ceiling, _ = find_memory_ceiling(lambda limit_mb: True, min_mb=512, max_mb=4096, precision_mb=128)
+        self.assertEqual(ceiling, 512)
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "RLIMIT_AS is used on Linux only")
+    def test_rlimit(self):
+        allocate = [sys.executable, '-c', 'data = bytearray(512 << 20)']
+        limiter = MemoryLimiter()
+
+        with limiter.limit(256) as (preexec_fn, _):
+            self.assertNotEqual(subprocess.run(allocate, preexec_fn=preexec_fn, stderr=subprocess.DEVNULL).returncode, 0)
+        with limiter.limit(2048) as (preexec_fn, _):
+            self.assertEqual(subprocess.run(allocate, preexec_fn=preexec_fn).returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from util.process_output import InspectionProgress, OutputCapture
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class ProcessOutputTestCase(unittest.TestCase):
+    def test_output_is_teed_and_counted(self):
+        script = "for i in range(500): print(f'Inspecting file{i}.cpp')\nprint('done')"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = os.path.join(temp_dir, 'stdout.log')
+            progress = InspectionProgress(expected_count=500)
+
+            process = subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+            capture = OutputCapture(process.stdout, log_path, tail_lines=10, on_line=progress.on_line)
+            self.assertEqual(process.wait(), 0)
+            capture.join()
+
+            self.assertEqual(progress.inspected_count, 500)
+            self.assertEqual(capture.line_count, 501)
+            self.assertTrue(capture.truncated)
+            self.assertEqual(capture.tail.splitlines(), [f'Inspecting file{i}.cpp' for i in range(491, 500)] + ['done'])
+            with open(log_path) as f:
+                self.assertEqual(len(f.readlines()), 501)
+
+    def test_eta(self):
+        clock = FakeClock()
+        progress = InspectionProgress(expected_count=100, clock=clock)
+        self.assertEqual(progress.describe(), "inspected 0/100 files (0.0%)")
+
+        progress.on_line("Inspecting a.cpp\n")
+        clock.now += 10
+        for _ in range(19):
+            progress.on_line("Inspecting b.cpp\n")
+        progress.on_line("Loading project\n")
+
+        self.assertEqual(progress.inspected_count, 20)
+        self.assertAlmostEqual(progress.files_per_second(), 2.0)
+        self.assertAlmostEqual(progress.eta(), 40.0)
+        self.assertEqual(progress.describe(), "inspected 20/100 files (20.0%), 2.00 files/sec, ETA 00:40")
+
+    def test_unknown_expected_count(self):
+        clock = FakeClock()
+        progress = InspectionProgress(clock=clock)
+        progress.on_line("Inspecting a.cpp\n")
+        clock.now += 1
+        self.assertIsNone(progress.eta())
+        self.assertEqual(progress.describe(), "inspected 1 files, 1.00 files/sec")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from util.report_merge import merge_reports, parse_solution_projects, select_projects, split_into_shards
+
+SLN = '''Microsoft Visual Studio Solution File, Format Version 12.00
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "clangAST", "tools\\clangAST.vcxproj", "{11111111-0000-0000-0000-000000000001}"
+EndProject
+Project("{2150E333-8FDC-42A3-9474-1A3956D46DE8}") = "Clang libraries", "Clang libraries", "{11111111-0000-0000-0000-000000000002}"
+EndProject
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "clangSema", "tools\\clangSema.vcxproj", "{11111111-0000-0000-0000-000000000003}"
+EndProject
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "LLVMSupport", "lib\\LLVMSupport.vcxproj", "{11111111-0000-0000-0000-000000000004}"
+EndProject
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "clangBasic", "tools\\clangBasic.vcxproj", "{11111111-0000-0000-0000-000000000005}"
+EndProject
+'''
+
+
+def make_report(issue_types, projects) -> str:
+    issue_types_xml = "".join(f'<IssueType Id="{type_id}" Severity="{severity}"/>' for type_id, severity in issue_types)
+    projects_xml = "".join(f'<Project Name="{name}">' + "".join(
+        f'<Issue TypeId="{type_id}" File="{file}" Line="{line}" Message="{message}"/>' for type_id, file, line, message in issues) + '</Project>'
+        for name, issues in projects.items())
+    return f'<Report ToolsVersion="243.0"><Information/><IssueTypes>{issue_types_xml}</IssueTypes><Issues>{projects_xml}</Issues></Report>'
+
+
+class ReportMergeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, name, content) -> str:
+        file_path = os.path.join(self.temp_dir.name, name)
+        with open(file_path, 'w') as f:
+            f.write(content)
+        return file_path
+
+    def test_sharding(self):
+        projects = parse_solution_projects(self.write('LLVM.sln', SLN))
+        self.assertEqual(projects, ['clangAST', 'clangSema', 'LLVMSupport', 'clangBasic'])
+
+        selected = select_projects(projects, ["clang*"])
+        self.assertEqual(selected, ['clangAST', 'clangSema', 'clangBasic'])
+        self.assertEqual(select_projects(projects, None), projects)
+
+        shards = split_into_shards(selected, 2)
+        self.assertEqual(shards, [['clangAST', 'clangSema'], ['clangBasic']])
+        self.assertEqual(split_into_shards(selected, 8), [['clangAST'], ['clangBasic'], ['clangSema']])
+
+    def test_merge(self):
+        first = self.write('first.xml', make_report(
+            [("CppError", "ERROR")],
+            {"clangAST": [("CppError", "a.cpp", 1, "first"), ("CppError", "shared.h", 2, "shared")]}))
+        second = self.write('second.xml', make_report(
+            [("CppError", "ERROR"), ("CppWarning", "WARNING")],
+            {"clangSema": [("CppWarning", "b.cpp", 3, "second")], "clangAST": [("CppError", "shared.h", 2, "shared")]}))
+        empty = self.write('empty.xml', make_report([], {}))
+
+        merged_path = os.path.join(self.temp_dir.name, 'merged.xml')
+        merge_reports([first, second, empty], merged_path)
+
+        root = ET.parse(merged_path).getroot()
+        self.assertEqual(root.get("ToolsVersion"), "243.0")
+        self.assertEqual([t.get("Id") for t in root.find("IssueTypes")], ["CppError", "CppWarning"])
+        issues = {project.get("Name"): [issue.get("Message") for issue in project] for project in root.find("Issues")}
+        self.assertEqual(issues, {"clangAST": ["first", "shared"], "clangSema": ["second"]})
+
+    def test_merge_escaping(self):
+        message = 'Use "auto" & <braces>'
+        first = self.write('first.xml', '<Report ToolsVersion="243.0"><Information><Solution>LLVM.sln</Solution></Information>'
+                                        '<IssueTypes><IssueType Id="CppWarning" Severity="WARNING"/></IssueTypes><Issues>'
+                                        '<Project Name="clangAST"><Issue TypeId="CppWarning" File="a.cpp" Line="1" '
+                                        'Message="Use &quot;auto&quot; &amp; &lt;braces&gt;&#10;twice"/></Project></Issues></Report>')
+        merged_path = os.path.join(self.temp_dir.name, 'merged.xml')
+        merge_reports([first], merged_path)
+
+        root = ET.parse(merged_path).getroot()
+        self.assertEqual(root.find("Information/Solution").text, "LLVM.sln")
+        self.assertEqual(root.find("Issues/Project/Issue").get("Message"), message + "\ntwice")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+from util.report_parser import parse_report
+
+REPORT = '''<?xml version="1.0" encoding="utf-8"?>
+<Report ToolsVersion="243.0.20240901.072940">
+  <Information><Solution>LLVM.sln</Solution></Information>
+  <IssueTypes>
+    <IssueType Id="CppCompileError" Category="Compiler Errors" Severity="ERROR"/>
+    <IssueType Id="CppUnusedIncludeDirective" Category="Redundancies" Severity="WARNING"/>
+    <IssueType Id="CppClangTidyModernize" Category="Clang-Tidy" Severity="SUGGESTION"/>
+  </IssueTypes>
+  <Issues>
+    <Project Name="clangAST">
+      <Issue TypeId="CppCompileError" File="..\\clang\\lib\\AST\\a.cpp" Offset="1-2" Line="30" Message="Expected expression"/>
+      <Issue TypeId="CppUnusedIncludeDirective" File="..\\clang\\lib\\AST\\a.cpp" Offset="3-4" Line="2" Message="Possibly unused #include directive"/>
+      <Issue TypeId="CppUnusedIncludeDirective" File="..\\clang\\lib\\AST\\b.cpp" Offset="3-4" Message="Possibly unused #include directive" Severity="ERROR"/>
+    </Project>
+    <Project Name="clangSema">
+      <Issue TypeId="CppClangTidyModernize" File="..\\clang\\lib\\Sema\\c.cpp" Offset="5-6" Line="7" Message="Use auto"/>
+      <Issue TypeId="CppCompileError" File="..\\clang\\lib\\AST\\a.cpp" Offset="1-2" Line="30" Message="Expected expression"/>
+      <Issue TypeId="CppLateType" File="..\\clang\\lib\\Sema\\d.cpp" Offset="5-6" Line="9" Message="Late"/>
+    </Project>
+  </Issues>
+  <IssueTypes>
+    <IssueType Id="CppLateType" Severity="ERROR"/>
+  </IssueTypes>
+</Report>
+'''
+
+EMPTY_REPORT = '''<Report ToolsVersion="243.0"><IssueTypes/><Issues/></Report>'''
+
+
+def parse_report_reference(report_file):
+    # Former DOM-based implementation of check_report
+    xml_doc = ET.parse(report_file)
+    issue_severities = {issue_type.get("Id"): issue_type.get("Severity")
+                        for issue_types in xml_doc.getroot().findall("IssueTypes") for issue_type in issue_types}
+    issue_nodes = xml_doc.getroot().findall("Issues")[0]
+    errors = set((issue.get("File"), int(issue.get("Line", "0")), issue.get("Message"))
+                 for issue in issue_nodes.iter("Issue")
+                 if (issue.get("Severity") or issue_severities[issue.get("TypeId")]) == 'ERROR')
+    return xml_doc.getroot().attrib['ToolsVersion'], len(issue_nodes), errors
+
+
+class ReportParserTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, content) -> str:
+        report_file = os.path.join(self.temp_dir.name, 'resharper-report.xml')
+        with open(report_file, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return report_file
+
+    def test_same_as_dom_parser(self):
+        for content in (REPORT, EMPTY_REPORT):
+            report_file = self.write(content)
+            parsed = parse_report(report_file)
+            self.assertEqual((parsed.tool_version, parsed.projects_count, parsed.errors), parse_report_reference(report_file))
+
+    def test_tally(self):
+        seen = []
+        parsed = parse_report(self.write(REPORT), tally=True, on_issue=lambda issue, severity: seen.append((issue.get("TypeId"), severity)))
+
+        self.assertEqual(parsed.errors, {
+            ("..\\clang\\lib\\AST\\a.cpp", 30, "Expected expression"),
+            ("..\\clang\\lib\\AST\\b.cpp", 0, "Possibly unused #include directive"),
+            ("..\\clang\\lib\\Sema\\d.cpp", 9, "Late"),
+        })
+        self.assertEqual(parsed.severity_counts, {'ERROR': 4, 'WARNING': 1, 'SUGGESTION': 1})
+        self.assertEqual(parsed.type_counts, {'CppCompileError': 2, 'CppUnusedIncludeDirective': 2, 'CppClangTidyModernize': 1, 'CppLateType': 1})
+        self.assertEqual(len(seen), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from util.resource_sampler import ResourceSampler, is_sampling_supported, read_process_sample
+
+
+@unittest.skipUnless(is_sampling_supported(), "requires /proc or psutil")
+class ResourceSamplerTestCase(unittest.TestCase):
+    def test_samples_stand_in_process(self):
+        # Stand-in for inspectcode: allocates ~64 MB, burns some CPU and exits
+        script = "import time\ndata = bytearray(64 << 20)\nfor i in range(len(data) // 4096): data[i * 4096] = 1\n" \
+                 "end = time.time() + 0.5\nwhile time.time() < end: pass\ntime.sleep(0.3)"
+        process = subprocess.Popen([sys.executable, '-c', script])
+
+        sampler = ResourceSampler(interval=0.05)
+        sampler.attach("stand-in", process.pid)
+        sampler.start()
+        process.wait()
+        summary = sampler.stop()
+
+        stats = summary["stand-in"]
+        self.assertGreater(stats['samples'], 5)
+        self.assertGreaterEqual(stats['peak_rss_mb'], 64)
+        self.assertGreater(stats['cpu_user_time'] + stats['cpu_system_time'], 0.2)
+        self.assertGreater(stats['average_cpu_utilization'], 0.2)
+        self.assertGreaterEqual(stats['max_threads'], 1)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            timeline_path = os.path.join(temp_dir, 'resources.jsonl')
+            sampler.write_timeline(timeline_path)
+            with open(timeline_path) as f:
+                rows = [json.loads(line) for line in f]
+
+        self.assertEqual(len(rows), stats['samples'])
+        self.assertEqual({row['process'] for row in rows}, {"stand-in"})
+        self.assertEqual([row['timestamp'] for row in rows], sorted(row['timestamp'] for row in rows))
+
+    def test_exited_process(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        time.sleep(0.1)
+        self.assertIsNone(read_process_sample(process.pid))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import stat
+import subprocess
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SLN = '''Microsoft Visual Studio Solution File, Format Version 12.00
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "clangAST", "clangAST.vcxproj", "{11111111-0000-0000-0000-000000000001}"
+EndProject
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "clangSema", "clangSema.vcxproj", "{11111111-0000-0000-0000-000000000002}"
+EndProject
+Project("{8BC9CEB8-8B4A-11D0-8D11-00A0C91BC942}") = "LLVMSupport", "LLVMSupport.vcxproj", "{11111111-0000-0000-0000-000000000003}"
+EndProject
+'''
+
+# Writes a report with an error in every requested project and in a header shared by all of them
+STUB_INSPECTCODE = '''#!{python}
+import sys
+
+args = sys.argv[1:]
+report_file = next(arg[len("-o="):] for arg in args if arg.startswith("-o="))
+projects = [arg[len("--project="):] for arg in args if arg.startswith("--project=")]
+with open(report_file, "w") as f:
+    f.write('<Report ToolsVersion="243.0"><Information/><IssueTypes><IssueType Id="CppError" Severity="ERROR"/></IssueTypes><Issues>')
+    for project in projects:
+        print(f"Inspecting {{project}}.cpp", flush=True)
+        f.write(f'<Project Name="{{project}}"><Issue TypeId="CppError" File="{{project}}.cpp" Line="1" Message="error"/></Project>')
+    f.write('<Project Name="shared"><Issue TypeId="CppError" File="shared.h" Line="2" Message="shared"/></Project>')
+    f.write('</Issues></Report>')
+'''
+
+RUN_SHARDED = '''
+import json, sys
+build_dir, project_dir, sln_file, caches_home = sys.argv[1:5]
+sys.argv = ["CorrectnessTest.py", "--build-dir", build_dir, "--sample-interval", "0"]
+import CorrectnessTest
+report_file, err_file, files_count, resources, profile = CorrectnessTest.run_inspect_code_sharded(
+    project_dir, sln_file, None, None, True, caches_home, 2)
+print(json.dumps({"report_file": report_file, "files_count": files_count, "shards": len(profile["shards"])}))
+'''
+
+SEARCH_MEMORY_CEILING = '''
+import json, sys
+build_dir, project_dir, sln_file, caches_home = sys.argv[1:5]
+sys.argv = ["CorrectnessTest.py", "--build-dir", build_dir, "--sample-interval", "0",
+            "--memory-ceiling-min", "1024", "--memory-ceiling-max", "2048", "--memory-ceiling-precision", "1024"]
+import CorrectnessTest
+ceiling = CorrectnessTest.search_memory_ceiling(project_dir, sln_file, "clangAST", None, True, caches_home, 1, None)
+print(json.dumps({"ceiling": ceiling}))
+'''
+
+
+@unittest.skipUnless(os.name == 'posix', "stub inspectcode is a script with shebang")
+class RunInspectCodeTestCase(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        temp_dir = self._temp_dir.name
+        self.build_dir = os.path.join(temp_dir, "build")
+        self.project_dir = os.path.join(temp_dir, "project")
+        self.caches_home = os.path.join(temp_dir, "caches")
+        os.makedirs(self.build_dir)
+        os.makedirs(self.project_dir)
+
+        inspect_code_path = os.path.join(self.build_dir, "inspectcode.exe")
+        with open(inspect_code_path, 'w') as f:
+            f.write(STUB_INSPECTCODE.format(python=sys.executable))
+        os.chmod(inspect_code_path, os.stat(inspect_code_path).st_mode | stat.S_IEXEC)
+
+        self.sln_file = os.path.join(self.project_dir, "LLVM.sln")
+        with open(self.sln_file, 'w') as f:
+            f.write(SLN)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def run_script(self, script: str) -> dict:
+        output = subprocess.check_output([sys.executable, "-c", script, self.build_dir, self.project_dir, self.sln_file, self.caches_home],
+                                         cwd=ROOT_DIR, text=True)
+        return json.loads(output.splitlines()[-1])
+
+    def test_sharded_run(self):
+        result = self.run_script(RUN_SHARDED)
+
+        self.assertEqual(result["report_file"], os.path.join(self.project_dir, "resharper-report.xml"))
+        self.assertEqual(result["files_count"], 3)
+        self.assertEqual(result["shards"], 2)
+
+        root = ET.parse(result["report_file"]).getroot()
+        issues = {project.get("Name"): [issue.get("File") for issue in project] for project in root.find("Issues")}
+        self.assertEqual(issues, {"clangAST": ["clangAST.cpp"], "clangSema": ["clangSema.cpp"], "LLVMSupport": ["LLVMSupport.cpp"],
+                                  "shared": ["shared.h"]})
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), "memory ceiling search is supported on Linux only")
+    def test_memory_ceiling_probes_keep_outputs(self):
+        report_file = os.path.join(self.project_dir, "resharper-report.xml")
+        with open(report_file, 'w') as f:
+            f.write("checked run")
+
+        result = self.run_script(SEARCH_MEMORY_CEILING)
+
+        self.assertEqual(result["ceiling"], 1024)
+        with open(report_file) as f:
+            self.assertEqual(f.read(), "checked run")
+        self.assertEqual(sorted(os.listdir(self.project_dir)), ["LLVM.sln", "resharper-report.xml"])
+
+
+if __name__ == '__main__':
+    unittest.main()
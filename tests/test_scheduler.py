@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from util.scheduler import Resources, ResourceScheduler, ScheduledTask
+
+
+class ResourceSchedulerTestCase(unittest.TestCase):
+    def test_respects_memory_budget(self):
+        tasks = [
+            ScheduledTask('LLVM', ('LLVM',), Resources(1, 32)),
+            ScheduledTask('rocksdb', ('rocksdb',), Resources(1, 24)),
+            ScheduledTask('args', ('args',), Resources(1, 2)),
+            ScheduledTask('fmtlib', ('fmtlib',), Resources(1, 2)),
+        ]
+        overlaps, peak_usage = self._run(tasks, Resources(8, 40), max_jobs=4)
+        self.assertNotIn({'LLVM', 'rocksdb'}, overlaps)
+        self.assertTrue(peak_usage.fits(Resources(8, 40)), peak_usage)
+        self.assertGreaterEqual(peak_usage.memory, 32)
+
+    def test_respects_max_jobs_and_locks(self):
+        tasks = [
+            ScheduledTask('args', ('args',), Resources(1, 1), lock='args'),
+            ScheduledTask('args:master', ('args:master',), Resources(1, 1), lock='args'),
+            ScheduledTask('fmtlib', ('fmtlib',), Resources(1, 1)),
+            ScheduledTask('cds', ('cds',), Resources(1, 1)),
+        ]
+        overlaps, peak_usage = self._run(tasks, Resources(8, 8), max_jobs=2)
+        self.assertNotIn({'args', 'args:master'}, overlaps)
+        self.assertEqual(max(len(overlap) for overlap in overlaps), 2)
+        self.assertTrue(peak_usage.fits(Resources(8, 8)), peak_usage)
+
+    def test_oversized_task_runs_alone(self):
+        tasks = [
+            ScheduledTask('LLVM', ('LLVM',), Resources(64, 128)),
+            ScheduledTask('args', ('args',), Resources(1, 2)),
+        ]
+        overlaps, peak_usage = self._run(tasks, Resources(8, 16), max_jobs=2)
+        self.assertTrue(all(len(overlap) == 1 for overlap in overlaps))
+        self.assertEqual(peak_usage, Resources(8, 16))
+
+    def _run(self, tasks, capacity, max_jobs):
+        """
+        Returns sets of tasks running at once and peak usage of resources by running tasks
+        """
+        lock = threading.Lock()
+        running = set()
+        overlaps = []
+        # Resources of tasks are clamped to the capacity by the scheduler, so they are looked up while running
+        tasks_by_key = {task.key: task for task in tasks}
+        usage = Resources(0, 0)
+        peak_usage = Resources(0, 0)
+
+        def fn(key):
+            nonlocal usage, peak_usage
+            with lock:
+                running.add(key)
+                overlaps.append(set(running))
+                usage += tasks_by_key[key].resources
+                peak_usage = Resources(max(peak_usage.cpu, usage.cpu), max(peak_usage.memory, usage.memory))
+            time.sleep(0.05)
+            with lock:
+                running.remove(key)
+                usage -= tasks_by_key[key].resources
+            return key
+
+        scheduler = ResourceScheduler(capacity, max_jobs)
+        with ThreadPoolExecutor(max_workers=max_jobs) as executor:
+            finished = {task.key: future.result() for task, future in scheduler.run(executor, fn, tasks)}
+
+        self.assertEqual(finished, {task.key: task.key for task in tasks})
+        return overlaps, peak_usage
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import json
+import os
+import tempfile
+import unittest
+
+from util.trace_inspector import diff_cpu_profiles, format_diff, get_build_dir, get_cpu_command, get_cpu_profile, get_diff_command, get_inspect_command, \
+    get_good_snapshot, get_source_hash, iter_cpu_profiles, keep_good_snapshot, parse_output, resolve_snapshot
+
+
+class TraceInspectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.source_dir = self._temp_dir.name
+        self._write("Program.cs", "Console.WriteLine();")
+        self._write("TraceInspector.csproj", "<Project/>")
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _write(self, file_name: str, text: str):
+        with open(os.path.join(self.source_dir, file_name), 'w') as f:
+            f.write(text)
+
+    def test_source_hash(self):
+        source_hash = get_source_hash(self.source_dir)
+
+        # Build outputs and unrelated files don't matter
+        os.makedirs(os.path.join(self.source_dir, "bin"))
+        self._write("README.md", "readme")
+        self.assertEqual(get_source_hash(self.source_dir), source_hash)
+
+        self._write("Program.cs", "Console.WriteLine(1);")
+        self.assertNotEqual(get_source_hash(self.source_dir), source_hash)
+
+    def test_build_dir(self):
+        self.assertEqual(get_build_dir(self.source_dir, "cache"), os.path.join("cache", get_source_hash(self.source_dir)))
+
+    def test_inspect_command(self):
+        self.assertEqual(get_inspect_command("TraceInspector.dll", ["a.dtt", "b.dtt"], top=5),
+                         ["dotnet", "TraceInspector.dll", "--top", "5", "a.dtt", "b.dtt"])
+        self.assertEqual(get_inspect_command("TraceInspector.dll", ["a.dtt"], stacks=True),
+                         ["dotnet", "TraceInspector.dll", "--top", "20", "--stacks", "a.dtt"])
+
+    def test_inspect_command_with_timelines(self):
+        self.assertEqual(get_inspect_command("TraceInspector.dll", ["a.dtt", "b.dtt"], timelines={"b.dtt": "b.json"}),
+                         ["dotnet", "TraceInspector.dll", "--top", "20", "a.dtt", "--timeline", "b.json", "b.dtt"])
+
+    def test_parse_output(self):
+        output = "\n".join(json.dumps({"Snapshot": snapshot, "Error": None, "AllocationAmount": amount})
+                           for snapshot, amount in (("a.dtt", 1), ("b.dtt", 2)))
+        stats = parse_output(output + "\n")
+        self.assertEqual(stats["a.dtt"]["AllocationAmount"], 1)
+        self.assertEqual(stats["b.dtt"]["AllocationAmount"], 2)
+
+    def test_parse_error(self):
+        output = json.dumps({"Snapshot": "a.dtt", "Error": "Invalid file"})
+        with self.assertRaisesRegex(RuntimeError, "a.dtt: Invalid file"):
+            parse_output(output)
+
+    def test_resolve_snapshot(self):
+        run_dir = os.path.join(self.source_dir, "LLVM-2022-x64")
+        os.makedirs(run_dir)
+        snapshot_path = os.path.join(run_dir, "snapshot.dtt")
+        self._write(snapshot_path, "")
+
+        self.assertEqual(resolve_snapshot(snapshot_path, "unused"), snapshot_path)
+        self.assertEqual(resolve_snapshot("LLVM-2022-x64", self.source_dir), snapshot_path)
+        self.assertEqual(resolve_snapshot(os.path.join("LLVM-2022-x64", "snapshot.dtt"), self.source_dir), snapshot_path)
+        with self.assertRaises(FileNotFoundError):
+            resolve_snapshot("cds", self.source_dir)
+
+    def test_keep_good_snapshot(self):
+        for content in ("first", "second"):
+            run_dir = os.path.join(self.source_dir, "LLVM-2022-x64")
+            os.makedirs(run_dir)
+            self._write(os.path.join(run_dir, "snapshot.dtt"), content)
+            good_dir = keep_good_snapshot(run_dir, self.source_dir)
+            self.assertFalse(os.path.exists(run_dir))
+
+        good_snapshot = get_good_snapshot(os.path.join(self.source_dir, "LLVM-2022-x64", "snapshot.dtt"), self.source_dir)
+        self.assertEqual(good_snapshot, os.path.join(good_dir, "snapshot.dtt"))
+        with open(good_snapshot) as f:
+            self.assertEqual(f.read(), "second")
+        with self.assertRaises(FileNotFoundError):
+            get_good_snapshot(os.path.join(self.source_dir, "cds", "snapshot.dtt"), self.source_dir)
+
+    def test_diff_command(self):
+        self.assertEqual(get_diff_command("TraceInspector.dll", "a.dtt", "b.dtt", top=5, folded_path="diff.folded"),
+                         ["dotnet", "TraceInspector.dll", "diff", "--top", "5", "--folded", "diff.folded", "a.dtt", "b.dtt"])
+
+    def test_format_diff(self):
+        mb = 1 << 20
+        diff = {
+            "OldAmount": 100 * mb,
+            "NewAmount": 110 * mb,
+            "TypeDeltas": [{"TypeName": "System.String", "OldAmount": 10 * mb, "NewAmount": 20 * mb, "Delta": 10 * mb}],
+            "StackDeltas": [{"Frames": ["Leaf", "Root"], "OldAmount": 0, "NewAmount": 10 * mb, "Delta": 10 * mb}],
+        }
+        lines = format_diff(diff).splitlines()
+        self.assertEqual(lines[0], "Traffic: 100.0 MB -> 110.0 MB (+10.0 MB)")
+        self.assertIn("+10.0 MB  (10.0 -> 20.0 MB)  System.String", lines[2])
+        self.assertEqual(lines[-2:], ["      Leaf", "      Root"])
+
+    def test_cpu_command(self):
+        self.assertEqual(get_cpu_command("TraceInspector.dll", ["a.nettrace", "b.nettrace"], top=5),
+                         ["dotnet", "TraceInspector.dll", "cpu", "--top", "5", "a.nettrace", "b.nettrace"])
+
+    def test_cpu_profile(self):
+        cpu_stats = {"Snapshot": "a.nettrace", "TotalSamples": 200,
+                     "TopInclusive": [{"Method": "Main", "Samples": 200}, {"Method": "Parse", "Samples": 150}],
+                     "TopExclusive": [{"Method": "Parse", "Samples": 100}]}
+        self.assertEqual(get_cpu_profile(cpu_stats), {
+            'samples': 200,
+            'inclusive': [{'method': "Main", 'samples': 200, 'percent': 100.0}, {'method': "Parse", 'samples': 150, 'percent': 75.0}],
+            'exclusive': [{'method': "Parse", 'samples': 100, 'percent': 50.0}],
+        })
+
+    def test_cpu_diff(self):
+        old = {'exclusive': [{'method': "Parse", 'percent': 50.0}, {'method': "Lex", 'percent': 20.0}, {'method': "Old", 'percent': 1.0}]}
+        new = {'exclusive': [{'method': "Parse", 'percent': 40.0}, {'method': "Lex", 'percent': 35.0}]}
+        deltas = diff_cpu_profiles(old, new)
+        self.assertEqual([(delta['method'], delta['delta']) for delta in deltas], [("Lex", 15.0), ("Parse", -10.0), ("Old", -1.0)])
+        self.assertEqual(deltas[2]['new'], 0.0)
+
+    def test_iter_cpu_profiles(self):
+        full_report = {
+            "cds": {'toolchains': {"2019-x64": {'cpu_profile': {'samples': 1}}, "2022-x64": {}}},
+            "args": {},
+        }
+        self.assertEqual(list(iter_cpu_profiles(full_report)), [("cds/2019-x64", {'samples': 1})])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUN_PREPASS = '''
+import json, os, sys
+import common
+build_dir, vcpkg_dir, binary_cache_dir = sys.argv[1:4]
+common.load_env(common.argparser.parse_args(["--build-dir", build_dir, "--vcpkg-dir", vcpkg_dir, "--vcpkg-binary-cache", binary_cache_dir,
+                                             "--supported-generators", "2019-x64"]))
+common.projects["fake"] = {"required dependencies": ["zlib"]}
+thread = common.start_vcpkg_prepass([("fake", None)])
+installed = common.wait_for_vcpkg_prepass(["zlib"], "x64-windows")
+prepass_dir = os.environ[common.VCPKG_PREPASS_DIR_ENV]
+status_files = sorted(os.listdir(prepass_dir))
+common.finish_vcpkg_prepass(thread)
+print(json.dumps({"installed": installed, "status_files": status_files}))
+'''
+
+WAIT_FOR_DEAD_PREPASS = '''
+import json, os, sys
+import common
+prepass_dir = sys.argv[1]
+os.environ[common.VCPKG_PREPASS_DIR_ENV] = prepass_dir
+print(json.dumps({"installed": common.wait_for_vcpkg_prepass(["zlib"], "x64-windows")}))
+'''
+
+
+class VcpkgPrepassTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def run_script(self, script: str, *script_args: str) -> dict:
+        output = subprocess.check_output([sys.executable, "-c", script, *script_args], cwd=ROOT_DIR, text=True, timeout=60)
+        return json.loads(output.splitlines()[-1])
+
+    def test_missing_vcpkg(self):
+        vcpkg_dir = os.path.join(self.temp_dir.name, "vcpkg")
+        os.makedirs(vcpkg_dir)
+        result = self.run_script(RUN_PREPASS, self.temp_dir.name, vcpkg_dir, os.path.join(self.temp_dir.name, "binary-cache"))
+        self.assertEqual(result, {"installed": False, "status_files": ["prepass.lock", "x64-windows.failed", "x64-windows.json"]})
+
+    def test_dead_prepass(self):
+        prepass_dir = os.path.join(self.temp_dir.name, "prepass")
+        os.makedirs(prepass_dir)
+        with open(os.path.join(prepass_dir, "x64-windows.json"), 'w') as f:
+            json.dump(["zlib"], f)
+        open(os.path.join(prepass_dir, "x64-windows.pending"), 'w').close()
+
+        self.assertEqual(self.run_script(WAIT_FOR_DEAD_PREPASS, prepass_dir), {"installed": False})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,45 +1,495 @@
 using System.Text.Json;
+using Microsoft.Diagnostics.Tracing;
 using Microsoft.Diagnostics.Tracing.Etlx;
 using Microsoft.Diagnostics.Tracing.Parsers.Clr;
-using Microsoft.Diagnostics.Tracing.Stacks;
 
-var fileToConvert = args[0];
+// Usage: TraceInspector [--top N] [--stacks] [--timeline <timeline.json>] <snapshot.nettrace>...
+// Prints one JSON line per snapshot. Allocation stacks require conversion of the snapshot to ETLX,
+// so they are collected only with `--stacks`, otherwise the snapshot is streamed.
+// `--timeline` applies to the next snapshot and attributes its allocations to inspected files.
+//
+// Usage: TraceInspector diff [--top N] [--folded <output.folded>] <old.nettrace> <new.nettrace>
+// Prints JSON with allocation deltas per type and per stack sorted by impact.
+// `--folded` writes all stacks as `frame;frame;... old new` lines for differential flame graphs.
+//
+// Usage: TraceInspector cpu [--top N] <cpu-profile.nettrace>...
+// Prints one JSON line per `cpu-sampling` trace with the hottest managed methods by inclusive and exclusive samples.
+if (args.Length > 0 && args[0] == "diff")
+    return RunDiff(args[1..]);
+if (args.Length > 0 && args[0] == "cpu")
+    return RunCpuProfile(args[1..]);
 
-var etlxFilePath = TraceLog.CreateFromEventPipeDataFile(fileToConvert);
-using (var eventLog = new TraceLog(etlxFilePath))
+var top = 20;
+var collectStacks = false;
+var snapshots = new List<(string Path, string? Timeline)>();
+string? timeline = null;
+for (var i = 0; i < args.Length; i++)
 {
-    var stats = CalculateMemoryStats(eventLog);
-    var jsonString = JsonSerializer.Serialize(stats, new JsonSerializerOptions
+    if (args[i] == "--top" && i + 1 < args.Length)
+        top = int.Parse(args[++i]);
+    else if (args[i] == "--stacks")
+        collectStacks = true;
+    else if (args[i] == "--timeline" && i + 1 < args.Length)
+        timeline = args[++i];
+    else
     {
-        WriteIndented = true
-    });
-
-    Console.WriteLine(jsonString);
+        snapshots.Add((args[i], timeline));
+        timeline = null;
+    }
 }
 
-if (File.Exists(etlxFilePath))
+var exitCode = 0;
+foreach (var (snapshot, timelinePath) in snapshots)
 {
-    File.Delete(etlxFilePath);
+    MemoryStats stats;
+    try
+    {
+        var builder = new MemoryStatsBuilder(timelinePath != null ? FileTimeline.Load(timelinePath) : null);
+        if (collectStacks)
+            CalculateMemoryStatsWithStacks(snapshot, builder);
+        else
+            CalculateMemoryStats(snapshot, builder);
+        stats = builder.Build(top);
+    }
+    catch (Exception e)
+    {
+        Console.Error.WriteLine($"Cannot inspect {snapshot}: {e}");
+        stats = new MemoryStats { Error = e.Message };
+        exitCode = 1;
+    }
+
+    stats.Snapshot = snapshot;
+    Console.WriteLine(JsonSerializer.Serialize(stats));
 }
 
-return;
+return exitCode;
 
-static MemoryStats CalculateMemoryStats(TraceLog eventLog)
+static int RunDiff(string[] args)
 {
-    var stackSource = new MutableTraceEventStackSource(eventLog)
+    var top = 20;
+    string? foldedPath = null;
+    var snapshots = new List<string>();
+    for (var i = 0; i < args.Length; i++)
     {
-        OnlyManagedCodeStacks = true // EventPipe currently only has managed code stacks.
+        if (args[i] == "--top" && i + 1 < args.Length)
+            top = int.Parse(args[++i]);
+        else if (args[i] == "--folded" && i + 1 < args.Length)
+            foldedPath = args[++i];
+        else
+            snapshots.Add(args[i]);
+    }
+
+    if (snapshots.Count != 2)
+    {
+        Console.Error.WriteLine("Usage: TraceInspector diff [--top N] [--folded <output.folded>] <old.nettrace> <new.nettrace>");
+        return 2;
+    }
+
+    var oldBuilder = new MemoryStatsBuilder(null);
+    CalculateMemoryStatsWithStacks(snapshots[0], oldBuilder);
+    var newBuilder = new MemoryStatsBuilder(null);
+    CalculateMemoryStatsWithStacks(snapshots[1], newBuilder);
+
+    var stackDeltas = DiffAmounts(oldBuilder.StackAmounts, newBuilder.StackAmounts);
+    var diff = new AllocationDiff
+    {
+        Old = snapshots[0],
+        New = snapshots[1],
+        OldAmount = oldBuilder.AllocationAmount,
+        NewAmount = newBuilder.AllocationAmount,
+        TypeDeltas = DiffAmounts(oldBuilder.TypeAmounts, newBuilder.TypeAmounts)
+            .Take(top)
+            .Select(delta => new TypeAllocationDelta(delta.Key, delta.Old, delta.New))
+            .ToList(),
+        StackDeltas = stackDeltas
+            .Take(top)
+            .Select(delta => new StackAllocationDelta(newBuilder.GetFrames(delta.Key) ?? oldBuilder.GetFrames(delta.Key)!, delta.Old, delta.New))
+            .ToList(),
     };
+    Console.WriteLine(JsonSerializer.Serialize(diff, new JsonSerializerOptions { WriteIndented = true }));
+
+    if (foldedPath != null)
+    {
+        using var writer = new StreamWriter(foldedPath);
+        foreach (var (key, oldAmount, newAmount) in stackDeltas)
+        {
+            var frames = newBuilder.GetFrames(key) ?? oldBuilder.GetFrames(key)!;
+            // Folded stacks go from the root to the leaf, `;` is the frame separator
+            var folded = string.Join(";", Enumerable.Reverse(frames).Select(frame => frame.Replace(';', ':')));
+            writer.WriteLine($"{folded} {oldAmount} {newAmount}");
+        }
+    }
+
+    return 0;
+}
+
+static int RunCpuProfile(string[] args)
+{
+    var top = 20;
+    var traces = new List<string>();
+    for (var i = 0; i < args.Length; i++)
+    {
+        if (args[i] == "--top" && i + 1 < args.Length)
+            top = int.Parse(args[++i]);
+        else
+            traces.Add(args[i]);
+    }
+
+    var exitCode = 0;
+    foreach (var trace in traces)
+    {
+        CpuProfile profile;
+        try
+        {
+            profile = CalculateCpuProfile(trace, top);
+        }
+        catch (Exception e)
+        {
+            Console.Error.WriteLine($"Cannot inspect {trace}: {e}");
+            profile = new CpuProfile { Error = e.Message };
+            exitCode = 1;
+        }
+
+        profile.Snapshot = trace;
+        Console.WriteLine(JsonSerializer.Serialize(profile));
+    }
+
+    return exitCode;
+}
+
+static CpuProfile CalculateCpuProfile(string trace, int top)
+{
+    var profile = new CpuProfile();
+    var inclusiveSamples = new Dictionary<string, long>();
+    var exclusiveSamples = new Dictionary<string, long>();
+
+    var etlxFilePath = TraceLog.CreateFromEventPipeDataFile(trace, Path.ChangeExtension(trace, ".etlx"));
+    try
+    {
+        using (var eventLog = new TraceLog(etlxFilePath))
+        {
+            foreach (var sampleEvent in eventLog.Events)
+            {
+                if (sampleEvent.ProviderName != "Microsoft-DotNETCore-SampleProfiler")
+                    continue;
+
+                // Sample type 1 means that the thread is outside of managed code, e.g. it waits, so it isn't a managed hot spot
+                var sampleType = sampleEvent.PayloadByName("Type");
+                if (sampleType != null && Convert.ToInt32(sampleType) == 1)
+                    continue;
+
+                // Whole stack, otherwise inclusive samples of methods near the root are lost
+                var frames = GetManagedFrames(sampleEvent.CallStack(), int.MaxValue);
+                profile.TotalSamples++;
+                exclusiveSamples[frames[0]] = exclusiveSamples.GetValueOrDefault(frames[0]) + 1;
+                // Recursive methods are counted once per sample
+                foreach (var method in frames.Distinct())
+                    inclusiveSamples[method] = inclusiveSamples.GetValueOrDefault(method) + 1;
+            }
+        }
+    }
+    finally
+    {
+        if (File.Exists(etlxFilePath))
+        {
+            File.Delete(etlxFilePath);
+        }
+    }
+
+    profile.TopInclusive = TopMethods(inclusiveSamples, top);
+    profile.TopExclusive = TopMethods(exclusiveSamples, top);
+    return profile;
+}
+
+static List<MethodSamples> TopMethods(Dictionary<string, long> samples, int top)
+{
+    return samples
+        .OrderByDescending(pair => pair.Value)
+        .ThenBy(pair => pair.Key, StringComparer.Ordinal)
+        .Take(top)
+        .Select(pair => new MethodSamples(pair.Key, pair.Value))
+        .ToList();
+}
+
+// Sorted by absolute delta, descending
+static List<(string Key, long Old, long New)> DiffAmounts(IReadOnlyDictionary<string, long> oldAmounts, IReadOnlyDictionary<string, long> newAmounts)
+{
+    return oldAmounts.Keys
+        .Union(newAmounts.Keys)
+        .Select(key => (Key: key, Old: oldAmounts.GetValueOrDefault(key), New: newAmounts.GetValueOrDefault(key)))
+        .OrderByDescending(delta => Math.Abs(delta.New - delta.Old))
+        .ThenBy(delta => delta.Key, StringComparer.Ordinal)
+        .ToList();
+}
+
+static void CalculateMemoryStats(string snapshot, MemoryStatsBuilder builder)
+{
+    using (var source = new EventPipeEventSource(snapshot))
+    {
+        source.Clr.GCAllocationTick += gcTickEvent => builder.AddAllocation(gcTickEvent, null);
+        source.Clr.GCStart += builder.AddCollection;
+        source.Clr.GCSuspendEEStart += builder.StartPause;
+        source.Clr.GCRestartEEStop += builder.EndPause;
+        source.Clr.GCHeapStats += builder.AddHeapStats;
+        source.Process();
+    }
+}
+
+static void CalculateMemoryStatsWithStacks(string snapshot, MemoryStatsBuilder builder)
+{
+    // Next to the snapshot, so that concurrent runs don't clash
+    var etlxFilePath = TraceLog.CreateFromEventPipeDataFile(snapshot, Path.ChangeExtension(snapshot, ".etlx"));
+    try
+    {
+        using (var eventLog = new TraceLog(etlxFilePath))
+        {
+            foreach (var @event in eventLog.Events)
+            {
+                switch (@event)
+                {
+                    case GCAllocationTickTraceData gcTickEvent:
+                        builder.AddAllocation(gcTickEvent, GetManagedFrames(gcTickEvent.CallStack()));
+                        break;
+                    case GCStartTraceData gcStartEvent:
+                        builder.AddCollection(gcStartEvent);
+                        break;
+                    case GCSuspendEETraceData suspendEvent:
+                        builder.StartPause(suspendEvent);
+                        break;
+                    case GCHeapStatsTraceData heapStatsEvent:
+                        builder.AddHeapStats(heapStatsEvent);
+                        break;
+                    case GCNoUserDataTraceData restartEvent when restartEvent.EventName == "GC/RestartEEStop":
+                        builder.EndPause(restartEvent);
+                        break;
+                }
+            }
+        }
+    }
+    finally
+    {
+        if (File.Exists(etlxFilePath))
+        {
+            File.Delete(etlxFilePath);
+        }
+    }
+}
+
+// Frames from the allocating (or sampled) method to the root
+static List<string> GetManagedFrames(TraceCallStack? callStack, int maxDepth = 32)
+{
+    var frames = new List<string>();
+    for (var frame = callStack; frame != null && frames.Count < maxDepth; frame = frame.Caller)
+    {
+        var methodName = frame.CodeAddress.FullMethodName;
+        if (string.IsNullOrEmpty(methodName))
+            methodName = $"{frame.CodeAddress.ModuleName}!?";
+        frames.Add(methodName);
+    }
+
+    if (frames.Count == 0)
+        frames.Add("<no stack>");
+    return frames;
+}
+
+// Inspected files by the time of `Inspecting` line of inspectcode output
+internal class FileTimeline
+{
+    private readonly double[] _times;
+    private readonly string[] _files;
+
+    private FileTimeline(double[] times, string[] files)
+    {
+        _times = times;
+        _files = files;
+    }
+
+    // Timeline is written by CorrectnessTest.py as [[unix time in seconds, file], ...]
+    public static FileTimeline Load(string path)
+    {
+        var entries = JsonSerializer.Deserialize<List<List<JsonElement>>>(File.ReadAllText(path)) ?? new();
+        return new FileTimeline(entries.Select(entry => entry[0].GetDouble()).ToArray(),
+                                entries.Select(entry => entry[1].GetString() ?? "").ToArray());
+    }
+
+    // Files are inspected concurrently, so this is an approximation: the last file which has started before the event
+    public string? FindFile(DateTime timeStamp)
+    {
+        var time = (timeStamp.ToUniversalTime() - DateTime.UnixEpoch).TotalSeconds;
+        var index = Array.BinarySearch(_times, time);
+        if (index < 0)
+            index = ~index - 1;
+        return index >= 0 ? _files[index] : null;
+    }
+}
+
+internal class MemoryStatsBuilder
+{
+    private readonly MemoryStats _stats = new();
+    private readonly FileTimeline? _timeline;
+    private readonly Dictionary<string, long> _typeAmounts = new();
+    private readonly Dictionary<string, long> _stackAmounts = new();
+    private readonly Dictionary<string, List<string>> _stackFrames = new();
+    private double? _pauseStart;
+
+    public MemoryStatsBuilder(FileTimeline? timeline)
+    {
+        _timeline = timeline;
+    }
+
+    public long AllocationAmount => _stats.AllocationAmount;
+    public IReadOnlyDictionary<string, long> TypeAmounts => _typeAmounts;
+    public IReadOnlyDictionary<string, long> StackAmounts => _stackAmounts;
+
+    public List<string>? GetFrames(string stackKey) => _stackFrames.GetValueOrDefault(stackKey);
+
+    public void AddAllocation(GCAllocationTickTraceData gcTickEvent, List<string>? frames)
+    {
+        var amount = gcTickEvent.AllocationAmount64;
+        _stats.AllocationAmount += amount;
+
+        // GCAllocationKind: 0 - small object heap, 1 - large object heap, 2 - pinned object heap (.NET 5+)
+        switch ((int)gcTickEvent.AllocationKind)
+        {
+            case 0:
+                _stats.SmallObjectHeapAmount += amount;
+                break;
+            case 1:
+                _stats.LargeObjectHeapAmount += amount;
+                break;
+            default:
+                _stats.PinnedObjectHeapAmount += amount;
+                break;
+        }
+
+        var typeName = string.IsNullOrEmpty(gcTickEvent.TypeName) ? "<unknown>" : gcTickEvent.TypeName;
+        _typeAmounts[typeName] = _typeAmounts.GetValueOrDefault(typeName) + amount;
+
+        if (_timeline?.FindFile(gcTickEvent.TimeStamp) is { } file)
+            _stats.FileAmounts[file] = _stats.FileAmounts.GetValueOrDefault(file) + amount;
+
+        if (frames == null)
+            return;
+
+        var stackKey = string.Join("\n", frames);
+        _stackAmounts[stackKey] = _stackAmounts.GetValueOrDefault(stackKey) + amount;
+        _stackFrames.TryAdd(stackKey, frames);
+    }
+
+    public void AddCollection(GCStartTraceData gcStartEvent)
+    {
+        switch (gcStartEvent.Depth)
+        {
+            case 0:
+                _stats.Gen0Collections++;
+                break;
+            case 1:
+                _stats.Gen1Collections++;
+                break;
+            default:
+                _stats.Gen2Collections++;
+                break;
+        }
+
+        // Induced, InducedNotForced, InducedCompacting, InducedLowMemory etc.
+        if (gcStartEvent.Reason.ToString().StartsWith("Induced"))
+            _stats.InducedCollections++;
+    }
 
-    var result = new MemoryStats();
+    // Pause lasts from the start of execution engine suspension until the end of its restart.
+    // Suspensions for debugger, shutdown etc. aren't GC pauses.
+    public void StartPause(GCSuspendEETraceData suspendEvent)
+    {
+        if (suspendEvent.Reason is GCSuspendEEReason.SuspendForGC or GCSuspendEEReason.SuspendForGCPrep)
+            _pauseStart ??= suspendEvent.TimeStampRelativeMSec;
+    }
 
-    foreach (var @event in stackSource.TraceLog.Events)
+    public void EndPause(TraceEvent restartEvent)
     {
-        if (@event is GCAllocationTickTraceData gcTickEvent)
-            result.AllocationAmount += gcTickEvent.AllocationAmount64;
+        if (_pauseStart is not { } pauseStart)
+            return;
+
+        var pause = restartEvent.TimeStampRelativeMSec - pauseStart;
+        _stats.TotalPauseMSec += pause;
+        _stats.MaxPauseMSec = Math.Max(_stats.MaxPauseMSec, pause);
+        _pauseStart = null;
     }
 
-    return result;
+    public void AddHeapStats(GCHeapStatsTraceData heapStatsEvent)
+    {
+        // Generation 3 is the large object heap, generation 4 is the pinned object heap
+        var heapSize = heapStatsEvent.GenerationSize0 + heapStatsEvent.GenerationSize1 + heapStatsEvent.GenerationSize2 +
+                       heapStatsEvent.GenerationSize3 + heapStatsEvent.GenerationSize4;
+        _stats.PeakHeapSize = Math.Max(_stats.PeakHeapSize, heapSize);
+    }
+
+    public MemoryStats Build(int top)
+    {
+        _stats.TopTypes = _typeAmounts
+            .OrderByDescending(pair => pair.Value)
+            .Take(top)
+            .Select(pair => new TypeAllocation(pair.Key, pair.Value))
+            .ToList();
+        _stats.TopStacks = _stackAmounts
+            .OrderByDescending(pair => pair.Value)
+            .Take(top)
+            .Select(pair => new StackAllocation(_stackFrames[pair.Key], pair.Value))
+            .ToList();
+        return _stats;
+    }
+}
+
+internal record struct TypeAllocation(string TypeName, long Amount);
+
+internal record struct StackAllocation(List<string> Frames, long Amount);
+
+internal record struct TypeAllocationDelta(string TypeName, long OldAmount, long NewAmount)
+{
+    public long Delta => NewAmount - OldAmount;
+}
+
+internal record struct StackAllocationDelta(List<string> Frames, long OldAmount, long NewAmount)
+{
+    public long Delta => NewAmount - OldAmount;
 }
 
-internal record struct MemoryStats(long AllocationAmount);
\ No newline at end of file
+internal record struct MethodSamples(string Method, long Samples);
+
+internal record CpuProfile
+{
+    public string? Snapshot { get; set; }
+    public string? Error { get; set; }
+    public long TotalSamples { get; set; }
+    public List<MethodSamples> TopInclusive { get; set; } = new();
+    public List<MethodSamples> TopExclusive { get; set; } = new();
+}
+
+internal record AllocationDiff
+{
+    public string Old { get; set; } = "";
+    public string New { get; set; } = "";
+    public long OldAmount { get; set; }
+    public long NewAmount { get; set; }
+    public List<TypeAllocationDelta> TypeDeltas { get; set; } = new();
+    public List<StackAllocationDelta> StackDeltas { get; set; } = new();
+}
+
+internal record MemoryStats
+{
+    public string? Snapshot { get; set; }
+    public string? Error { get; set; }
+    public long AllocationAmount { get; set; }
+    public long SmallObjectHeapAmount { get; set; }
+    public long LargeObjectHeapAmount { get; set; }
+    public long PinnedObjectHeapAmount { get; set; }
+    public int Gen0Collections { get; set; }
+    public int Gen1Collections { get; set; }
+    public int Gen2Collections { get; set; }
+    public int InducedCollections { get; set; }
+    public double TotalPauseMSec { get; set; }
+    public double MaxPauseMSec { get; set; }
+    public long PeakHeapSize { get; set; }
+    public List<TypeAllocation> TopTypes { get; set; } = new();
+    public List<StackAllocation> TopStacks { get; set; } = new();
+    public Dictionary<string, long> FileAmounts { get; set; } = new();
+}
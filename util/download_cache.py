@@ -0,0 +1,158 @@
+import hashlib
+import os
+import zlib
+from os import path
+from typing import Optional
+from zipfile import ZipFile
+
+import requests
+
+from util.locks import file_lock
+
+
+EXTRACTION_STAMP = ".rscpp-extracted"
+
+
+class DownloadCache:
+    """
+    Content-addressed storage of downloaded archives, can be shared between project dirs and machines.
+
+    Layout:
+        objects/<sha256>     downloaded files
+        urls/<url hash>      sha256 of the file last downloaded from the url
+        partial/<url hash>   unfinished downloads, resumed with HTTP Range requests
+    """
+
+    def __init__(self, cache_dir: str, chunk_size: int = 1 << 20, retries: int = 3):
+        self._cache_dir = cache_dir
+        self._chunk_size = chunk_size
+        self._retries = retries
+
+    def fetch(self, url: str, sha256: Optional[str] = None) -> str:
+        if sha256:
+            object_path = self._object_path(sha256)
+            if path.exists(object_path):
+                return object_path
+
+        url_key = hashlib.sha256(url.encode('utf8')).hexdigest()
+        index_path = path.join(self._cache_dir, "urls", url_key)
+        partial_path = path.join(self._cache_dir, "partial", url_key)
+        for directory in ("objects", "urls", "partial"):
+            os.makedirs(path.join(self._cache_dir, directory), exist_ok=True)
+
+        with file_lock(partial_path + ".lock"):
+            # The file could have been downloaded by somebody else while waiting for the lock
+            cached_digest = sha256
+            if not cached_digest and path.exists(index_path):
+                with open(index_path) as f:
+                    cached_digest = f.read().strip()
+            if cached_digest and path.exists(self._object_path(cached_digest)):
+                return self._object_path(cached_digest)
+
+            self._download(url, partial_path)
+
+            digest = file_sha256(partial_path)
+            if sha256 and digest != sha256.lower():
+                os.remove(partial_path)
+                raise ValueError(f"checksum mismatch for {url}: expected {sha256}, actual {digest}")
+
+            object_path = self._object_path(digest)
+            os.replace(partial_path, object_path)
+            with open(index_path, 'w') as f:
+                f.write(digest)
+
+        return object_path
+
+    def _object_path(self, digest: str) -> str:
+        return path.join(self._cache_dir, "objects", digest.lower())
+
+    def _download(self, url: str, partial_path: str):
+        for attempt in range(self._retries):
+            try:
+                self._download_once(url, partial_path)
+                return
+            except requests.exceptions.RequestException as e:
+                if attempt + 1 == self._retries:
+                    raise
+                print(f"[download] {url} interrupted ({e}), resuming..", flush=True)
+
+    def _download_once(self, url: str, partial_path: str):
+        offset = path.getsize(partial_path) if path.exists(partial_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        with requests.get(url, headers=headers, stream=True, timeout=60) as response:
+            if offset and response.status_code == 416:
+                # Requested range starts at the end of file, but the previous download is complete only if the file
+                # on the server has the same size, otherwise the file has changed and is downloaded from scratch
+                if get_content_range_total(response) == offset:
+                    return
+                print(f"[download] {url} doesn't match partial download of {offset} bytes, restarting..", flush=True)
+                os.remove(partial_path)
+            else:
+                response.raise_for_status()
+                resumed = offset and response.status_code == 206
+                print(f"[download] {'Resuming' if resumed else 'Downloading'} {url}" + (f" from {offset} bytes" if resumed else ""), flush=True)
+
+                with open(partial_path, 'ab' if resumed else 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=self._chunk_size):
+                        f.write(chunk)
+                return
+
+        self._download_once(url, partial_path)
+
+
+def get_content_range_total(response: requests.Response) -> Optional[int]:
+    """
+    Returns complete length of the file from `Content-Range: bytes */<length>` of a 416 response, if known
+    """
+    total = response.headers.get('Content-Range', '').rpartition('/')[2]
+    return int(total) if total.isdigit() else None
+
+
+def file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_crc32(file_path: str) -> int:
+    crc = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def extract_zip_incrementally(archive_path: str, target_dir: str) -> int:
+    """
+    Extracts only files which are missing in `target_dir` or differ from the archive.
+    `archive_path` is expected to be taken from DownloadCache, i.e. named by its digest.
+    Returns count of extracted files.
+    """
+    archive_digest = path.basename(archive_path)
+    stamp_path = path.join(target_dir, EXTRACTION_STAMP)
+    if path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if f.read().strip() == archive_digest:
+                return 0
+
+    os.makedirs(target_dir, exist_ok=True)
+    extracted_count = 0
+    with ZipFile(archive_path) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+
+            target_path = path.join(target_dir, *member.filename.split('/'))
+            if path.isfile(target_path) and path.getsize(target_path) == member.file_size and file_crc32(target_path) == member.CRC:
+                continue
+
+            archive.extract(member, path=target_dir)
+            extracted_count += 1
+
+    with open(stamp_path, 'w') as f:
+        f.write(archive_digest)
+
+    return extracted_count
@@ -1,6 +1,7 @@
 import re
-from dataclasses import dataclass
-from typing import List
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 
 @dataclass
@@ -10,6 +11,14 @@ class AnalyzerError:
     file_path: str
 
 
+@dataclass
+class ErrorGroup:
+    message: str
+    file_path: str
+    count: int = 0
+    analyzers: List[str] = field(default_factory=list)
+
+
 LEFT_MARK = '“'.encode('utf8').decode('cp1251')
 RIGHT_MARK = '”'.encode('utf8').decode('cp1251')
 RUNTIME_ERROR_REGEX = re.compile(fr"""Analyzer '(.*)' threw the following exception: (.*)\.
@@ -19,15 +28,52 @@ Message = .*
 ExceptionPath = .*
 ClassName = .*
 Data.File = (.*)""", flags=re.MULTILINE)
+RUNTIME_ERROR_MARK = "' threw the following exception: "
+# Count of lines matched by RUNTIME_ERROR_REGEX
+RUNTIME_ERROR_LINES = 7
+
+
+def iter_log_errors(lines: Iterable[str]) -> Iterator[AnalyzerError]:
+    """
+    Incrementally matches RUNTIME_ERROR_REGEX against a sliding window of lines, so that logs aren't read into memory at once
+    """
+    window = deque(maxlen=RUNTIME_ERROR_LINES)
+    for line in lines:
+        window.append(line)
+        if len(window) < RUNTIME_ERROR_LINES or RUNTIME_ERROR_MARK not in window[0]:
+            continue
+
+        m = RUNTIME_ERROR_REGEX.search("".join(window))
+        if m and m.start() < len(window[0]):
+            analyzer, message, file_path = m.groups()
+            yield AnalyzerError(analyzer, strip_quotes(message), strip_quotes(file_path))
+            window.clear()
+
+
+def parse_log_file(log_path: str) -> Iterator[AnalyzerError]:
+    with open(log_path, encoding='cp1251') as f:
+        yield from iter_log_errors(f)
 
 
 def parse_logs(logs: str) -> List[AnalyzerError]:
-    errors: List[AnalyzerError] = []
-    for m in RUNTIME_ERROR_REGEX.finditer(logs):
-        analyzer, message, file_path = m.groups()
-        errors.append(AnalyzerError(analyzer, strip_quotes(message), strip_quotes(file_path)))
+    return list(iter_log_errors(logs.splitlines(keepends=True)))
+
+
+def group_errors(errors: Iterable[AnalyzerError]) -> List[ErrorGroup]:
+    """
+    Groups errors by message and file, the same exception is usually thrown by many analyzers of one file
+    """
+    groups: Dict[Tuple[str, str], ErrorGroup] = {}
+    for error in errors:
+        group = groups.get((error.message, error.file_path))
+        if group is None:
+            group = groups[(error.message, error.file_path)] = ErrorGroup(error.message, error.file_path)
+
+        group.count += 1
+        if error.analyzer not in group.analyzers:
+            group.analyzers.append(error.analyzer)
 
-    return errors
+    return list(groups.values())
 
 
 def strip_quotes(text: str) -> str:
@@ -0,0 +1,59 @@
+"""
+Memory traffic per inspected file, kept next to the report to localise traffic regressions of the next run.
+"""
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+FILE_TRAFFIC_FILE_NAME = "resharper-file-traffic.json"
+
+
+@dataclass
+class FileTrafficChange:
+    file: str
+    old: float
+    new: float
+
+    @property
+    def delta(self) -> float:
+        return self.new - self.old
+
+    @property
+    def relative_delta(self) -> float:
+        return self.delta / self.old * 100
+
+    def to_json(self) -> dict:
+        return {'file': self.file, 'old': round(self.old, 3), 'new': round(self.new, 3), 'delta': round(self.delta, 3),
+                'relative_delta': round(self.relative_delta, 2)}
+
+
+def get_file_traffic(memory_stats: dict) -> Dict[str, float]:
+    mb = 1 << 20
+    return {file: amount / mb for file, amount in memory_stats.get("FileAmounts", {}).items()}
+
+
+def load_file_traffic(file_traffic_path: str) -> Optional[Dict[str, float]]:
+    if not os.path.exists(file_traffic_path):
+        return None
+    with open(file_traffic_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_file_traffic(file_traffic_path: str, file_traffic: Dict[str, float]):
+    with open(file_traffic_path, 'w', encoding='utf-8') as f:
+        json.dump(file_traffic, f, indent=1, sort_keys=True)
+
+
+def largest_increases(old: Dict[str, float], new: Dict[str, float], top: int = 10,
+                      min_traffic: float = 1.0) -> Tuple[List[FileTrafficChange], List[FileTrafficChange]]:
+    """
+    Returns files with the largest absolute and relative increase of traffic. Only files inspected by both runs are compared,
+    and files with less than `min_traffic` MB in the old run are skipped for the relative increase, since it's mostly noise.
+    """
+    changes = [FileTrafficChange(file, old[file], new[file]) for file in new.keys() & old.keys()]
+    increased = [change for change in changes if change.delta > 0]
+    by_absolute = sorted(increased, key=lambda change: (-change.delta, change.file))[:top]
+    by_relative = sorted((change for change in increased if change.old >= min_traffic),
+                         key=lambda change: (-change.relative_delta, change.file))[:top]
+    return by_absolute, by_relative
@@ -0,0 +1,239 @@
+"""
+Compact digest of all issues of an inspectcode report, to compare runs without keeping huge XML reports.
+
+Digest is a gzipped header line followed by sorted unique JSON rows of (file, line, TypeId, severity, message).
+Strings aren't interned into tables: rows are sorted by file, so gzip already compresses repeated paths,
+and a table of messages would grow with the report in both writer and reader, while rows are streamed.
+
+Usage:
+    python -m util.issue_digest diff OLD_DIGEST NEW_DIGEST
+    python -m util.issue_digest diff --known-errors PROJECT[:BRANCH] NEW_DIGEST
+"""
+import argparse
+import gzip
+import heapq
+import json
+import sys
+import tempfile
+from collections import Counter
+from typing import Dict, IO, Iterable, Iterator, List, Optional, Tuple
+
+# File, line, TypeId, severity, message
+Issue = Tuple[str, int, str, str, str]
+
+DIGEST_VERSION = 2
+DIGEST_FILE_NAME = "resharper-issues.digest.gz"
+
+
+def _write_rows(f: IO[str], issues: Iterable[Issue]):
+    for issue in issues:
+        f.write(json.dumps(issue, separators=(',', ':')))
+        f.write("\n")
+
+
+def _read_rows(f: IO[str]) -> Iterator[Issue]:
+    for line in f:
+        yield tuple(json.loads(line))
+
+
+def _unique(sorted_issues: Iterable[Issue]) -> Iterator[Issue]:
+    previous = None
+    for issue in sorted_issues:
+        if issue != previous:
+            yield issue
+            previous = issue
+
+
+class DigestBuilder:
+    """
+    Collects issues in sorted chunks which are spilled to temporary files, so that memory usage
+    doesn't depend on the size of the report. Chunks are merged when the digest is written.
+    """
+
+    def __init__(self, chunk_size: int = 50_000):
+        self._chunk_size = chunk_size
+        self._chunk: List[Issue] = []
+        self._spilled: List[IO[str]] = []
+
+    def add(self, file: str, line: int, type_id: str, severity: str, message: str):
+        self._chunk.append((file, line, type_id, severity, message))
+        if len(self._chunk) >= self._chunk_size:
+            self._spill()
+
+    def add_issue(self, issue, severity: str):
+        """
+        Callback for `util.report_parser.parse_report`
+        """
+        # Issues are sorted, so missing attributes can't be None
+        self.add(issue.get("File", ""), int(issue.get("Line", "0")), issue.get("TypeId", ""), severity, issue.get("Message", ""))
+
+    def _spill(self):
+        f = tempfile.TemporaryFile('w+', encoding='utf-8')
+        _write_rows(f, _unique(sorted(self._chunk)))
+        f.seek(0)
+        self._spilled.append(f)
+        self._chunk = []
+
+    def iter_issues(self) -> Iterator[Issue]:
+        """
+        Sorted unique issues, can be iterated once
+        """
+        chunk = sorted(self._chunk)
+        self._chunk = []
+        return _unique(heapq.merge(chunk, *(_read_rows(f) for f in self._spilled)))
+
+    def write(self, digest_path: str, tool_version: Optional[str] = None):
+        try:
+            with gzip.open(digest_path, 'wt', encoding='utf-8') as f:
+                json.dump({"version": DIGEST_VERSION, "tool_version": tool_version}, f)
+                f.write("\n")
+                _write_rows(f, self.iter_issues())
+        finally:
+            for spilled in self._spilled:
+                spilled.close()
+            self._spilled = []
+
+
+def read_digest_version(digest_path: str) -> int:
+    with gzip.open(digest_path, 'rt', encoding='utf-8') as f:
+        try:
+            return json.loads(f.readline())["version"]
+        except (ValueError, KeyError, TypeError):
+            # Digests of version 1 are a single JSON object
+            return 1
+
+
+def iter_digest(digest_path: str) -> Iterator[Issue]:
+    """
+    Streams sorted unique issues of a digest
+    """
+    with gzip.open(digest_path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        if header["version"] != DIGEST_VERSION:
+            raise ValueError(f"unsupported digest version: {header['version']}")
+        yield from _read_rows(f)
+
+
+def iter_churn(old_issues: Iterable[Issue], new_issues: Iterable[Issue]) -> Iterator[Tuple[str, Issue]]:
+    """
+    Merge-joins two sorted sequences of unique issues, yields ("added" | "removed", issue)
+    """
+    old_iter, new_iter = iter(old_issues), iter(new_issues)
+    old, new = next(old_iter, None), next(new_iter, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            yield "removed", old
+            old = next(old_iter, None)
+        elif old is None or new < old:
+            yield "added", new
+            new = next(new_iter, None)
+        else:
+            old, new = next(old_iter, None), next(new_iter, None)
+
+
+def churn_summary(old_issues: Iterable[Issue], new_issues: Iterable[Issue]) -> Dict[str, Dict[str, int]]:
+    """
+    Returns count of added and removed issues per severity
+    """
+    return DigestDiff(old_issues, new_issues, max_issues=0).summary()
+
+
+def only_errors(issues: Iterable[Issue]) -> Iterator[Issue]:
+    """
+    Errors of sorted issues without TypeId, comparable with known errors, which have no TypeId
+    """
+    # Dropping TypeId changes order of issues only within a line, so lines are re-sorted one by one
+    line_errors: List[Issue] = []
+    for file, line, _, severity, message in issues:
+        if line_errors and line_errors[0][:2] != (file, line):
+            yield from _unique(sorted(line_errors))
+            line_errors = []
+        if severity == "ERROR":
+            line_errors.append((file, line, "", severity, message))
+    yield from _unique(sorted(line_errors))
+
+
+def known_errors_issues(known_errors: List[dict]) -> List[Issue]:
+    """
+    Sorted unique issues of `known errors` of a project config, see `only_errors`
+    """
+    return sorted({(error["file"], int(error["line"]), "", "ERROR", error["message"]) for error in known_errors})
+
+
+class DigestDiff:
+    """
+    Merge-join of two sorted streams of issues. Only first `max_issues` of added and removed issues are kept.
+    """
+
+    def __init__(self, old_issues: Iterable[Issue], new_issues: Iterable[Issue], max_issues: int = 50):
+        self.max_issues = max_issues
+        self.issues: Dict[str, List[Issue]] = {"added": [], "removed": []}
+        self.counts: Dict[str, Counter] = {"added": Counter(), "removed": Counter()}
+        for change, issue in iter_churn(old_issues, new_issues):
+            self.counts[change][issue[3]] += 1
+            if len(self.issues[change]) < max_issues:
+                self.issues[change].append(issue)
+
+    @property
+    def added_count(self) -> int:
+        return sum(self.counts["added"].values())
+
+    @property
+    def removed_count(self) -> int:
+        return sum(self.counts["removed"].values())
+
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns count of added and removed issues per severity
+        """
+        added, removed = self.counts["added"], self.counts["removed"]
+        return {severity: {"added": added[severity], "removed": removed[severity]} for severity in sorted(added.keys() | removed.keys())}
+
+    def print(self):
+        for title, change, count in (("Added", "added", self.added_count), ("Removed", "removed", self.removed_count)):
+            print(f"{title}: {count} issue(s)")
+            for file, line, type_id, severity, message in self.issues[change]:
+                print(f"  {severity:<10} {file}:{line} [{type_id}] {message}")
+            if count > self.max_issues:
+                print(f"  ...and {count - self.max_issues} more")
+
+        for severity, counts in self.summary().items():
+            print(f"{severity}: +{counts['added']} -{counts['removed']}")
+
+
+def load_known_errors(project_spec: str) -> List[Issue]:
+    import common
+
+    project_name, _, branch = project_spec.partition(':')
+    project = common.read_conf_if_needed(common.projects[project_name])
+    local_config = project["latest"][branch] if branch else project["stable"]
+    return known_errors_issues(local_config.get("known errors", []))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compares issue digests of inspectcode runs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    diff_parser = subparsers.add_parser("diff")
+    diff_parser.add_argument("--known-errors", dest="known_errors", metavar="PROJECT[:BRANCH]",
+                             help="Compare errors of the digest with \"known errors\" of the project config")
+    diff_parser.add_argument("--max-issues", dest="max_issues", type=int, default=50)
+    diff_parser.add_argument("digests", nargs='+')
+    args = parser.parse_args()
+
+    if args.known_errors:
+        if len(args.digests) != 1:
+            parser.error("exactly one digest is expected with --known-errors")
+        old = load_known_errors(args.known_errors)
+        new = only_errors(iter_digest(args.digests[0]))
+    else:
+        if len(args.digests) != 2:
+            parser.error("two digests are expected")
+        old, new = (iter_digest(digest_path) for digest_path in args.digests)
+
+    diff = DigestDiff(old, new, args.max_issues)
+    diff.print()
+    return 1 if diff.added_count or diff.removed_count else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+import os
+import time
+from contextlib import contextmanager
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _try_lock(fd) -> bool:
+        try:
+            # Locks the first byte, the file may be empty
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def _unlock(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _try_lock(fd) -> bool:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _unlock(fd):
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+@contextmanager
+def file_lock(lock_path, timeout: float = 3600):
+    """
+    Inter-process lock held by the OS, so it's released even if the owner is killed (e.g. by OOM killer).
+    The lock file itself is left in place: removing it would let a waiting process lock a file which is already unlinked.
+    """
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+    try:
+        start = time.time()
+        while not _try_lock(fd):
+            if time.time() - start > timeout:
+                raise TimeoutError(f"cannot acquire lock {lock_path}")
+            time.sleep(1)
+
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def is_file_locked(lock_path) -> bool:
+    """
+    Returns True if somebody holds `file_lock` on `lock_path`, including other threads of this process
+    """
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR)
+    try:
+        if not _try_lock(fd):
+            return True
+        _unlock(fd)
+        return False
+    finally:
+        os.close(fd)
@@ -0,0 +1,130 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# `03:17:27.309 |E| Category | Thread | Message`
+LOG_LINE_REGEX = re.compile(r"^(\d\d):(\d\d):(\d\d)\.(\d{3}) \|(\w)\| ([^|]*)\|([^|]*)\| (.*)$")
+SOURCE_FILE_REGEX = re.compile(r"[^\s\"'“”|]+\.(?:cpp|cxx|cc|c|ixx|cppm|h|hh|hpp|hxx|inl|ipp|tcc)\b", re.IGNORECASE)
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    end: float
+    count: int = 1
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    def extend(self, timestamp: float):
+        self.start = min(self.start, timestamp)
+        self.end = max(self.end, timestamp)
+        self.count += 1
+
+    def to_json(self, origin: float) -> dict:
+        return {'name': self.name, 'start': round(self.start - origin, 3), 'duration': round(self.duration, 3), 'count': self.count}
+
+
+class LogProfiler:
+    """
+    Mines timestamps of inspectcode log: time spans of every log category (project loading, indexing, etc.)
+    and of every mentioned source file.
+    """
+
+    def __init__(self):
+        self.phases: Dict[str, Span] = {}
+        self.files: Dict[str, Span] = {}
+        self.first_time: Optional[float] = None
+        self.last_time: Optional[float] = None
+        self._day_offset = 0.0
+
+    def _timestamp(self, hours: str, minutes: str, seconds: str, milliseconds: str) -> float:
+        timestamp = int(hours) * 3600 + int(minutes) * 60 + int(seconds) + int(milliseconds) / 1000 + self._day_offset
+        # Log contains only time of day, so a big step back means that the run has passed midnight
+        if self.last_time is not None and timestamp < self.last_time - SECONDS_PER_DAY / 2:
+            self._day_offset += SECONDS_PER_DAY
+            timestamp += SECONDS_PER_DAY
+        return timestamp
+
+    def feed_line(self, line: str):
+        m = LOG_LINE_REGEX.match(line)
+        if not m:
+            # Continuation of multiline message
+            return
+
+        hours, minutes, seconds, milliseconds, _, category, _, message = m.groups()
+        timestamp = self._timestamp(hours, minutes, seconds, milliseconds)
+        if self.first_time is None:
+            self.first_time = timestamp
+        self.last_time = max(timestamp, self.last_time or timestamp)
+
+        self._extend(self.phases, category.strip() or "<default>", timestamp)
+        for file_path in set(SOURCE_FILE_REGEX.findall(message)):
+            self._extend(self.files, file_path, timestamp)
+
+    @staticmethod
+    def _extend(spans: Dict[str, Span], name: str, timestamp: float):
+        span = spans.get(name)
+        if span is None:
+            spans[name] = Span(name, timestamp, timestamp)
+        else:
+            span.extend(timestamp)
+
+
+def inspection_spans(timeline: List[Tuple[float, str]], end_time: Optional[float] = None) -> List[Span]:
+    """
+    Approximates inspection time of every file by the time until the next `Inspecting` line of stdout
+    """
+    spans = []
+    for index, (timestamp, file_path) in enumerate(timeline):
+        next_timestamp = timeline[index + 1][0] if index + 1 < len(timeline) else end_time
+        if next_timestamp is not None:
+            spans.append(Span(file_path, timestamp, next_timestamp))
+    return spans
+
+
+def slowest(spans: Iterable[Span], top: int) -> List[Span]:
+    return sorted(spans, key=lambda span: span.duration, reverse=True)[:top]
+
+
+def build_profile(log_lines: Iterable[str], timeline: List[Tuple[float, str]], end_time: Optional[float] = None, top: int = 20) -> dict:
+    profiler = LogProfiler()
+    for line in log_lines:
+        profiler.feed_line(line)
+
+    profile = {}
+    if profiler.first_time is not None:
+        profile['log_time'] = round(profiler.last_time - profiler.first_time, 3)
+        profile['phases'] = [span.to_json(profiler.first_time) for span in slowest(profiler.phases.values(), top)]
+        profile['log_files'] = [span.to_json(profiler.first_time) for span in slowest(profiler.files.values(), top)]
+
+    if timeline:
+        origin = timeline[0][0]
+        profile['inspected_files'] = [span.to_json(origin) for span in slowest(inspection_spans(timeline, end_time), top)]
+
+    return profile
+
+
+def profile_log_file(log_path: str, timeline: List[Tuple[float, str]], end_time: Optional[float] = None, top: int = 20) -> dict:
+    if not os.path.exists(log_path):
+        return build_profile([], timeline, end_time, top)
+
+    with open(log_path, encoding='utf-8-sig', errors='replace') as f:
+        return build_profile(f, timeline, end_time, top)
+
+
+def format_profile(profile: dict) -> str:
+    lines = []
+    for key, title in (('phases', "Slowest phases"), ('inspected_files', "Slowest inspected files"), ('log_files', "Longest file activity in log")):
+        rows = profile.get(key)
+        if not rows:
+            continue
+
+        lines.append(f"{title}:")
+        for row in rows:
+            lines.append(f"  {row['duration']:>10.3f}s  (+{row['start']:.1f}s, {row['count']}x)  {row['name']}")
+    return "\n".join(lines)
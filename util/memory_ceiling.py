@@ -0,0 +1,91 @@
+import os
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+
+def rlimit_preexec(limit_bytes: int) -> Callable[[], None]:
+    """
+    Limits address space of the child process. Note that it limits reserved memory as well,
+    so .NET processes need `DOTNET_GCHeapHardLimit` below the limit to start at all.
+    """
+    def preexec():
+        import resource
+        resource.setrlimit(resource.RLIMIT_AS, (limit_bytes, limit_bytes))
+    return preexec
+
+
+def cgroup_preexec(cgroup_dir: str) -> Callable[[], None]:
+    def preexec():
+        # Writing "0" moves the writing process, i.e. the child before exec
+        with open(os.path.join(cgroup_dir, "cgroup.procs"), 'w') as f:
+            f.write("0")
+    return preexec
+
+
+class MemoryLimiter:
+    """
+    Runs processes under the given memory limit: with cgroup v2 `memory.max` if a delegated cgroup is given,
+    with `RLIMIT_AS` otherwise. Linux only.
+    """
+
+    def __init__(self, cgroup_root: Optional[str] = None):
+        self._cgroup_root = cgroup_root
+
+    @property
+    def method(self) -> str:
+        return "cgroup" if self._cgroup_root else "rlimit"
+
+    @contextmanager
+    def limit(self, limit_mb: int) -> Iterator[Tuple[Callable[[], None], dict]]:
+        """
+        Yields `preexec_fn` and environment variables for the limited process
+        """
+        limit_bytes = limit_mb << 20
+        if not self._cgroup_root:
+            yield rlimit_preexec(limit_bytes), {"DOTNET_GCHeapHardLimit": hex(limit_bytes * 3 // 4)}
+            return
+
+        cgroup_dir = os.path.join(self._cgroup_root, f"rscpp-{uuid.uuid4().hex[:8]}")
+        os.mkdir(cgroup_dir)
+        try:
+            with open(os.path.join(cgroup_dir, "memory.max"), 'w') as f:
+                f.write(str(limit_bytes))
+            if os.path.exists(os.path.join(cgroup_dir, "memory.swap.max")):
+                # Otherwise the process would be swapped out instead of being killed
+                with open(os.path.join(cgroup_dir, "memory.swap.max"), 'w') as f:
+                    f.write("0")
+            # .NET runtime respects the cgroup limit by itself
+            yield cgroup_preexec(cgroup_dir), {}
+        finally:
+            os.rmdir(cgroup_dir)
+
+
+def find_memory_ceiling(probe: Callable[[int], bool], min_mb: int, max_mb: int, precision_mb: int) -> Tuple[Optional[int], List[Tuple[int, bool]]]:
+    """
+    Binary searches the minimal limit (in MB) at which `probe` still succeeds, with `precision_mb` accuracy.
+    Returns None if it fails even at `max_mb`, and the list of probed limits with their outcomes.
+    """
+    probes: List[Tuple[int, bool]] = []
+
+    def run(limit_mb: int) -> bool:
+        succeeded = probe(limit_mb)
+        probes.append((limit_mb, succeeded))
+        return succeeded
+
+    if not run(max_mb):
+        return None, probes
+
+    low, high = min_mb, max_mb
+    if run(low):
+        return low, probes
+
+    # Invariant: probe fails at `low` and succeeds at `high`
+    while high - low > precision_mb:
+        middle = (low + high) // 2
+        if run(middle):
+            high = middle
+        else:
+            low = middle
+
+    return high, probes
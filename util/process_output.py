@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional, TextIO, Tuple
+
+
+INSPECTING_MARK = "Inspecting "
+
+
+class OutputCapture:
+    """
+    Consumes text stream of a child process line by line in a background thread.
+    Every line is written to `log_path` as it arrives, only the last `tail_lines` lines are kept in memory.
+    """
+
+    def __init__(self, stream: TextIO, log_path: str, tail_lines: int = 1000, on_line: Optional[Callable[[str], None]] = None):
+        self._stream = stream
+        self._log_path = log_path
+        self._tail = deque(maxlen=tail_lines)
+        self._on_line = on_line
+        self.line_count = 0
+        self._thread = threading.Thread(target=self._consume, daemon=True)
+        self._thread.start()
+
+    def _consume(self):
+        with open(self._log_path, 'w', encoding='utf8') as log:
+            for line in self._stream:
+                log.write(line)
+                self._tail.append(line)
+                self.line_count += 1
+                if self._on_line:
+                    self._on_line(line)
+
+    def join(self):
+        self._thread.join()
+
+    @property
+    def truncated(self) -> bool:
+        return self.line_count > len(self._tail)
+
+    @property
+    def tail(self) -> str:
+        return "".join(self._tail)
+
+
+class InspectionProgress:
+    """
+    Counts files reported by inspectcode as `Inspecting <file>` and estimates remaining time by the expected count.
+    """
+
+    def __init__(self, expected_count: Optional[int] = None, clock: Callable[[], float] = time.time):
+        self.expected_count = expected_count
+        self.inspected_count = 0
+        # Time when every file has been reported
+        self.timeline: List[Tuple[float, str]] = []
+        self._clock = clock
+        self._first_file_time: Optional[float] = None
+
+    def on_line(self, line: str):
+        count = line.count(INSPECTING_MARK)
+        if count:
+            if self._first_file_time is None:
+                # Loading of solution isn't included into inspection speed
+                self._first_file_time = self._clock()
+            self.inspected_count += count
+            self.timeline.append((self._clock(), line.split(INSPECTING_MARK, 1)[1].strip()))
+
+    def files_per_second(self) -> Optional[float]:
+        if self._first_file_time is None:
+            return None
+        elapsed = self._clock() - self._first_file_time
+        return self.inspected_count / elapsed if elapsed > 0 else None
+
+    def eta(self) -> Optional[float]:
+        speed = self.files_per_second()
+        if not speed or not self.expected_count:
+            return None
+        return max(self.expected_count - self.inspected_count, 0) / speed
+
+    def describe(self) -> str:
+        if self.expected_count:
+            progress = f"inspected {self.inspected_count}/{self.expected_count} files ({self.inspected_count / self.expected_count * 100:.1f}%)"
+        else:
+            progress = f"inspected {self.inspected_count} files"
+
+        speed = self.files_per_second()
+        if speed is not None:
+            progress += f", {speed:.2f} files/sec"
+
+        eta = self.eta()
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            progress += f", ETA {minutes:02}:{seconds:02}"
+
+        return progress
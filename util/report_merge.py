@@ -0,0 +1,155 @@
+import hashlib
+import os
+import re
+import tempfile
+import xml.etree.ElementTree as ET
+from collections import Counter
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional, TextIO, Tuple, Union
+from xml.sax.saxutils import quoteattr
+
+# Type of "solution folder" entries in .sln, they aren't real projects
+SOLUTION_FOLDER_TYPE = "{2150E333-8FDC-42A3-9474-1A3956D46DE8}"
+# Line breaks and tabs in attributes would be normalized to spaces by XML parsers otherwise
+ATTRIBUTE_ENTITIES = {"\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+SLN_PROJECT_REGEX = re.compile(r'^Project\("(\{[^}]+\})"\) = "([^"]+)", "[^"]*", "\{[^}]+\}"', re.MULTILINE)
+
+
+def parse_solution_projects(sln_path: str) -> List[str]:
+    with open(sln_path, encoding='utf-8-sig') as f:
+        content = f.read()
+    return [name for project_type, name in SLN_PROJECT_REGEX.findall(content) if project_type.upper() != SOLUTION_FOLDER_TYPE]
+
+
+def select_projects(projects: List[str], project_to_check: Optional[Union[str, List[str]]]) -> List[str]:
+    """
+    Expands "project to check" masks the same way as `--project` option of inspectcode does
+    """
+    if not project_to_check:
+        return list(projects)
+
+    masks = [project_to_check] if isinstance(project_to_check, str) else project_to_check
+    return [project for project in projects if any(fnmatchcase(project, mask) for mask in masks)]
+
+
+def split_into_shards(projects: List[str], shard_count: int) -> List[List[str]]:
+    """
+    Distributes projects round-robin in alphabetical order, so that similar projects (e.g. `clangSema*`) end up in different shards
+    """
+    shards = [sorted(projects)[i::shard_count] for i in range(shard_count)]
+    return [shard for shard in shards if shard]
+
+
+def _start_tag(tag: str, attrib: Dict[str, str]) -> str:
+    return f"<{tag}" + "".join(f" {name}={quoteattr(value, ATTRIBUTE_ENTITIES)}" for name, value in attrib.items()) + ">"
+
+
+def _scan_report(report_file: str, issue_types: Dict[str, ET.Element], project_attribs: Dict[str, Dict[str, str]],
+                 project_reports: Counter) -> Tuple[Dict[str, str], Optional[ET.Element]]:
+    """
+    Collects everything but issues: attributes of the report and of its projects, issue types and <Information>
+    """
+    report_attrib = None
+    information = None
+    issues_node = None
+    projects = set()
+    for event, element in ET.iterparse(report_file, events=("start", "end")):
+        if event == "start":
+            if report_attrib is None:
+                report_attrib = dict(element.attrib)
+            elif element.tag == "Issues" and issues_node is None:
+                issues_node = element
+            continue
+
+        if element.tag == "Information":
+            information = element
+        elif element.tag == "IssueType":
+            issue_types.setdefault(element.get("Id"), element)
+        elif element.tag == "Issue":
+            element.clear()
+        elif element.tag == "Project" and issues_node is not None:
+            project_attribs.setdefault(element.get("Name"), dict(element.attrib))
+            projects.add(element.get("Name"))
+            issues_node.clear()
+
+    project_reports.update(projects)
+    return report_attrib, information
+
+
+def merge_reports(report_files: List[str], output_file: str):
+    """
+    Merges XML reports of inspectcode: issue types are united, issues are grouped by project.
+    Issues reported by several shards (e.g. in shared headers of projects from different shards) are kept once.
+
+    Reports are streamed, the first pass collects issue types and projects, the second one copies issues to the output.
+    Issues of projects met in a single report are written as they are read, issues of projects met in several reports
+    are gathered in temporary files and deduplicated one project at a time.
+    """
+    assert report_files, "nothing to merge"
+
+    issue_types: Dict[str, ET.Element] = {}
+    project_attribs: Dict[str, Dict[str, str]] = {}
+    project_reports = Counter()
+    report_attrib, information = None, None
+    for report_file in report_files:
+        attrib, report_information = _scan_report(report_file, issue_types, project_attribs, project_reports)
+        if report_attrib is None:
+            report_attrib, information = attrib, report_information
+
+    shared_projects = [name for name in project_attribs if project_reports[name] > 1]
+
+    with tempfile.TemporaryDirectory() as temp_dir, open(output_file, 'w', encoding='utf-8') as out:
+        out.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        out.write(_start_tag("Report", report_attrib))
+        if information is not None:
+            out.write(ET.tostring(information, encoding='unicode'))
+        out.write("<IssueTypes>")
+        for issue_type in issue_types.values():
+            out.write(ET.tostring(issue_type, encoding='unicode'))
+        out.write("</IssueTypes><Issues>")
+
+        shared_files: Dict[str, TextIO] = {name: open(os.path.join(temp_dir, f"{index}.xml"), 'w+', encoding='utf-8')
+                                           for index, name in enumerate(shared_projects)}
+        try:
+            for report_file in report_files:
+                issues_node = None
+                project_name = None
+                for event, element in ET.iterparse(report_file, events=("start", "end")):
+                    if event == "start":
+                        if element.tag == "Issues" and issues_node is None:
+                            issues_node = element
+                        elif element.tag == "Project" and issues_node is not None:
+                            project_name = element.get("Name")
+                            if project_name not in shared_files:
+                                out.write(_start_tag("Project", element.attrib))
+                        continue
+
+                    if element.tag == "Issue" and project_name is not None:
+                        if project_name in shared_files:
+                            # One issue per line, line breaks in attributes are escaped
+                            element.tail = None
+                            shared_files[project_name].write(ET.tostring(element, encoding='unicode') + "\n")
+                        else:
+                            out.write(ET.tostring(element, encoding='unicode'))
+                        element.clear()
+                    elif element.tag == "Project" and issues_node is not None:
+                        if project_name not in shared_files:
+                            out.write("</Project>")
+                        project_name = None
+                        issues_node.clear()
+
+            for name, shared_file in shared_files.items():
+                out.write(_start_tag("Project", project_attribs[name]))
+                shared_file.seek(0)
+                known_issues = set()
+                for line in shared_file:
+                    issue_hash = hashlib.blake2b(line.encode('utf-8'), digest_size=16).digest()
+                    if issue_hash not in known_issues:
+                        known_issues.add(issue_hash)
+                        out.write(line)
+                out.write("</Project>")
+        finally:
+            for shared_file in shared_files.values():
+                shared_file.close()
+
+        out.write("</Issues></Report>\n")
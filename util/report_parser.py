@@ -0,0 +1,68 @@
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+ErrorId = Tuple[str, int, str]
+
+
+@dataclass
+class ParsedReport:
+    tool_version: str
+    # Count of <Project> nodes with issues
+    projects_count: int = 0
+    errors: Set[ErrorId] = field(default_factory=set)
+    severity_counts: Counter = field(default_factory=Counter)
+    type_counts: Counter = field(default_factory=Counter)
+
+
+def get_error_id(issue: ET.Element) -> ErrorId:
+    return issue.get("File"), int(issue.get("Line", "0")), issue.get("Message")
+
+
+def parse_report(report_file: str, tally: bool = False, on_issue: Optional[Callable[[ET.Element, str], None]] = None) -> ParsedReport:
+    """
+    Streams XML report of inspectcode keeping only ERROR issues in memory.
+    `on_issue` is called with every issue and its severity before the issue is discarded.
+    """
+    report: Optional[ParsedReport] = None
+    issue_severities: Dict[str, str] = {}
+    # Issues of types which haven't been declared yet, normally <IssueTypes> precedes <Issues>
+    unresolved: List[Tuple[ET.Element, str]] = []
+    issues_node: Optional[ET.Element] = None
+
+    def process(issue: ET.Element, severity: str):
+        if severity == 'ERROR':
+            report.errors.add(get_error_id(issue))
+        if tally:
+            report.severity_counts[severity] += 1
+            report.type_counts[issue.get("TypeId")] += 1
+        if on_issue:
+            on_issue(issue, severity)
+
+    for event, element in ET.iterparse(report_file, events=("start", "end")):
+        if event == "start":
+            if report is None:
+                report = ParsedReport(tool_version=element.attrib['ToolsVersion'])
+            elif element.tag == "Issues" and issues_node is None:
+                issues_node = element
+            continue
+
+        if element.tag == "IssueType":
+            issue_severities[element.get("Id")] = element.get("Severity")
+        elif element.tag == "Issue":
+            severity = element.get("Severity") or issue_severities.get(element.get("TypeId"))
+            if severity:
+                process(element, severity)
+                element.clear()
+            else:
+                unresolved.append((element, element.get("TypeId")))
+        elif element.tag == "Project" and issues_node is not None:
+            report.projects_count += 1
+            # Processed projects aren't needed anymore
+            issues_node.clear()
+
+    for issue, type_id in unresolved:
+        process(issue, issue_severities[type_id])
+
+    return report
@@ -0,0 +1,184 @@
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+@dataclass
+class ProcessSample:
+    timestamp: float
+    rss_bytes: int
+    peak_rss_bytes: int
+    user_time: float
+    system_time: float
+    read_bytes: int
+    write_bytes: int
+    threads: int
+
+
+def read_proc_sample(pid: int, proc_dir: str = "/proc") -> ProcessSample:
+    timestamp = time.time()
+
+    status = {}
+    with open(f"{proc_dir}/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value.strip()
+
+    with open(f"{proc_dir}/{pid}/stat") as f:
+        # Process name may contain spaces and parentheses, so fields are counted from the last ')'
+        fields = f.read().rsplit(")", 1)[1].split()
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+
+    io = {}
+    try:
+        with open(f"{proc_dir}/{pid}/io") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                io[key] = int(value)
+    except PermissionError:
+        pass
+
+    def kilobytes(key: str) -> int:
+        value = status.get(key)
+        return int(value.split()[0]) * 1024 if value else 0
+
+    rss_bytes = kilobytes("VmRSS")
+    return ProcessSample(timestamp=timestamp,
+                         rss_bytes=rss_bytes,
+                         peak_rss_bytes=max(kilobytes("VmHWM"), rss_bytes),
+                         user_time=int(fields[11]) / clock_ticks,
+                         system_time=int(fields[12]) / clock_ticks,
+                         read_bytes=io.get("read_bytes", 0),
+                         write_bytes=io.get("write_bytes", 0),
+                         threads=int(status.get("Threads", 0)))
+
+
+def read_psutil_sample(pid: int) -> ProcessSample:
+    process = psutil.Process(pid)
+    with process.oneshot():
+        memory = process.memory_info()
+        cpu = process.cpu_times()
+        try:
+            io = process.io_counters()
+        except (AttributeError, psutil.AccessDenied):
+            io = None
+
+        return ProcessSample(timestamp=time.time(),
+                             rss_bytes=memory.rss,
+                             # Peak working set is known on Windows only
+                             peak_rss_bytes=max(getattr(memory, "peak_wset", 0), memory.rss),
+                             user_time=cpu.user,
+                             system_time=cpu.system,
+                             read_bytes=io.read_bytes if io else 0,
+                             write_bytes=io.write_bytes if io else 0,
+                             threads=process.num_threads())
+
+
+def is_sampling_supported() -> bool:
+    return sys.platform.startswith("linux") or psutil is not None
+
+
+def read_process_sample(pid: int) -> Optional[ProcessSample]:
+    """
+    Returns None if the process has exited or can't be inspected
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            return read_proc_sample(pid)
+        if psutil is not None:
+            return read_psutil_sample(pid)
+    except (OSError, ValueError, IndexError):
+        return None
+    except Exception as e:
+        if psutil is not None and isinstance(e, psutil.Error):
+            return None
+        raise
+    return None
+
+
+class ResourceSampler:
+    """
+    Periodically samples memory, CPU, I/O and threads of the attached processes in a background thread.
+    """
+
+    def __init__(self, interval: float):
+        self._interval = interval
+        self._pids: Dict[str, int] = {}
+        self._samples: Dict[str, List[ProcessSample]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, name: str, pid: int):
+        with self._lock:
+            self._pids[name] = pid
+            self._samples.setdefault(name, [])
+        self._sample(name, pid)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, dict]:
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        return self.summary()
+
+    def _run(self):
+        while not self._stopped.wait(self._interval):
+            with self._lock:
+                pids = list(self._pids.items())
+            for name, pid in pids:
+                self._sample(name, pid)
+
+    def _sample(self, name: str, pid: int):
+        sample = read_process_sample(pid)
+        if sample is None:
+            return
+        with self._lock:
+            self._samples[name].append(sample)
+
+    def summary(self) -> Dict[str, dict]:
+        with self._lock:
+            samples = {name: list(process_samples) for name, process_samples in self._samples.items()}
+
+        result = {}
+        for name, process_samples in samples.items():
+            if not process_samples:
+                continue
+
+            first, last = process_samples[0], process_samples[-1]
+            wall_time = last.timestamp - first.timestamp
+            cpu_time = (last.user_time + last.system_time) - (first.user_time + first.system_time)
+            result[name] = {
+                'samples': len(process_samples),
+                'peak_rss_mb': max(s.peak_rss_bytes for s in process_samples) / (1 << 20),
+                'cpu_user_time': last.user_time,
+                'cpu_system_time': last.system_time,
+                'average_cpu_utilization': cpu_time / wall_time if wall_time > 0 else None,
+                'read_mb': last.read_bytes / (1 << 20),
+                'write_mb': last.write_bytes / (1 << 20),
+                'max_threads': max(s.threads for s in process_samples),
+            }
+        return result
+
+    def write_timeline(self, timeline_path: str):
+        """
+        Writes all samples as JSON lines, ordered by time
+        """
+        with self._lock:
+            rows = [dict(process=name, **asdict(sample)) for name, process_samples in self._samples.items() for sample in process_samples]
+
+        with open(timeline_path, 'w') as f:
+            for row in sorted(rows, key=lambda r: r['timestamp']):
+                f.write(json.dumps(row) + "\n")
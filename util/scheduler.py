@@ -0,0 +1,107 @@
+import ctypes
+import os
+import sys
+from concurrent.futures import Executor, Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Resources:
+    cpu: float
+    memory: float  # in GB
+
+    def fits(self, other: 'Resources') -> bool:
+        return self.cpu <= other.cpu and self.memory <= other.memory
+
+    def clamp(self, limit: 'Resources') -> 'Resources':
+        return Resources(min(self.cpu, limit.cpu), min(self.memory, limit.memory))
+
+    def __add__(self, other: 'Resources') -> 'Resources':
+        return Resources(self.cpu + other.cpu, self.memory + other.memory)
+
+    def __sub__(self, other: 'Resources') -> 'Resources':
+        return Resources(self.cpu - other.cpu, self.memory - other.memory)
+
+
+@dataclass
+class ScheduledTask:
+    key: str
+    args: tuple
+    resources: Resources
+    # Tasks with the same lock (e.g. sharing a project directory) never run concurrently
+    lock: Optional[str] = None
+    index: int = field(default=0, compare=False)
+
+
+class ResourceScheduler:
+    """
+    Runs tasks on an executor, starting a task only when its resources fit into the remaining capacity.
+    Tasks are started in the given order, but smaller tasks may overtake a task waiting for resources.
+    """
+
+    def __init__(self, capacity: Resources, max_jobs: int):
+        assert max_jobs > 0, max_jobs
+        self._capacity = capacity
+        self._max_jobs = max_jobs
+
+    def run(self, executor: Executor, fn: Callable, tasks: Iterable[ScheduledTask]) -> Iterator[Tuple[ScheduledTask, Future]]:
+        pending: List[ScheduledTask] = list(tasks)
+        for index, task in enumerate(pending):
+            task.index = index
+            # A task requiring more than the whole machine runs alone
+            task.resources = task.resources.clamp(self._capacity)
+
+        running: Dict[Future, ScheduledTask] = {}
+        used = Resources(0, 0)
+        locks = set()
+
+        while pending or running:
+            for task in list(pending):
+                if len(running) >= self._max_jobs:
+                    break
+                if task.lock is not None and task.lock in locks:
+                    continue
+                if not (used + task.resources).fits(self._capacity):
+                    continue
+
+                pending.remove(task)
+                used += task.resources
+                if task.lock is not None:
+                    locks.add(task.lock)
+                running[executor.submit(fn, *task.args)] = task
+
+            assert running, "scheduler got stuck: no task can be started"
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                task = running.pop(future)
+                used -= task.resources
+                locks.discard(task.lock)
+                yield task, future
+
+
+def total_physical_memory_gb() -> Optional[float]:
+    if sys.platform == 'win32':
+        class MemoryStatusEx(ctypes.Structure):
+            _fields_ = [
+                ("dwLength", ctypes.c_ulong),
+                ("dwMemoryLoad", ctypes.c_ulong),
+                ("ullTotalPhys", ctypes.c_ulonglong),
+                ("ullAvailPhys", ctypes.c_ulonglong),
+                ("ullTotalPageFile", ctypes.c_ulonglong),
+                ("ullAvailPageFile", ctypes.c_ulonglong),
+                ("ullTotalVirtual", ctypes.c_ulonglong),
+                ("ullAvailVirtual", ctypes.c_ulonglong),
+                ("sullAvailExtendedVirtual", ctypes.c_ulonglong),
+            ]
+
+        status = MemoryStatusEx()
+        status.dwLength = ctypes.sizeof(MemoryStatusEx)
+        if not ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return None
+        return status.ullTotalPhys / (1 << 30)
+
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / (1 << 30)
+    except (ValueError, OSError, AttributeError):
+        return None
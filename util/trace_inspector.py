@@ -0,0 +1,282 @@
+"""
+Runs trace-inspector from a prebuilt copy: it is built once per revision of its sources
+and inspects any number of memory snapshots in one process.
+
+Usage:
+    python -m util.trace_inspector diff [--top N] [--folded OUTPUT] [OLD_SNAPSHOT] NEW_SNAPSHOT
+    python -m util.trace_inspector cpu-diff [--kind inclusive|exclusive] OLD_REPORT NEW_REPORT
+
+Snapshots are paths or names of run directories in the snapshots home, e.g. `LLVM-2022-x64`.
+The last snapshot of a run within all baselines is kept in `known-good` of the snapshots home,
+it's compared with the new snapshot if the old one isn't specified.
+Reports are the ones written by `CorrectnessTest.py --report-path` with `--cpu-profile`.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from util.locks import file_lock
+
+SOURCE_EXTENSIONS = ('.cs', '.csproj')
+ASSEMBLY_NAME = "TraceInspector.dll"
+SNAPSHOT_FILE_NAME = "snapshot.dtt"
+GOOD_SNAPSHOTS_DIR_NAME = "known-good"
+CLI_TEST_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_source_hash(source_dir: str) -> str:
+    sha = hashlib.sha256()
+    for file_name in sorted(os.listdir(source_dir)):
+        if not file_name.endswith(SOURCE_EXTENSIONS):
+            continue
+        sha.update(file_name.encode('utf-8') + b'\0')
+        with open(os.path.join(source_dir, file_name), 'rb') as f:
+            sha.update(f.read())
+        sha.update(b'\0')
+    return sha.hexdigest()[:16]
+
+
+def get_build_dir(source_dir: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, get_source_hash(source_dir))
+
+
+def build(source_dir: str, cache_dir: str) -> str:
+    """
+    Returns path to the inspector assembly, builds it if the sources have changed
+    """
+    build_dir = get_build_dir(source_dir, cache_dir)
+    assembly_path = os.path.join(build_dir, ASSEMBLY_NAME)
+    if os.path.exists(assembly_path):
+        return assembly_path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with file_lock(build_dir + ".lock"):
+        if not os.path.exists(assembly_path):
+            # Build into a temporary directory, so that an interrupted build isn't taken for a finished one
+            temp_dir = build_dir + ".tmp"
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            print(f"[trace_inspector] Building {source_dir} into {build_dir}", flush=True)
+            subprocess.check_call(["dotnet", "build", "-c", "Release", "-o", temp_dir], cwd=source_dir)
+            os.replace(temp_dir, build_dir)
+
+    return assembly_path
+
+
+def get_inspect_command(assembly_path: str, snapshots: List[str], top: int = 20, stacks: bool = False,
+                        timelines: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    `timelines` maps snapshots to timelines of inspected files, which are used to attribute allocations to files
+    """
+    command = ["dotnet", assembly_path, "--top", str(top)]
+    if stacks:
+        command.append("--stacks")
+    for snapshot in snapshots:
+        if timelines and snapshot in timelines:
+            command += ["--timeline", timelines[snapshot]]
+        command.append(snapshot)
+    return command
+
+
+def get_cpu_command(assembly_path: str, traces: List[str], top: int = 20) -> List[str]:
+    return ["dotnet", assembly_path, "cpu", "--top", str(top)] + traces
+
+
+def parse_output(output: str) -> Dict[str, dict]:
+    """
+    Inspector prints one JSON line per snapshot
+    """
+    stats = {}
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        snapshot_stats = json.loads(line)
+        if snapshot_stats.get("Error"):
+            raise RuntimeError(f"cannot inspect {snapshot_stats['Snapshot']}: {snapshot_stats['Error']}")
+        stats[snapshot_stats["Snapshot"]] = snapshot_stats
+    return stats
+
+
+def inspect_snapshots(source_dir: str, cache_dir: str, snapshots: List[str], top: int = 20, stacks: bool = False,
+                      timelines: Optional[Dict[str, str]] = None) -> Dict[str, dict]:
+    return run_batch(get_inspect_command(build(source_dir, cache_dir), snapshots, top, stacks, timelines), snapshots)
+
+
+def profile_cpu(source_dir: str, cache_dir: str, traces: List[str], top: int = 20) -> Dict[str, dict]:
+    return run_batch(get_cpu_command(build(source_dir, cache_dir), traces, top), traces)
+
+
+def run_batch(command: List[str], snapshots: List[str]) -> Dict[str, dict]:
+    print("[trace_inspector] Running trace inspector:", subprocess.list2cmdline(command), flush=True)
+    # Return code is checked by `parse_output`, which knows the failed snapshot
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True)
+    stats = parse_output(result.stdout)
+    missing = [snapshot for snapshot in snapshots if snapshot not in stats]
+    if missing:
+        raise RuntimeError(f"trace inspector exited with code {result.returncode} without stats of {', '.join(missing)}")
+    return stats
+
+
+def get_cpu_profile(cpu_stats: dict) -> dict:
+    """
+    Converts output of `cpu` mode of the inspector to the `cpu_profile` of the report. Percents of samples
+    are comparable between runs of different length.
+    """
+    total = cpu_stats["TotalSamples"]
+
+    def methods(key: str) -> List[dict]:
+        return [{'method': m["Method"], 'samples': m["Samples"], 'percent': round(m["Samples"] / total * 100, 2) if total else 0.0}
+                for m in cpu_stats[key]]
+
+    return {'samples': total, 'inclusive': methods("TopInclusive"), 'exclusive': methods("TopExclusive")}
+
+
+def format_cpu_profile(cpu_profile: dict, count: int = 10) -> str:
+    lines = [f"CPU samples: {cpu_profile['samples']}"]
+    for kind in ('exclusive', 'inclusive'):
+        lines.append(f"Top {kind}:")
+        lines += [f"  {m['percent']:6.2f}%  {m['samples']:>8}  {m['method']}" for m in cpu_profile[kind][:count]]
+    return "\n".join(lines)
+
+
+def diff_cpu_profiles(old: dict, new: dict, kind: str = 'exclusive') -> List[dict]:
+    """
+    Compares percents of samples of methods, sorted by absolute delta. Only top methods are kept in reports,
+    so a method missing from one of them has 0%.
+    """
+    old_percents = {m['method']: m['percent'] for m in old[kind]}
+    new_percents = {m['method']: m['percent'] for m in new[kind]}
+    deltas = [{'method': method, 'old': old_percents.get(method, 0.0), 'new': new_percents.get(method, 0.0)}
+              for method in old_percents.keys() | new_percents.keys()]
+    for delta in deltas:
+        delta['delta'] = round(delta['new'] - delta['old'], 2)
+    return sorted(deltas, key=lambda delta: (-abs(delta['delta']), delta['method']))
+
+
+def iter_cpu_profiles(full_report: dict) -> Iterator[Tuple[str, dict]]:
+    """
+    Yields `project/toolchain` and CPU profile of every toolchain report with one
+    """
+    for project_key, project_report in full_report.items():
+        for toolchain, toolchain_report in project_report.get('toolchains', {}).items():
+            if toolchain_report.get('cpu_profile'):
+                yield f"{project_key}/{toolchain}", toolchain_report['cpu_profile']
+
+
+def resolve_snapshot(snapshot: str, snapshots_home: str) -> str:
+    if os.path.isfile(snapshot):
+        return snapshot
+
+    for candidate in (os.path.join(snapshots_home, snapshot, SNAPSHOT_FILE_NAME), os.path.join(snapshots_home, snapshot)):
+        if os.path.isfile(candidate):
+            return candidate
+    raise FileNotFoundError(f"snapshot {snapshot} is found neither by path nor in {snapshots_home}")
+
+
+def get_good_snapshot_dir(snapshots_home: str, run_name: str) -> str:
+    return os.path.join(snapshots_home, GOOD_SNAPSHOTS_DIR_NAME, run_name)
+
+
+def keep_good_snapshot(snapshot_dir: str, snapshots_home: str) -> str:
+    """
+    Moves the snapshot directory of a run within baselines to the known good ones, replacing the previous one of the run
+    """
+    good_dir = get_good_snapshot_dir(snapshots_home, os.path.basename(os.path.normpath(snapshot_dir)))
+    shutil.rmtree(good_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(good_dir), exist_ok=True)
+    os.replace(snapshot_dir, good_dir)
+    return good_dir
+
+
+def get_good_snapshot(snapshot_path: str, snapshots_home: str) -> str:
+    """
+    Returns the known good snapshot of the run which `snapshot_path` belongs to
+    """
+    run_name = os.path.basename(os.path.dirname(os.path.abspath(snapshot_path)))
+    return resolve_snapshot(os.path.join(GOOD_SNAPSHOTS_DIR_NAME, run_name), snapshots_home)
+
+
+def get_diff_command(assembly_path: str, old_snapshot: str, new_snapshot: str, top: int = 20, folded_path: Optional[str] = None) -> List[str]:
+    command = ["dotnet", assembly_path, "diff", "--top", str(top)]
+    if folded_path:
+        command += ["--folded", folded_path]
+    return command + [old_snapshot, new_snapshot]
+
+
+def diff_snapshots(source_dir: str, cache_dir: str, old_snapshot: str, new_snapshot: str, top: int = 20, folded_path: Optional[str] = None) -> dict:
+    command = get_diff_command(build(source_dir, cache_dir), old_snapshot, new_snapshot, top, folded_path)
+    print("[trace_inspector] Running trace inspector:", subprocess.list2cmdline(command), flush=True)
+    return json.loads(subprocess.check_output(command, text=True))
+
+
+def format_diff(diff: dict, max_frames: int = 8) -> str:
+    mb = 1 << 20
+    lines = [f"Traffic: {diff['OldAmount'] / mb:0.1f} MB -> {diff['NewAmount'] / mb:0.1f} MB ({(diff['NewAmount'] - diff['OldAmount']) / mb:+0.1f} MB)",
+             "Types:"]
+    for delta in diff["TypeDeltas"]:
+        lines.append(f"  {delta['Delta'] / mb:+10.1f} MB  ({delta['OldAmount'] / mb:0.1f} -> {delta['NewAmount'] / mb:0.1f} MB)  {delta['TypeName']}")
+
+    lines.append("Stacks:")
+    for delta in diff["StackDeltas"]:
+        lines.append(f"  {delta['Delta'] / mb:+10.1f} MB  ({delta['OldAmount'] / mb:0.1f} -> {delta['NewAmount'] / mb:0.1f} MB)")
+        lines += [f"      {frame}" for frame in delta["Frames"][:max_frames]]
+    return "\n".join(lines)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Inspects memory snapshots of inspectcode runs")
+    parser.add_argument("--source-dir", dest="source_dir", default=os.path.join(CLI_TEST_DIR, "trace-inspector"))
+    parser.add_argument("--cache-dir", dest="cache_dir", default=os.path.join(CLI_TEST_DIR, "trace-inspector-cache"))
+    parser.add_argument("--snapshots-home", dest="snapshots_home", default=os.path.join(CLI_TEST_DIR, "snapshots-home"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    diff_parser = subparsers.add_parser("diff", help="Compares allocations of two snapshots by type and by stack")
+    diff_parser.add_argument("--top", type=int, default=20)
+    diff_parser.add_argument("--folded", metavar="OUTPUT", help="Write folded stacks with old and new traffic for differential flame graphs")
+    diff_parser.add_argument("--json", action='store_true', help="Print raw JSON of the inspector")
+    diff_parser.add_argument("snapshots", nargs='+', metavar="[OLD] NEW", help="The old snapshot is the known good one of the run by default")
+    cpu_diff_parser = subparsers.add_parser("cpu-diff", help="Compares CPU profiles of two reports of CorrectnessTest.py")
+    cpu_diff_parser.add_argument("--kind", choices=['exclusive', 'inclusive'], default='exclusive')
+    cpu_diff_parser.add_argument("--top", type=int, default=20)
+    cpu_diff_parser.add_argument("old")
+    cpu_diff_parser.add_argument("new")
+    args = parser.parse_args()
+
+    if args.command == "cpu-diff":
+        return print_cpu_diff(args.old, args.new, args.kind, args.top)
+
+    if len(args.snapshots) > 2:
+        parser.error("at most two snapshots are expected")
+    new_snapshot = resolve_snapshot(args.snapshots[-1], args.snapshots_home)
+    if len(args.snapshots) == 2:
+        old_snapshot = resolve_snapshot(args.snapshots[0], args.snapshots_home)
+    else:
+        old_snapshot = get_good_snapshot(new_snapshot, args.snapshots_home)
+    diff = diff_snapshots(args.source_dir, args.cache_dir, old_snapshot, new_snapshot, args.top, args.folded)
+    print(json.dumps(diff, indent=2) if args.json else format_diff(diff))
+    return 0
+
+
+def print_cpu_diff(old_report_path: str, new_report_path: str, kind: str, top: int) -> int:
+    with open(old_report_path) as f:
+        old_profiles = dict(iter_cpu_profiles(json.load(f)))
+    with open(new_report_path) as f:
+        new_profiles = dict(iter_cpu_profiles(json.load(f)))
+
+    common_runs = sorted(old_profiles.keys() & new_profiles.keys())
+    if not common_runs:
+        print("No CPU profiles of the same runs in both reports")
+        return 1
+
+    for run in common_runs:
+        print(f"{run} ({kind}, % of samples):")
+        for delta in diff_cpu_profiles(old_profiles[run], new_profiles[run], kind)[:top]:
+            print(f"  {delta['delta']:+7.2f}%  ({delta['old']:.2f}% -> {delta['new']:.2f}%)  {delta['method']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())